@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from telegram.ext import Application
 from database.session import get_db
 from webhooks.telegram import TelegramWebhookManager
 from utils.logger import logger
 from typing import Optional
+from datetime import datetime
+import secrets
 from config import config
 
 # إنشاء راوتر لـ API
@@ -21,7 +23,7 @@ async def telegram_webhook(request: Request):
         webhook_manager: TelegramWebhookManager = request.app.state.webhook_manager
         return await webhook_manager.process_webhook(request)
     except Exception as e:
-        logger.error(f"خطأ في معالجة Webhook: {str(e)}", exc_info=True)
+        logger.error("خطأ في معالجة Webhook: %s", e, exc_info=True)
         raise HTTPException(500, "حدث خطأ داخلي في الخادم")
 
 @router.get("/health")
@@ -39,15 +41,19 @@ async def health_check(request: Request, db: AsyncSession = Depends(get_db)):
         if hasattr(request.app.state, "webhook_manager"):
             webhook_status = await request.app.state.webhook_manager.health_check()
         
+        from services.rate_limiter import rate_limiter
+        from services.ydl_pool import ydl_pool
         return {
             "status": "ok",
             "environment": config.ENV,
             "database": db_status,
             "webhook": webhook_status,
+            "platforms": rate_limiter.stats(),
+            "ydl_pool": ydl_pool.stats(),
             "version": "1.0.0"
         }
     except Exception as e:
-        logger.error(f"خطأ في فحص الصحة: {str(e)}", exc_info=True)
+        logger.error("خطأ في فحص الصحة: %s", e, exc_info=True)
         return {
             "status": "error",
             "message": str(e)
@@ -64,9 +70,61 @@ async def get_analytics(days: int = 7, db: AsyncSession = Depends(get_db)):
         analytics_service = AnalyticsService(db)
         return await analytics_service.get_download_stats(days)
     except Exception as e:
-        logger.error(f"خطأ في الحصول على الإحصائيات: {str(e)}", exc_info=True)
+        logger.error("خطأ في الحصول على الإحصائيات: %s", e, exc_info=True)
         raise HTTPException(500, "حدث خطأ أثناء استرجاع الإحصائيات")
 
+@router.get("/metrics")
+async def prometheus_metrics(request: Request):
+    """
+    مقاييس Prometheus
+    أزمنة الويب هوك والمراحل لكل منصة، أطوال الطوابير، الذاكرات المؤقتة ومجموعة الاتصالات
+    """
+    if not config.METRICS_ENABLED:
+        raise HTTPException(404, "Not Found")
+    if config.METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {config.METRICS_TOKEN}"):
+            raise HTTPException(403, "Forbidden")
+
+    from utils.metrics import metrics
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def require_admin_token(request: Request) -> None:
+    """التحقق من رمز الإدارة (النقاط معطلة إذا لم يُحدد ADMIN_API_TOKEN)"""
+    if not config.ADMIN_API_TOKEN:
+        raise HTTPException(404, "Not Found")
+    authorization = request.headers.get("Authorization", "")
+    if not secrets.compare_digest(authorization, f"Bearer {config.ADMIN_API_TOKEN}"):
+        raise HTTPException(403, "Forbidden")
+
+@router.get("/admin/export/{table}", dependencies=[Depends(require_admin_token)])
+async def export_table(
+    table: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: str = "ndjson"
+):
+    """
+    تصدير التحميلات أو سجلات النظام في فترة زمنية بصيغة NDJSON أو CSV
+    الصفوف تُقرأ وتُرسل على دفعات دون تحميل الجدول في الذاكرة
+    """
+    from services.export import data_exporter, EXPORT_TABLES, EXPORT_FORMATS
+    if table not in EXPORT_TABLES:
+        raise HTTPException(404, f"الجدول غير متاح للتصدير: {table}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, f"صيغة غير مدعومة: {format}")
+    try:
+        start, end = data_exporter.resolve_range(start, end)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    filename = f"{table}_{start:%Y%m%d}_{end:%Y%m%d}.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        data_exporter.stream(table, start, end, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.get("/")
 async def root():
     """الصفحة الرئيسية للـ API"""
@@ -76,11 +134,10 @@ async def root():
         "status": "running"
     }
 
-# معالج الأخطاء العام
-@router.exception_handler(Exception)
+# معالج الأخطاء العام (APIRouter لا يدعم معالجات الأخطاء، فيُسجل على التطبيق في main.py)
 async def global_exception_handler(request: Request, exc: Exception):
     """معالج الأخطاء العام"""
-    logger.error(f"خطأ عام: {str(exc)}", exc_info=True)
+    logger.error("خطأ عام: %s", str(exc), exc_info=True)
     return JSONResponse(
         status_code=500,
         content={"message": "حدث خطأ غير متوقع"}
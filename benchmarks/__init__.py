@@ -0,0 +1,4 @@
+"""
+سكربتات قياس الأداء
+تُشغّل من جذر المشروع: python -m benchmarks.<اسم_السكربت>
+"""
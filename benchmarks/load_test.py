@@ -0,0 +1,632 @@
+"""
+اختبار حمل شامل لمسار الويب هوك قبل موجات الاستخدام المفاجئة
+- يشغّل التطبيق الكامل (main:app) في عملية منفصلة عبر uvicorn
+- خادم Bot API وهمي يسجل كل ما يرسله البوت (رسائل، تعديلات، فيديوهات)
+- مستخرج yt-dlp وهمي لروابط المنصات يعيد فيديو مولداً محلياً يُخدم من خادم HTTP يدعم Range
+- مستخدمون من Faker عبر DatabaseSeeder في قاعدة بيانات مؤقتة
+- تحديثات تيليجرام مصطنعة بنسب قابلة للضبط لـ /info والروابط وأزرار الإعدادات
+ويعرض زمن الاستجابة (p50/p95/p99) ومعدل المعالجة واستهلاك المعالج والذاكرة للخادم
+التحديث الناجح: رد 200 من الويب هوك بدون رسالة خطأ (❌) للمستخدم، ومع sendVideo لتحديثات الروابط؛
+الفاشل لا يدخل في إحصائيات الزمن، ووجود أي فشل ينهي الاختبار برمز خروج 1
+
+الاستخدام:
+    python -m benchmarks.load_test --updates 300 --concurrency 20 --mix info=1 link=3 callback=1
+    python -m benchmarks.load_test --rate 10 --extract-delay 0.5 --json results.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:load-test")
+# بدون طباعة استعلامات SQL (وضع dev) وبدون تسجيل ويب هوك حقيقي (وضع prod)
+os.environ.setdefault("ENV", "loadtest")
+
+import httpx
+from yt_dlp.extractor.common import InfoExtractor
+
+ROOT = Path(__file__).resolve().parent.parent
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Video Hunter', 'username': 'video_hunter_bot'}
+
+# روابط يقبلها البوت (SUPPORTED_PATTERNS) ويعالجها المستخرج الوهمي بدل المنصة الحقيقية
+URL_TEMPLATES = {
+    'youtube': 'https://www.youtube.com/shorts/{id}',
+    'tiktok': 'https://www.tiktok.com/@loadtest/video/{id}',
+    'instagram': 'https://www.instagram.com/reel/{id}'
+}
+
+# ---------- المستخرج الوهمي (داخل عملية الخادم) ----------
+
+class FakeExtractorIE(InfoExtractor):
+    """يعيد نفس الفيديو المحلي لأي رابط منصة بعد تأخير يحاكي زمن الاستخراج"""
+
+    IE_NAME = 'loadtest'
+    _VALID_URL = r'https?://(?:www\.)?(?:youtube\.com/shorts|tiktok\.com/@[\w.-]+/video|instagram\.com/reel)/(?P<id>[\w-]+)'
+
+    media_url = ''
+    media_size = 0
+    delay = 0.0
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        if self.delay:
+            time.sleep(self.delay)
+        return {
+            'id': video_id,
+            'title': f'Load test {video_id}',
+            'duration': 5,
+            'thumbnail': None,
+            'formats': [{
+                'format_id': '360p',
+                'url': f'{self.media_url}/{video_id}.mp4',
+                'ext': 'mp4',
+                'width': 640,
+                'height': 360,
+                'vcodec': 'avc1.42c01e',
+                'acodec': 'mp4a.40.2',
+                'filesize': self.media_size
+            }]
+        }
+
+def install_fake_extractor(media_url: str, media_size: int, delay: float) -> None:
+    """استبدال مستخرجات yt-dlp بالمستخرج الوهمي لكل نسخة YoutubeDL (بما فيها نسخ ydl_pool)"""
+    import yt_dlp
+
+    FakeExtractorIE.media_url = media_url
+    FakeExtractorIE.media_size = media_size
+    FakeExtractorIE.delay = delay
+
+    def add_default_info_extractors(ydl):
+        ydl.add_info_extractor(FakeExtractorIE())
+
+    yt_dlp.YoutubeDL.add_default_info_extractors = add_default_info_extractors
+
+def serve(port: int) -> None:
+    """وضع الخادم: تثبيت المستخرج الوهمي ثم تشغيل التطبيق"""
+    install_fake_extractor(
+        os.environ['LOAD_TEST_MEDIA_URL'],
+        int(os.environ['LOAD_TEST_MEDIA_SIZE']),
+        float(os.environ.get('LOAD_TEST_EXTRACT_DELAY', '0'))
+    )
+    import uvicorn
+    uvicorn.run('main:app', host='127.0.0.1', port=port, log_level='warning')
+
+# ---------- خادم Bot API الوهمي وخادم الوسائط (داخل عملية الاختبار) ----------
+
+class BotApiRecorder:
+    """سجل طلبات البوت إلى Bot API"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.bytes_received = 0
+        self.error_replies = 0
+        self.message_id = 0
+        # لكل تحديث محادثة خاصة به، فتُنسب الأخطاء والفيديوهات إلى التحديث الذي سببها
+        self.error_chats: Dict[int, int] = {}
+        self.video_chats: Dict[int, int] = {}
+
+    def record(self, method: str, size: int, text: str, chat_id: Optional[int] = None) -> int:
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.bytes_received += size
+            if text.startswith('❌'):
+                self.error_replies += 1
+                if chat_id is not None:
+                    self.error_chats[chat_id] = self.error_chats.get(chat_id, 0) + 1
+            if method.lower() == 'sendvideo' and chat_id is not None:
+                self.video_chats[chat_id] = self.video_chats.get(chat_id, 0) + 1
+            self.message_id += 1
+            return self.message_id
+
+def make_bot_api_handler(recorder: BotApiRecorder):
+    """معالج يرد على أي دالة Bot API برد ناجح بالشكل الذي تتوقعه python-telegram-bot"""
+
+    bool_methods = {
+        'deletemessage', 'answercallbackquery', 'setwebhook', 'deletewebhook',
+        'setmycommands', 'sendchataction', 'close', 'logout'
+    }
+
+    class BotApiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _read_fields(self) -> Tuple[int, Dict[str, str]]:
+            length = int(self.headers.get('Content-Length') or 0)
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('multipart/'):
+                # الملفات المرفوعة تُقرأ وتُهمل (المهم حجمها)، والحقول النصية تسبق الملف في أول دفعة
+                fields: Dict[str, str] = {}
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 256 * 1024))
+                    if not chunk:
+                        break
+                    if remaining == length:
+                        fields = {
+                            name.decode(): value.decode(errors='ignore')
+                            for name, value in re.findall(rb'name="([^"]+)"\r\n\r\n([^\r]*)\r\n', chunk)
+                        }
+                    remaining -= len(chunk)
+                return length, fields
+            body = self.rfile.read(length) if length else b''
+            if content_type.startswith('application/json'):
+                return length, {k: str(v) for k, v in json.loads(body or b'{}').items()}
+            return length, {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+        def do_POST(self):
+            method = self.path.rsplit('/', 1)[-1]
+            size, fields = self._read_fields()
+            chat_id = int(fields['chat_id']) if fields.get('chat_id', '').lstrip('-').isdigit() else None
+            message_id = recorder.record(method, size, fields.get('text', ''), chat_id)
+            chat_id = chat_id or 1
+
+            name = method.lower()
+            if name == 'getme':
+                result: Any = BOT_USER
+            elif name == 'getwebhookinfo':
+                result = {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+            elif name in bool_methods:
+                result = True
+            else:
+                result = {
+                    'message_id': message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': BOT_USER,
+                    'text': fields.get('text', '')
+                }
+
+            body = json.dumps({'ok': True, 'result': result}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST
+
+    return BotApiHandler
+
+def make_media_handler(source: Path):
+    """يخدم الفيديو المولد لأي مسار مع دعم Range (كما تفعل خوادم المنصات)"""
+    size = source.stat().st_size
+    payload = source.read_bytes()
+
+    class MediaHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _respond(self, send_body: bool):
+            start, end = 0, size - 1
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2) or size - 1), size - 1)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', '"load-test"')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(payload[start:end + 1])
+
+        def do_GET(self):
+            self._respond(True)
+
+        def do_HEAD(self):
+            self._respond(False)
+
+    return MediaHandler
+
+def start_server(handler) -> Tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def generate_video(path: Path, seconds: int) -> None:
+    """فيديو H.264/AAC حقيقي عبر ffmpeg، أو بيانات عشوائية إذا لم يتوفر ffmpeg"""
+    try:
+        subprocess.run(
+            [
+                'ffmpeg', '-v', 'error', '-y',
+                '-f', 'lavfi', '-i', f'testsrc=duration={seconds}:size=640x360:rate=25',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac',
+                '-movflags', '+faststart', str(path)
+            ],
+            check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        print("⚠️ ffmpeg غير متاح، استخدام بيانات عشوائية بدل الفيديو")
+        path.write_bytes(os.urandom(seconds * 200 * 1024))
+
+# ---------- المستخدمون والتحديثات ----------
+
+async def seed_users(count: int) -> List[Dict[str, Any]]:
+    """إنشاء الجداول ومستخدمين بإعداداتهم عبر DatabaseSeeder"""
+    from database.session import AsyncSessionLocal, async_engine, using_sqlite
+    from database.seed import DatabaseSeeder
+    from database.models import Base, User
+
+    # الجداول من metadata النماذج، فيجدها init_db في الخادم جاهزة
+    if using_sqlite:
+        Base.metadata.create_all(bind=async_engine)
+    else:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    seeder = DatabaseSeeder()
+    fake = seeder.fake
+    users = [
+        User(
+            telegram_id=fake.unique.random_int(10 ** 8, 2 * 10 ** 9),
+            username=fake.unique.user_name()[:50],
+            first_name=fake.first_name(),
+            last_name=fake.last_name()
+        )
+        for _ in range(count)
+    ]
+    if using_sqlite:
+        with AsyncSessionLocal() as session:
+            session.add_all(users)
+            session.commit()
+    else:
+        async with AsyncSessionLocal() as session:
+            session.add_all(users)
+            await session.commit()
+    await seeder.seed_user_settings()
+
+    return [
+        {'id': user.telegram_id, 'is_bot': False, 'first_name': user.first_name, 'username': user.username}
+        for user in users
+    ]
+
+class UpdateFactory:
+    """تحديثات تيليجرام بصيغة JSON كما يرسلها الويب هوك"""
+
+    def __init__(self, users: List[Dict[str, Any]], platforms: List[str], seed: int):
+        self.users = users
+        self.platforms = platforms
+        self.random = random.Random(seed)
+        self.update_id = 0
+
+    def _url(self) -> str:
+        platform = self.random.choice(self.platforms)
+        return URL_TEMPLATES[platform].format(id=self.random.randrange(10 ** 15, 10 ** 16))
+
+    @staticmethod
+    def chat_id(update_id: int) -> int:
+        """محادثة مستقلة لكل تحديث (خارج نطاق معرفات المستخدمين) لنسب ردود البوت إليه"""
+        return 10 ** 12 + update_id
+
+    def _message(self, user: Dict[str, Any], text: str, command: Optional[str] = None) -> Dict[str, Any]:
+        message = {
+            'message_id': self.update_id,
+            'date': int(time.time()),
+            'chat': {'id': self.chat_id(self.update_id), 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': text
+        }
+        if command:
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return message
+
+    def build(self, kind: str) -> Dict[str, Any]:
+        self.update_id += 1
+        user = self.random.choice(self.users)
+        update: Dict[str, Any] = {'update_id': self.update_id}
+        if kind == 'info':
+            update['message'] = self._message(user, f"/info {self._url()}", command='/info')
+        elif kind == 'link':
+            update['message'] = self._message(user, self._url())
+        elif kind == 'callback':
+            update['callback_query'] = {
+                'id': str(self.update_id),
+                'from': user,
+                'chat_instance': str(user['id']),
+                'data': f"quality:{self.random.choice(['best', 'medium', 'low'])}",
+                'message': {**self._message(user, '⚙️ اختر الجودة'), 'from': BOT_USER}
+            }
+        else:
+            raise ValueError(f"نوع تحديث غير معروف: {kind}")
+        return update
+
+def parse_mix(items: List[str]) -> Dict[str, float]:
+    """info=1 link=3 callback=1 -> أوزان الأنواع"""
+    mix = {}
+    for item in items:
+        kind, _, weight = item.partition('=')
+        mix[kind] = float(weight or 1)
+    return mix
+
+# ---------- القياس ----------
+
+class ResourceMonitor:
+    """قراءة استهلاك المعالج والذاكرة لعملية الخادم من /proc (لينكس فقط)"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.samples = 0
+        self._cpu_start = None
+        self._cpu_end = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.available = Path(f'/proc/{pid}/stat').exists()
+
+    def _cpu_seconds(self) -> float:
+        fields = Path(f'/proc/{self.pid}/stat').read_text().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+    def _rss(self) -> int:
+        for line in Path(f'/proc/{self.pid}/status').read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+        return 0
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.peak_rss = max(self.peak_rss, self._rss())
+                self.samples += 1
+            except OSError:
+                return
+
+    def start(self) -> None:
+        if self.available:
+            self._cpu_start = (time.monotonic(), self._cpu_seconds())
+            self._thread.start()
+
+    def stop(self) -> Dict[str, Any]:
+        if not self.available:
+            return {}
+        self._stop.set()
+        self._thread.join()
+        wall = time.monotonic() - self._cpu_start[0]
+        cpu = self._cpu_seconds() - self._cpu_start[1]
+        return {'cpu_seconds': round(cpu, 2), 'cpu_percent': round(cpu / wall * 100, 1), 'peak_rss_bytes': self.peak_rss}
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+async def drive(
+    webhook_url: str,
+    secret: str,
+    updates: List[Tuple[str, Dict[str, Any]]],
+    concurrency: int,
+    rate: Optional[float]
+) -> Tuple[List[Tuple[int, str, float, bool]], float]:
+    """
+    إرسال التحديثات إلى /webhook
+    Args:
+        concurrency: أقصى عدد طلبات متزامنة
+        rate: تحديث/ثانية للوصول المفتوح (None = أسرع ما يمكن ضمن حد التزامن)
+    Returns:
+        ([(ترتيب التحديث، النوع، الزمن بالميلي ثانية، رد 200)], المدة الكلية بالثواني)
+    """
+    results: List[Tuple[int, str, float, bool]] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret}
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0), limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def send(index: int, kind: str, payload: Dict[str, Any]) -> None:
+            if rate:
+                await asyncio.sleep(max(0.0, started + index / rate - time.monotonic()))
+            async with semaphore:
+                sent = time.perf_counter()
+                try:
+                    response = await client.post(webhook_url, json=payload, headers=headers)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                results.append((index, kind, (time.perf_counter() - sent) * 1000, ok))
+
+        started = time.monotonic()
+        await asyncio.gather(*(send(i, kind, payload) for i, (kind, payload) in enumerate(updates)))
+        return results, time.monotonic() - started
+
+def classify(
+    updates: List[Tuple[str, Dict[str, Any]]],
+    results: List[Tuple[int, str, float, bool]],
+    recorder: BotApiRecorder
+) -> List[Tuple[str, float, Optional[str]]]:
+    """
+    نتيجة كل تحديث من رد الويب هوك وما أرسله البوت إلى محادثته
+    Returns:
+        [(النوع، الزمن بالميلي ثانية، سبب الفشل أو None)]
+    """
+    outcomes = []
+    for index, kind, ms, http_ok in results:
+        chat_id = UpdateFactory.chat_id(updates[index][1]['update_id'])
+        if not http_ok:
+            reason = 'http'
+        elif chat_id in recorder.error_chats:
+            reason = 'error_reply'
+        elif kind == 'link' and chat_id not in recorder.video_chats:
+            reason = 'no_video'
+        else:
+            reason = None
+        outcomes.append((kind, ms, reason))
+    return outcomes
+
+def report(
+    results: List[Tuple[str, float, Optional[str]]],
+    elapsed: float,
+    recorder: BotApiRecorder,
+    resources: Dict[str, Any]
+) -> Dict[str, Any]:
+    """طباعة النتائج وإرجاعها كقاموس (لـ --json)؛ الأزمنة للتحديثات الناجحة فقط"""
+    from utils.helpers import format_file_size
+
+    summary: Dict[str, Any] = {'elapsed_seconds': round(elapsed, 2), 'kinds': {}}
+    print(f"\n{'النوع':<10}{'العدد':>7}{'أخطاء':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'الأقصى':>10}")
+    kinds = sorted({kind for kind, _, _ in results}) + ['all']
+    for kind in kinds:
+        selected = [(ms, reason) for k, ms, reason in results if kind in ('all', k)]
+        latencies = [ms for ms, reason in selected if reason is None]
+        errors = len(selected) - len(latencies)
+        stats = {
+            'count': len(selected),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(max(latencies, default=0.0), 1)
+        }
+        summary['kinds'][kind] = stats
+        print(
+            f"{kind:<10}{stats['count']:>7}{errors:>7}{stats['p50_ms']:>9.0f}ms{stats['p95_ms']:>8.0f}ms"
+            f"{stats['p99_ms']:>8.0f}ms{stats['max_ms']:>8.0f}ms"
+        )
+
+    summary['failures'] = {}
+    for _, _, reason in results:
+        if reason:
+            summary['failures'][reason] = summary['failures'].get(reason, 0) + 1
+    successes = sum(1 for _, _, reason in results if reason is None)
+    summary['throughput'] = round(successes / elapsed, 2) if elapsed else 0.0
+    summary['bot_api'] = {
+        'calls': dict(sorted(recorder.calls.items())),
+        'bytes_received': recorder.bytes_received,
+        'error_replies': recorder.error_replies
+    }
+    summary['server'] = resources
+
+    print(f"\nالمعدل: {summary['throughput']} تحديث ناجح/ثانية خلال {elapsed:.1f} ثانية")
+    if summary['failures']:
+        print(f"❌ تحديثات فاشلة (مستبعدة من الأزمنة): {summary['failures']}")
+    print(f"Bot API: {summary['bot_api']['calls']}")
+    print(f"المرفوع إلى Bot API: {format_file_size(recorder.bytes_received)} | ردود خطأ للمستخدمين: {recorder.error_replies}")
+    if resources:
+        print(
+            f"الخادم: المعالج {resources['cpu_percent']}% ({resources['cpu_seconds']} ثانية) | "
+            f"أقصى ذاكرة {format_file_size(resources['peak_rss_bytes'])}"
+        )
+    return summary
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"توقف الخادم أثناء التشغيل (رمز {process.returncode})")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("لم يبدأ الخادم خلال المهلة")
+
+def main(args: argparse.Namespace) -> None:
+    mix = parse_mix(args.mix)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        database_url = args.database_url or f"sqlite:///{tmp_path / 'load_test.db'}"
+        os.environ['DATABASE_URL'] = database_url
+
+        video = tmp_path / 'video.mp4'
+        generate_video(video, args.video_seconds)
+
+        recorder = BotApiRecorder()
+        bot_api, bot_api_url = start_server(make_bot_api_handler(recorder))
+        media, media_url = start_server(make_media_handler(video))
+
+        users = asyncio.run(seed_users(args.users))
+        factory = UpdateFactory(users, args.platforms, args.seed)
+        kinds = factory.random.choices(list(mix), weights=list(mix.values()), k=args.updates)
+        updates = [(kind, factory.build(kind)) for kind in kinds]
+
+        from config import config
+        port = args.port
+        env = {
+            **os.environ,
+            'PYTHONPATH': str(ROOT),
+            'DATABASE_URL': database_url,
+            'TELEGRAM_API_BASE_URL': bot_api_url,
+            'WORKSPACE_DIR': str(tmp_path / 'workspace'),
+            'JOB_RESUME_ENABLED': 'false',
+            'LOAD_TEST_MEDIA_URL': media_url,
+            'LOAD_TEST_MEDIA_SIZE': str(video.stat().st_size),
+            'LOAD_TEST_EXTRACT_DELAY': str(args.extract_delay)
+        }
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.load_test', 'serve', '--port', str(port)],
+            cwd=tmp,
+            env=env,
+            # سجلات الخادم تبقى في مجلد logs المؤقت، والأخطاء غير المعالجة تظهر في stderr
+            stdout=subprocess.DEVNULL
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_until_ready(base_url, process)
+            print(
+                f"{len(updates)} تحديث ({', '.join(f'{k}={kinds.count(k)}' for k in mix)}) "
+                f"| تزامن {args.concurrency} | معدل {args.rate or 'مفتوح'} | {len(users)} مستخدم"
+            )
+            monitor = ResourceMonitor(process.pid)
+            monitor.start()
+            results, elapsed = asyncio.run(
+                drive(f"{base_url}/webhook", config.API_SECRET_KEY, updates, args.concurrency, args.rate)
+            )
+            summary = report(classify(updates, results, recorder), elapsed, recorder, monitor.stop())
+            if args.json:
+                Path(args.json).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            bot_api.shutdown()
+            media.shutdown()
+    if summary['failures']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_parser = argparse.ArgumentParser()
+        serve_parser.add_argument('command')
+        serve_parser.add_argument('--port', type=int, required=True)
+        serve(serve_parser.parse_args().port)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="اختبار حمل لمسار الويب هوك مع Bot API ومستخرج وهميين")
+    parser.add_argument('--updates', type=int, default=200, help="عدد التحديثات المرسلة")
+    parser.add_argument('--concurrency', type=int, default=20, help="أقصى طلبات ويب هوك متزامنة")
+    parser.add_argument('--rate', type=float, default=None, help="تحديث/ثانية (الافتراضي: بلا حد)")
+    parser.add_argument('--mix', nargs='+', default=['info=1', 'link=3', 'callback=1'], help="أوزان الأنواع info/link/callback")
+    parser.add_argument('--platforms', nargs='+', default=['youtube'], choices=sorted(URL_TEMPLATES))
+    parser.add_argument('--users', type=int, default=100, help="عدد المستخدمين المصطنعين")
+    parser.add_argument('--extract-delay', type=float, default=0.2, help="زمن الاستخراج الوهمي بالثواني")
+    parser.add_argument('--video-seconds', type=int, default=5, help="مدة الفيديو المولد")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--database-url', default=None, help="الافتراضي SQLite مؤقتة")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', default=None, help="حفظ النتائج في ملف JSON")
+    main(parser.parse_args())
@@ -0,0 +1,182 @@
+"""
+قياس تكلفة الدوال التي تُستدعى مع كل رسالة أو ضغطة زر
+(المساعدات، المتحقق، مطابقة الروابط، تحليل بيانات الأزرار، بناء لوحات الأزرار، تحليل التحديثات)
+ومقارنتها بخط أساس محفوظ حتى يظهر أي تراجع في الأداء أثناء المراجعة
+
+القياسات بالنانوثانية لكل استدعاء (أفضل تكرار من عدة تكرارات عبر timeit)،
+وخط الأساس خاص بالجهاز: يُحدّث بـ --save على نفس الجهاز المستخدم للمقارنة
+
+الاستخدام:
+    python -m benchmarks.micro                    # مقارنة بخط الأساس (رمز خروج 1 عند التراجع)
+    python -m benchmarks.micro --save             # حفظ النتائج كخط أساس جديد
+    python -m benchmarks.micro --filter url --threshold 0.15
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import platform
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:benchmark")
+
+BASELINE_FILE = Path(__file__).parent / 'baselines' / 'micro.json'
+
+YOUTUBE_URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+TIKTOK_URL = 'https://www.tiktok.com/@creator/video/7234567890123456789'
+UNSUPPORTED_URL = 'https://example.com/some/page?ref=1'
+LONG_TEXT = 'سجل التحميلات ' * 800
+
+MESSAGE_UPDATE = {
+    'update_id': 1001,
+    'message': {
+        'message_id': 55,
+        'date': 1700000000,
+        'chat': {'id': 987654321, 'type': 'private', 'first_name': 'Test'},
+        'from': {'id': 987654321, 'is_bot': False, 'first_name': 'Test', 'username': 'test_user', 'language_code': 'ar'},
+        'text': YOUTUBE_URL,
+        'entities': [{'type': 'url', 'offset': 0, 'length': len(YOUTUBE_URL)}]
+    }
+}
+CALLBACK_UPDATE = {
+    'update_id': 1002,
+    'callback_query': {
+        'id': '4382',
+        'from': MESSAGE_UPDATE['message']['from'],
+        'chat_instance': '-42',
+        'data': 'quality:medium',
+        'message': {
+            'message_id': 56,
+            'date': 1700000001,
+            'chat': MESSAGE_UPDATE['message']['chat'],
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'Video Hunter'},
+            'text': '⚙️ اختر الجودة'
+        }
+    }
+}
+
+def run_sync(coro) -> Any:
+    """تنفيذ دالة غير متزامنة لا تنتظر فعلياً (بدون تكلفة حلقة الأحداث)"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("الدالة انتظرت عملية فعلية ولا يمكن قياسها هنا")
+
+def build_cases() -> Dict[str, Callable[[], Any]]:
+    """الحالات المقاسة: الاسم -> دالة بدون معاملات (التهيئة تتم هنا خارج القياس)"""
+    from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+    from utils import helpers
+    from utils.validators import Validator
+    from handlers.messages import message_handler
+    from handlers.callbacks import callback_handler
+    from services.playlist import playlist_downloader
+    from services.profile_sync import profile_sync
+
+    bot = Bot(os.environ["TELEGRAM_TOKEN"])
+    raw_update = json.dumps(MESSAGE_UPDATE).encode()
+    buttons = [{'text': f'زر {i}', 'data': f'buy_{i * 100}'} for i in range(6)]
+
+    def parse_callback_data():
+        action, *data = CALLBACK_UPDATE['callback_query']['data'].split(':')
+        return callback_handler.callback_actions.get(action), data
+
+    def formats_keyboard():
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton("⬇️ أعلى جودة", callback_data=f"dl:{YOUTUBE_URL}:best")],
+            [InlineKeyboardButton("⬇️ جودة متوسطة", callback_data=f"dl:{YOUTUBE_URL}:medium")],
+            [InlineKeyboardButton("⬇️ أقل جودة", callback_data=f"dl:{YOUTUBE_URL}:low")]
+        ])
+
+    return {
+        'helpers.validate_url[supported]': lambda: helpers.validate_url(YOUTUBE_URL),
+        'helpers.validate_url[unsupported]': lambda: helpers.validate_url(UNSUPPORTED_URL),
+        'helpers.format_file_size': lambda: helpers.format_file_size(734003200),
+        'helpers.format_duration': lambda: helpers.format_duration(3725),
+        'helpers.split_message[11k]': lambda: helpers.split_message(LONG_TEXT),
+        'helpers.get_platform_from_url': lambda: helpers.get_platform_from_url(TIKTOK_URL),
+        'Validator.validate_url': lambda: Validator.validate_url(TIKTOK_URL),
+        'Validator.validate_quality': lambda: Validator.validate_quality('medium'),
+        'Validator.validate_platform': lambda: Validator.validate_platform('instagram'),
+        'url.supported_patterns': lambda: run_sync(message_handler._is_supported_url(YOUTUBE_URL)),
+        'url.playlist_check': lambda: playlist_downloader.is_playlist(YOUTUBE_URL),
+        'url.profile_check': lambda: profile_sync.match(YOUTUBE_URL),
+        'callback.parse_data': parse_callback_data,
+        'keyboard.quality': lambda: callback_handler._build_quality_keyboard('medium'),
+        'keyboard.formats': formats_keyboard,
+        'keyboard.create_inline_keyboard[6]': lambda: helpers.create_inline_keyboard(buttons),
+        'update.de_json[message]': lambda: Update.de_json(MESSAGE_UPDATE, bot),
+        'update.de_json[callback]': lambda: Update.de_json(CALLBACK_UPDATE, bot),
+        'update.webhook_body': lambda: Update.de_json(json.loads(raw_update), bot)
+    }
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> float:
+    """زمن الاستدعاء الواحد بالنانوثانية (أفضل تكرار لتقليل أثر الضوضاء)"""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+def load_baseline(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+def save_baseline(path: Path, results: Dict[str, float]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'machine': platform.machine(),
+        'processor': platform.processor() or platform.machine(),
+        'python': platform.python_version(),
+        'results': {name: round(ns, 1) for name, ns in results.items()}
+    }, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+
+def main(args: argparse.Namespace) -> int:
+    cases = {name: func for name, func in build_cases().items() if not args.filter or args.filter in name}
+    baseline = load_baseline(Path(args.baseline))
+    previous = (baseline or {}).get('results', {})
+    if baseline and baseline.get('python') != platform.python_version():
+        print(f"⚠️ خط الأساس من Python {baseline.get('python')} والقياس الحالي من {platform.python_version()}")
+
+    results: Dict[str, float] = {}
+    regressions = []
+    width = max(len(name) for name in cases)
+    print(f"{'الحالة':<{width}}  {'ns/استدعاء':>12}  {'الأساس':>10}  {'التغير':>8}")
+    for name, func in cases.items():
+        ns = measure(func, args.repeat, args.min_time)
+        results[name] = ns
+        base = previous.get(name)
+        if base:
+            change = ns / base - 1
+            mark = '⚠️' if change > args.threshold else ('✅' if change < -args.threshold else '')
+            if change > args.threshold:
+                regressions.append(name)
+            print(f"{name:<{width}}  {ns:>12.1f}  {base:>10.1f}  {change:>+7.0%} {mark}")
+        else:
+            print(f"{name:<{width}}  {ns:>12.1f}  {'-':>10}  {'جديد':>8}")
+
+    if args.save:
+        # الحفظ الجزئي (--filter) يحدّث الحالات المقاسة فقط
+        save_baseline(Path(args.baseline), {**previous, **results})
+        print(f"\nتم حفظ خط الأساس في {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"\n⚠️ تراجع أكثر من {args.threshold:.0%} في: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="قياس الدوال المستدعاة مع كل رسالة ومقارنتها بخط الأساس")
+    parser.add_argument('--save', action='store_true', help="حفظ النتائج كخط أساس")
+    parser.add_argument('--baseline', default=str(BASELINE_FILE))
+    parser.add_argument('--threshold', type=float, default=0.25, help="نسبة التراجع المسموحة قبل الفشل")
+    parser.add_argument('--filter', default=None, help="قياس الحالات التي يحتوي اسمها على النص فقط")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1, help="أقل مدة بالثواني لكل تكرار")
+    sys.exit(main(parser.parse_args()))
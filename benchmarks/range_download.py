@@ -0,0 +1,121 @@
+"""
+مقارنة التحميل باتصال واحد مقابل التحميل المتوازي بطلبات Range
+يشغّل خادم HTTP محلياً يدعم Range ويحد سرعة كل اتصال (كما تفعل خوادم المنصات)،
+ثم يحمّل نفس الملف بعدد مختلف من الاتصالات ويتحقق من سلامة المحتوى
+
+الاستخدام:
+    python -m benchmarks.range_download --size 64 --per-connection 4 --connections 1 4 8
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("TELEGRAM_TOKEN", "benchmark")
+
+from services.range_downloader import BandwidthLimiter, RangeDownloader
+from utils.helpers import format_file_size
+
+def make_handler(source: Path, per_connection_rate: int):
+    """معالج HTTP يخدم ملفاً واحداً مع دعم Range وحد سرعة لكل اتصال"""
+    size = source.stat().st_size
+
+    class RangeHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            start, end = 0, size - 1
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2) or size - 1), size - 1)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                self.send_response(200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', '"benchmark"')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            block = 64 * 1024
+            with open(source, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = f.read(min(block, remaining))
+                    self.wfile.write(data)
+                    remaining -= len(data)
+                    time.sleep(len(data) / per_connection_rate)
+
+    return RangeHandler
+
+def generate_source(path: Path, size_mb: int) -> str:
+    """ملف عشوائي بالحجم المطلوب مع بصمته"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            chunk = os.urandom(1024 * 1024)
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def run_benchmark(size_mb: int, per_connection_mb: float, connections: list, chunk_mb: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'source.bin'
+        expected = generate_source(source, size_mb)
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(source, int(per_connection_mb * 1024 * 1024)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/source.bin"
+        print(f"الملف: {format_file_size(size_mb * 1024 * 1024)} | حد الاتصال الواحد: {per_connection_mb}MB/s")
+
+        baseline = None
+        try:
+            for count in connections:
+                downloader = RangeDownloader(
+                    connections=count,
+                    chunk_size=chunk_mb * 1024 * 1024,
+                    bandwidth=BandwidthLimiter(0)
+                )
+                output = str(Path(tmp) / f'out_{count}.bin')
+                started = time.perf_counter()
+                await downloader.download(url, output)
+                elapsed = time.perf_counter() - started
+                await downloader.close()
+
+                baseline = baseline or elapsed
+                status = "✅" if file_hash(output) == expected else "❌ محتوى تالف"
+                print(
+                    f"{count} اتصالات: {elapsed:.2f}s | "
+                    f"{format_file_size(size_mb * 1024 * 1024 / elapsed)}/s | "
+                    f"التسريع {baseline / elapsed:.2f}x {status}"
+                )
+                os.remove(output)
+        finally:
+            server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="قياس التحميل المتوازي بطلبات Range")
+    parser.add_argument('--size', type=int, default=64, help="حجم الملف بالميجابايت")
+    parser.add_argument('--per-connection', type=float, default=4.0, help="حد سرعة الاتصال الواحد MB/s")
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--chunk', type=int, default=4, help="حجم الجزء بالميجابايت")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.size, args.per_connection, args.connections, args.chunk))
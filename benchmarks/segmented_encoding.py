@@ -0,0 +1,68 @@
+"""
+مقارنة زمن الترميز بعملية واحدة مقابل الترميز المقطعي المتوازي
+يولّد فيديو اختبار عبر testsrc في ffmpeg ثم يضغطه بالطريقتين بنفس المعاملات
+
+الاستخدام:
+    python -m benchmarks.segmented_encoding --duration 300 --target 20 --workers 4
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+os.environ.setdefault("TELEGRAM_TOKEN", "benchmark")
+
+from services.compression_planner import compression_planner
+from services.media_probe import probe_media
+from services.segmented_encoder import SegmentedEncoder
+from utils.helpers import format_file_size
+
+def generate_test_video(path: Path, duration: int, size: str) -> None:
+    """توليد فيديو اختبار بصورة testsrc وصوت sine"""
+    subprocess.run([
+        'ffmpeg', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc=duration={duration}:size={size}:rate=30',
+        '-f', 'lavfi', '-i', f'sine=frequency=1000:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60',
+        '-c:a', 'aac', '-shortest',
+        '-y', str(path)
+    ], check=True)
+
+async def run_benchmark(duration: int, size: str, target_mb: float, workers: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'source.mp4'
+        print(f"توليد فيديو اختبار {size} لمدة {duration} ثانية...")
+        generate_test_video(source, duration, size)
+
+        plan = compression_planner.plan(await probe_media(str(source)), target_mb)
+        video_args = compression_planner.build_video_args(plan)
+        audio_args = compression_planner.build_audio_args(plan)
+
+        results = {}
+        for name, encode in [
+            ('عملية واحدة', compression_planner._encode_single),
+            (f'مقطعي ({workers} عمليات)', SegmentedEncoder(workers=workers).encode),
+        ]:
+            output = Path(tmp) / f"out_{len(results)}.mp4"
+            started = time.perf_counter()
+            ok = await encode(str(source), str(output), video_args, audio_args, None, plan['duration'])
+            elapsed = time.perf_counter() - started
+            results[name] = elapsed
+            size_text = format_file_size(output.stat().st_size) if ok else "فشل"
+            print(f"{name}: {elapsed:.1f}s | الحجم: {size_text}")
+
+        single, segmented = results.values()
+        print(f"التسريع: {single / segmented:.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="قياس الترميز المقطعي المتوازي")
+    parser.add_argument('--duration', type=int, default=300)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--target', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    asyncio.run(run_benchmark(args.duration, args.size, args.target, args.workers))
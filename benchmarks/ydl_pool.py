@@ -0,0 +1,109 @@
+"""
+مقارنة تكلفة الطلب الواحد: إنشاء YoutubeDL جديد لكل طلب مقابل استعارة نسخة من ydl_pool
+يشغّل خادم HTTP محلياً يخدم ملف فيديو مباشر، ثم يستخرج معلوماته عدة مرات بالطريقتين
+(المستخرج العام في yt-dlp يتعامل معه كرابط وسائط مباشر)
+
+الاستخدام:
+    python -m benchmarks.ydl_pool --requests 200 --threads 1 4
+"""
+import os
+import time
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("TELEGRAM_TOKEN", "benchmark")
+
+import yt_dlp
+
+from services.ydl_pool import YdlPool
+
+OPTS = {'quiet': True, 'no_warnings': True, 'force_ipv4': True}
+PAYLOAD = os.urandom(64 * 1024)
+
+class VideoHandler(BaseHTTPRequestHandler):
+    """يخدم نفس المحتوى لأي مسار ينتهي بـ .mp4"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers()
+
+    def do_GET(self):
+        self._headers()
+        self.wfile.write(PAYLOAD)
+
+def run_cold(url: str) -> None:
+    with yt_dlp.YoutubeDL(dict(OPTS)) as ydl:
+        ydl.extract_info(url, download=False)
+
+def make_pooled(pool: YdlPool):
+    def run_pooled(url: str) -> None:
+        with pool.checkout('default', {'format': 'best'}) as ydl:
+            ydl.extract_info(url, download=False)
+    return run_pooled
+
+def measure(func, base_url: str, requests: int, threads: int) -> list:
+    """زمن كل طلب بالميلي ثانية"""
+    def timed(i: int) -> float:
+        started = time.perf_counter()
+        func(f"{base_url}/video_{i}.mp4")
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(timed, range(requests)))
+
+def report(name: str, samples: list, elapsed: float) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(
+        f"{name:<8} متوسط {statistics.mean(samples):7.2f}ms | الوسيط {statistics.median(samples):7.2f}ms | "
+        f"p95 {p95:7.2f}ms | {len(samples) / elapsed:7.1f} طلب/ثانية"
+    )
+
+def main(requests: int, thread_counts: list) -> None:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), VideoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    started = time.perf_counter()
+    yt_dlp.YoutubeDL(dict(OPTS)).close()
+    print(f"إنشاء YoutubeDL واحد: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    try:
+        for threads in thread_counts:
+            pool = YdlPool(max_size=threads)
+            pool.register('default', OPTS)
+            pool.warm(threads)
+            print(f"\n{requests} طلب عبر {threads} خيوط:")
+
+            results = {}
+            for name, func in (('جديد', run_cold), ('المجموعة', make_pooled(pool))):
+                started = time.perf_counter()
+                samples = measure(func, base_url, requests, threads)
+                elapsed = time.perf_counter() - started
+                report(name, samples, elapsed)
+                results[name] = statistics.mean(samples)
+
+            saved = results['جديد'] - results['المجموعة']
+            print(f"التوفير لكل طلب: {saved:.2f}ms ({saved / results['جديد'] * 100:.0f}%) | {pool.stats()['default']}")
+            pool.close()
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="قياس إعادة استخدام نسخ YoutubeDL")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+    main(args.requests, args.threads)
@@ -37,12 +37,12 @@ async def init_db():
         
         for table in required_tables:
             if not inspector.has_table(table):
-                logger.error(f"فشل في إنشاء جدول: {table}")
+                logger.error("فشل في إنشاء جدول: %s", table)
                 raise RuntimeError(f"الجدول {table} لم يتم إنشاؤه")
 
         logger.info("✅ تم إنشاء جميع الجداول بنجاح")
     except Exception as e:
-        logger.critical(f"فشل في تهيئة قاعدة البيانات: {str(e)}", exc_info=True)
+        logger.critical("فشل في تهيئة قاعدة البيانات: %s", e, exc_info=True)
         raise
 
 __all__ = ['get_db',
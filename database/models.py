@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Boolean, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from . import Base
 
@@ -37,6 +37,11 @@ class UserSettings(Base):
 class Download(Base):
     """سجل تحميلات المستخدم"""
     __tablename__ = 'downloads'
+    # صفحات السجل تُقرأ بترتيب (download_date, id) لكل مستخدم، والتصدير بنفس الترتيب لكل المستخدمين
+    __table_args__ = (
+        Index('ix_downloads_user_date_id', 'user_id', 'download_date', 'id'),
+        Index('ix_downloads_date_id', 'download_date', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -48,6 +53,39 @@ class Download(Base):
     
     user = relationship("User", back_populates="downloads")
 
+class DownloadJob(Base):
+    """مهمة تحميل جارية تُستأنف بعد إعادة تشغيل الخادم"""
+    __tablename__ = 'download_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False, index=True)  # معرف تيليجرام
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger)  # رسالة الحالة التي تُحدّث عند الاستئناف
+    url = Column(String(500), nullable=False)
+    quality = Column(String(20), default='best')
+    max_size_mb = Column(Float)
+    compress = Column(Boolean, default=False)  # ضغط الملف إذا تجاوز max_size_mb
+    workspace_dir = Column(String(255))
+    part_path = Column(String(500))
+    downloaded_bytes = Column(BigInteger, default=0)
+    total_bytes = Column(BigInteger)
+    status = Column(String(20), default='downloading', index=True)
+    attempts = Column(Integer, default=0)
+    error = Column(String(500))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SeenItems(Base):
+    """معرفات العناصر التي استلمها المستخدم من حساب أو قصة (لإرسال الجديد فقط)"""
+    __tablename__ = 'seen_items'
+    __table_args__ = (UniqueConstraint('user_id', 'source'),)
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)  # معرف تيليجرام
+    source = Column(String(255), nullable=False)  # مثل tiktok:user:name
+    item_hashes = Column(LargeBinary, nullable=False)  # بصمات 8 بايت متتالية بترتيب الإضافة
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class UserPoints(Base):
     """نظام نقاط المستخدم"""
     __tablename__ = 'user_points'
@@ -76,6 +114,8 @@ class ClaimedReward(Base):
 class SystemLog(Base):
     """سجل أحداث النظام"""
     __tablename__ = 'system_logs'
+    # التصدير يقرأ الفترة على دفعات بترتيب (timestamp, id)
+    __table_args__ = (Index('ix_system_logs_timestamp_id', 'timestamp', 'id'),)
     
     id = Column(Integer, primary_key=True)
     event_type = Column(String(50), nullable=False)
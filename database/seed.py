@@ -1,5 +1,10 @@
+import time
+import random
 import logging
+import argparse
+from itertools import accumulate
 from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 from faker import Faker
 from sqlalchemy import select, inspect
 from .session import AsyncSessionLocal, async_engine, using_sqlite
@@ -21,6 +26,175 @@ else:
     from sqlalchemy.ext.asyncio import AsyncSession as SessionType
 
 
+# ---- التهيئة الكبيرة (ملايين الصفوف لقياس الاستعلامات والفهارس) ----
+
+# أعمدة كل جدول بنفس ترتيب قيم الصفوف المولدة
+BULK_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'users': ('id', 'telegram_id', 'username', 'first_name', 'last_name', 'join_date', 'last_activity', 'is_admin'),
+    'user_points': ('id', 'user_id', 'points', 'last_daily_bonus', 'streak_days'),
+    'claimed_rewards': ('points_id', 'reward_id', 'claim_date', 'expiration_date'),
+    'downloads': ('user_id', 'url', 'platform', 'download_date', 'file_size', 'status'),
+    'system_logs': ('event_type', 'description', 'timestamp', 'user_id')
+}
+
+# المنصات بترتيب الشعبية (تُختار بتوزيع Zipf) وقالب الرابط لكل منها
+BULK_PLATFORMS: Dict[str, str] = {
+    'YouTube': 'https://www.youtube.com/watch?v={}',
+    'TikTok': 'https://www.tiktok.com/@user/video/{}',
+    'Instagram': 'https://www.instagram.com/reel/{}',
+    'Twitter/X': 'https://x.com/user/status/{}',
+    'Facebook': 'https://www.facebook.com/watch/?v={}'
+}
+
+# وزن كل ساعة من اليوم: أقل نشاط قرابة الرابعة فجراً وذروة بين الثامنة والحادية عشرة مساءً
+HOURLY_WEIGHTS = (
+    3.0, 2.0, 1.4, 1.0, 0.8, 1.0, 1.6, 2.6, 3.6, 4.4, 5.0, 5.6,
+    6.2, 6.4, 6.0, 6.0, 6.6, 7.4, 8.4, 9.4, 10.0, 10.0, 8.4, 5.4
+)
+WEEKEND_FACTOR = 1.3  # الجمعة والسبت
+
+DOWNLOAD_STATUSES = (('completed', 90), ('failed', 7), ('pending', 3))
+LOG_EVENT_TYPES = (('DOWNLOAD', 60), ('AUTH', 15), ('ERROR', 10), ('SETTINGS', 10), ('REWARD', 5))
+
+class ZipfSampler:
+    """اختيار العناصر بتوزيع Zipf: العنصر رقم k في الترتيب يُختار بنسبة 1/k^s"""
+
+    def __init__(self, items: Sequence, rng: random.Random, exponent: float = 1.1, shuffle: bool = True):
+        self.items = list(items)
+        if shuffle:
+            # حتى لا يرتبط النشاط بترتيب المعرفات
+            rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(self.items) + 1)))
+        self.rng = rng
+
+    def sample(self, k: int) -> list:
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+class BulkDataGenerator:
+    """
+    توليد صفوف واقعية على دفعات (قوائم tuples بترتيب BULK_COLUMNS) دون بناء كائنات ORM
+    المستخدمون والمنصات بتوزيع Zipf، والأوقات حسب نشاط اليوم والأسبوع مع نمو تدريجي خلال الفترة
+    """
+
+    def __init__(
+        self,
+        user_ids: Sequence[int],
+        points_ids: Sequence[int],
+        days: int = 365,
+        seed: int = 42,
+        sqlite: bool = False,
+        now: Optional[datetime] = None
+    ):
+        self.rng = random.Random(seed)
+        self.fake = Faker()
+        self.fake.seed_instance(seed)
+        self.users = ZipfSampler(user_ids, self.rng)
+        # نقاط المستخدم رقم i في user_ids هي points_ids[i]
+        self.points_of = dict(zip(user_ids, points_ids))
+        self.platforms = ZipfSampler(list(BULK_PLATFORMS), self.rng, shuffle=False)
+        # SQLite يخزن التواريخ كنص بنفس صيغة SQLAlchemy (مع الميكروثانية) حتى تصح المقارنة بالمعاملات،
+        # وCOPY في PostgreSQL يأخذ كائنات datetime مباشرة
+        self.as_db_time = (lambda value: value.isoformat(' ', 'microseconds')) if sqlite else (lambda value: value)
+
+        self.now = (now or datetime.now()).replace(microsecond=0)
+        self.start = (self.now - timedelta(days=days)).replace(hour=0, minute=0, second=0)
+        self.days = days
+        day_weights = []
+        for day in range(days):
+            weekday = (self.start + timedelta(days=day)).weekday()
+            growth = 1 + day / days  # ضعف النشاط في نهاية الفترة مقارنة ببدايتها
+            day_weights.append(growth * (WEEKEND_FACTOR if weekday in (4, 5) else 1))
+        self.day_cum = list(accumulate(day_weights))
+        self.hour_cum = list(accumulate(HOURLY_WEIGHTS))
+
+        self.sentences = [self.fake.sentence() for _ in range(500)]
+        self.names = [(self.fake.first_name(), self.fake.last_name()) for _ in range(1000)]
+
+    def timestamps(self, k: int) -> List[datetime]:
+        rng = self.rng
+        days = rng.choices(range(self.days), cum_weights=self.day_cum, k=k)
+        hours = rng.choices(range(24), cum_weights=self.hour_cum, k=k)
+        return [
+            self.start + timedelta(days=day, hours=hour, seconds=rng.randrange(3600))
+            for day, hour in zip(days, hours)
+        ]
+
+    def _chunks(self, count: int, batch_size: int) -> Iterator[int]:
+        for offset in range(0, count, batch_size):
+            yield min(batch_size, count - offset)
+
+    def users_rows(self, user_ids: Sequence[int], batch_size: int) -> Iterator[List[tuple]]:
+        rng, t = self.rng, self.as_db_time
+        for offset in range(0, len(user_ids), batch_size):
+            batch = []
+            for user_id in user_ids[offset:offset + batch_size]:
+                first, last = rng.choice(self.names)
+                joined = self.start - timedelta(days=rng.randrange(365), seconds=rng.randrange(86400))
+                batch.append((
+                    user_id, 1_000_000_000 + user_id, f"{first.lower()}_{user_id}", first, last,
+                    t(joined), t(self.now - timedelta(seconds=rng.randrange(self.days * 86400))), False
+                ))
+            yield batch
+
+    def user_points_rows(self, user_ids: Sequence[int], batch_size: int) -> Iterator[List[tuple]]:
+        rng, t = self.rng, self.as_db_time
+        for offset in range(0, len(user_ids), batch_size):
+            chunk = user_ids[offset:offset + batch_size]
+            bonuses = self.timestamps(len(chunk))
+            yield [
+                (self.points_of[user_id], user_id, int(rng.paretovariate(1.5) * 50), t(bonus), rng.randrange(31))
+                for user_id, bonus in zip(chunk, bonuses)
+            ]
+
+    def claimed_rewards_rows(self, count: int, batch_size: int) -> Iterator[List[tuple]]:
+        rewards = list(config.REWARDS)
+        # المكافآت الأرخص تُشترى أكثر
+        reward_cum = list(accumulate(1 / (index + 1) for index in range(len(rewards))))
+        t = self.as_db_time
+        for size in self._chunks(count, batch_size):
+            users = self.users.sample(size)
+            chosen = self.rng.choices(rewards, cum_weights=reward_cum, k=size)
+            yield [
+                (
+                    self.points_of[user_id], reward_id, t(claimed),
+                    t(claimed + timedelta(days=config.REWARDS[reward_id]['duration']))
+                )
+                for user_id, reward_id, claimed in zip(users, chosen, self.timestamps(size))
+            ]
+
+    def downloads_rows(self, count: int, batch_size: int) -> Iterator[List[tuple]]:
+        rng, t = self.rng, self.as_db_time
+        statuses, status_weights = zip(*DOWNLOAD_STATUSES)
+        for size in self._chunks(count, batch_size):
+            users = self.users.sample(size)
+            platforms = self.platforms.sample(size)
+            dates = self.timestamps(size)
+            chosen = rng.choices(statuses, weights=status_weights, k=size)
+            yield [
+                (
+                    user_id,
+                    BULK_PLATFORMS[platform].format(rng.getrandbits(60)),
+                    platform,
+                    t(date),
+                    int(rng.lognormvariate(3, 1) * 1024 * 1024),  # بالبايت مثل تسجيل التحميلات (الوسيط قرابة 20MB)
+                    status
+                )
+                for user_id, platform, date, status in zip(users, platforms, dates, chosen)
+            ]
+
+    def system_logs_rows(self, count: int, batch_size: int) -> Iterator[List[tuple]]:
+        t = self.as_db_time
+        events, event_weights = zip(*LOG_EVENT_TYPES)
+        for size in self._chunks(count, batch_size):
+            chosen = self.rng.choices(events, weights=event_weights, k=size)
+            descriptions = self.rng.choices(self.sentences, k=size)
+            yield [
+                (event, description, t(timestamp), user_id)
+                for event, description, timestamp, user_id in zip(
+                    chosen, descriptions, self.timestamps(size), self.users.sample(size)
+                )
+            ]
+
 class DatabaseSeeder:
     """نظام تهيئة البيانات الأولية مع دعم كامل للـ Async و Sync"""
     
@@ -48,9 +222,9 @@ class DatabaseSeeder:
                 for table in tables:
                     try:
                         session.execute(f"DELETE FROM {table}")
-                        logger.info(f"تم حذف بيانات جدول {table}")
+                        logger.info("تم حذف بيانات جدول %s", table)
                     except Exception as e:
-                        logger.warning(f"خطأ في حذف جدول {table}: {str(e)}")
+                        logger.warning("خطأ في حذف جدول %s: %s", table, e)
                         session.rollback()
                 
                 session.commit()
@@ -68,9 +242,9 @@ class DatabaseSeeder:
                     for table in tables:
                         try:
                             await async_session.execute(f"TRUNCATE TABLE {table} CASCADE")
-                            logger.info(f"تم حذف بيانات جدول {table}")
+                            logger.info("تم حذف بيانات جدول %s", table)
                         except Exception as e:
-                            logger.warning(f"خطأ في حذف جدول {table}: {str(e)}")
+                            logger.warning("خطأ في حذف جدول %s: %s", table, e)
                             await async_session.rollback()
                     
                     await async_session.commit()
@@ -81,7 +255,7 @@ class DatabaseSeeder:
                 session.rollback()
             else:
                 await session.rollback()
-            logger.critical(f"❌ فشل في حذف البيانات: {str(e)}", exc_info=True)
+            logger.critical("❌ فشل في حذف البيانات: %s", e, exc_info=True)
             raise
         finally:
             if using_sqlite:
@@ -137,7 +311,7 @@ class DatabaseSeeder:
                 session.rollback()
             else:
                 await session.rollback()
-            logger.error(f"❌ فشل في إنشاء المستخدمين: {str(e)}", exc_info=True)
+            logger.error("❌ فشل في إنشاء المستخدمين: %s", e, exc_info=True)
             raise
         finally:
             if using_sqlite:
@@ -185,7 +359,7 @@ class DatabaseSeeder:
                 session.rollback()
             else:
                 await session.rollback()
-            logger.error(f"❌ فشل في تهيئة الإعدادات: {str(e)}", exc_info=True)
+            logger.error("❌ فشل في تهيئة الإعدادات: %s", e, exc_info=True)
             raise
         finally:
             if using_sqlite:
@@ -241,7 +415,7 @@ class DatabaseSeeder:
                 session.rollback()
             else:
                 await session.rollback()
-            logger.error(f"❌ فشل في إنشاء التحميلات: {str(e)}", exc_info=True)
+            logger.error("❌ فشل في إنشاء التحميلات: %s", e, exc_info=True)
             raise
         finally:
             if using_sqlite:
@@ -311,7 +485,7 @@ class DatabaseSeeder:
                 session.rollback()
             else:
                 await session.rollback()
-            logger.error(f"❌ فشل في تهيئة النقاط: {str(e)}", exc_info=True)
+            logger.error("❌ فشل في تهيئة النقاط: %s", e, exc_info=True)
             raise
         finally:
             if using_sqlite:
@@ -361,12 +535,98 @@ class DatabaseSeeder:
                 session.rollback()
             else:
                 await session.rollback()
-            logger.error(f"❌ فشل في إنشاء السجلات: {str(e)}", exc_info=True)
+            logger.error("❌ فشل في إنشاء السجلات: %s", e, exc_info=True)
             raise
         finally:
             if using_sqlite:
                 session.close()
 
+    async def _next_id(self, table: str) -> int:
+        """أول معرف متاح في الجدول (التهيئة الكبيرة تضيف إلى البيانات الحالية)"""
+        query = f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}"
+        if using_sqlite:
+            with async_engine.connect() as conn:
+                return conn.exec_driver_sql(query).scalar()
+        async with async_engine.connect() as conn:
+            return (await conn.exec_driver_sql(query)).scalar()
+
+    async def _bulk_insert(self, table: str, batches: Iterator[List[tuple]]) -> int:
+        """
+        إدراج الدفعات مباشرة عبر المشغّل دون ORM
+        PostgreSQL: COPY عبر asyncpg، SQLite: executemany داخل معاملة واحدة
+        """
+        columns = BULK_COLUMNS[table]
+        started = time.perf_counter()
+        total = 0
+        if using_sqlite:
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            with async_engine.begin() as conn:
+                # لا حاجة لانتظار الكتابة على القرص مع كل صفحة أثناء التهيئة
+                conn.exec_driver_sql("PRAGMA synchronous = OFF")
+                for batch in batches:
+                    conn.exec_driver_sql(sql, batch)
+                    total += len(batch)
+        else:
+            async with async_engine.connect() as conn:
+                raw = await conn.get_raw_connection()
+                driver = raw.driver_connection  # اتصال asyncpg
+                async with driver.transaction():
+                    for batch in batches:
+                        await driver.copy_records_to_table(table, records=batch, columns=columns)
+                        total += len(batch)
+        elapsed = time.perf_counter() - started
+        logger.info("✅ %s: تم إدراج %s صف في %.1fث (%.0f صف/ث)", table, total, elapsed, total / max(elapsed, 1e-9))
+        return total
+
+    async def _sync_sequences(self, tables: Sequence[str]) -> None:
+        """تحديث تسلسلات PostgreSQL بعد إدراج معرفات صريحة عبر COPY"""
+        if using_sqlite:
+            return
+        async with async_engine.begin() as conn:
+            for table in tables:
+                await conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+                )
+
+    async def seed_bulk(
+        self,
+        users: int = 10_000,
+        downloads: int = 1_000_000,
+        claimed_rewards: int = 100_000,
+        system_logs: int = 500_000,
+        days: int = 365,
+        batch_size: int = 20_000,
+        seed: int = 42
+    ) -> Dict[str, int]:
+        """
+        تهيئة كبيرة لقياس الاستعلامات والفهارس على حجم قريب من الإنتاج
+        تُنشئ مستخدمين جدداً مع نقاطهم ثم التحميلات والمكافآت والسجلات موزعة عليهم
+
+        Returns:
+            عدد الصفوف المدرجة في كل جدول
+        """
+        logger.info("🚀 بدء التهيئة الكبيرة (%s تحميل، %s سجل)...", downloads, system_logs)
+        first_user = await self._next_id('users')
+        first_points = await self._next_id('user_points')
+        user_ids = list(range(first_user, first_user + users))
+        points_ids = list(range(first_points, first_points + users))
+        generator = BulkDataGenerator(user_ids, points_ids, days=days, seed=seed, sqlite=using_sqlite)
+
+        inserted = {
+            'users': await self._bulk_insert('users', generator.users_rows(user_ids, batch_size)),
+            'user_points': await self._bulk_insert('user_points', generator.user_points_rows(user_ids, batch_size))
+        }
+        await self._sync_sequences(['users', 'user_points'])
+        inserted['claimed_rewards'] = await self._bulk_insert(
+            'claimed_rewards', generator.claimed_rewards_rows(claimed_rewards, batch_size)
+        )
+        inserted['downloads'] = await self._bulk_insert('downloads', generator.downloads_rows(downloads, batch_size))
+        inserted['system_logs'] = await self._bulk_insert(
+            'system_logs', generator.system_logs_rows(system_logs, batch_size)
+        )
+        logger.info("🎉 انتهت التهيئة الكبيرة: %s", inserted)
+        return inserted
+
     async def run_seeding(self):
         """تشغيل عملية التهيئة الكاملة"""
         try:
@@ -400,21 +660,41 @@ class DatabaseSeeder:
             
             logger.info("🎉 تمت عملية التهيئة بنجاح")
         except Exception as e:
-            logger.critical(f"💥 فشل في عملية التهيئة: {str(e)}", exc_info=True)
+            logger.critical("💥 فشل في عملية التهيئة: %s", e, exc_info=True)
             raise
 
-async def main():
+async def main(args: Optional[argparse.Namespace] = None):
     """الدالة الرئيسية لتنفيذ التهيئة"""
     try:
         from database import init_db
         await init_db()
         
         seeder = DatabaseSeeder()
-        await seeder.run_seeding()
+        if args is not None and args.bulk:
+            await seeder.seed_bulk(
+                users=args.users,
+                downloads=args.downloads,
+                claimed_rewards=args.claimed_rewards,
+                system_logs=args.system_logs,
+                days=args.days,
+                batch_size=args.batch_size,
+                seed=args.seed
+            )
+        else:
+            await seeder.run_seeding()
     except Exception as e:
-        logger.critical(f"🔥 فشل تنفيذ السكريبت: {str(e)}", exc_info=True)
+        logger.critical("🔥 فشل تنفيذ السكريبت: %s", e, exc_info=True)
         raise
 
 if __name__ == "__main__":
     import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="تهيئة قاعدة البيانات بالبيانات الأولية أو التجريبية")
+    parser.add_argument('--bulk', action='store_true', help="تهيئة كبيرة تضاف إلى البيانات الحالية")
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--downloads', type=int, default=1_000_000)
+    parser.add_argument('--claimed-rewards', type=int, default=100_000)
+    parser.add_argument('--system-logs', type=int, default=500_000)
+    parser.add_argument('--days', type=int, default=365, help="طول الفترة الزمنية للبيانات بالأيام")
+    parser.add_argument('--batch-size', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=42, help="بذرة العشوائية (نفس البذرة تعطي نفس البيانات)")
+    asyncio.run(main(parser.parse_args()))
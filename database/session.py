@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 from config import config
 import os
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -51,7 +52,7 @@ if using_sqlite:
             session.commit()
         except Exception as e:
             session.rollback()
-            logger.error(f"خطأ في الجلسة: {str(e)}", exc_info=True)
+            logger.error("خطأ في الجلسة: %s", e, exc_info=True)
             raise
         finally:
             session.close()
@@ -82,7 +83,7 @@ if using_sqlite:
                 
             logger.info("✅ تم تهيئة قاعدة البيانات بنجاح")
         except Exception as e:
-            logger.critical(f"فشل في تهيئة الجداول: {str(e)}", exc_info=True)
+            logger.critical("فشل في تهيئة الجداول: %s", e, exc_info=True)
             raise
     
 else:
@@ -103,7 +104,7 @@ else:
             pool_pre_ping=True  # للكشف عن الاتصالات المنقطعة
         )
     except Exception as e:
-        logger.critical(f"فشل في إنشاء محرك قاعدة البيانات: {str(e)}")
+        logger.critical("فشل في إنشاء محرك قاعدة البيانات: %s", e)
         raise
     
     # إعداد جلسة العمل غير المتزامنة
@@ -123,7 +124,7 @@ else:
                 await session.commit()
             except Exception as e:
                 await session.rollback()
-                logger.error(f"خطأ في الجلسة: {str(e)}", exc_info=True)
+                logger.error("خطأ في الجلسة: %s", e, exc_info=True)
                 raise
             finally:
                 await session.close()
@@ -151,9 +152,42 @@ else:
                 
             logger.info("✅ تم تهيئة قاعدة البيانات بنجاح")
         except Exception as e:
-            logger.critical(f"فشل في تهيئة الجداول: {str(e)}", exc_info=True)
+            logger.critical("فشل في تهيئة الجداول: %s", e, exc_info=True)
             raise
 
+async def run_in_session(func):
+    """
+    تنفيذ دالة تستقبل جلسة متزامنة دون إيقاف حلقة الأحداث
+    (في خيط منفصل على SQLite، وعبر run_sync على PostgreSQL غير المتزامن)
+    """
+    if using_sqlite:
+        def run_sync():
+            with AsyncSessionLocal() as session:
+                result = func(session)
+                session.commit()
+                return result
+        return await asyncio.to_thread(run_sync)
+
+    async with AsyncSessionLocal() as session:
+        result = await session.run_sync(func)
+        await session.commit()
+        return result
+
+def _pool_connections():
+    """اتصالات مجموعة قاعدة البيانات حسب الحالة (المجموعات بدون حجم ثابت لا تُقاس)"""
+    pool = async_engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return {}
+    return {
+        'in_use': pool.checkedout(),
+        'idle': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+        'size': pool.size()
+    }
+
+from utils.metrics import metrics
+metrics.function('db_pool_connections', 'اتصالات مجموعة قاعدة البيانات حسب الحالة', _pool_connections, ['state'])
+
 # يجب أيضًا تحديث ملف seed.py ليتوافق مع التغييرات
 __all__ = [
     'Base',
@@ -161,5 +195,6 @@ __all__ = [
     'AsyncSessionLocal',
     'get_db',
     'init_db',
+    'run_in_session',
     'using_sqlite'  # إضافة متغير جديد لمعرفة نوع قاعدة البيانات
 ]
\ No newline at end of file
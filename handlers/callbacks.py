@@ -6,10 +6,17 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
 from config import config
 from services.downloader import download_video
+from services.download_jobs import job_store, run_download_job
+from services.workspace import workspace_manager, WorkspaceFullError
+from services.rate_limiter import PlatformBlockedError
 from services.reward_service import claim_reward, get_active_rewards, get_user_points
+from services.history import history_store
+from handlers.commands import render_history_page
 from utils.helpers import format_file_size
 from utils.logger import logger
-from database.session import get_db
+from sqlalchemy import select
+from database.session import run_in_session
+from database.models import User, UserSettings
 
 class CallbackHandler:
     """معالج أحداث الضغط على الأزرار التفاعلية"""
@@ -18,7 +25,8 @@ class CallbackHandler:
         self.callback_actions = {
             'download': self.handle_download_callback,
             'buy': self.handle_reward_callback,
-            'quality': self.handle_quality_callback
+            'quality': self.handle_quality_callback,
+            'history': self.handle_history_callback
         }
 
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -33,11 +41,11 @@ class CallbackHandler:
             if handler:
                 await handler(query, data)
             else:
-                logger.warning(f"Unknown callback action: {action}")
+                logger.warning("Unknown callback action: %s", action)
                 await query.edit_message_text("⚠️ هذا الزر لم يعد يعمل، يرجى المحاولة مرة أخرى")
 
         except Exception as e:
-            logger.error(f"Callback error: {e}", exc_info=True)
+            logger.error("Callback error: %s", e, exc_info=True)
             await query.edit_message_text("❌ حدث خطأ أثناء معالجة طلبك")
 
     async def handle_download_callback(self, query, data: list) -> None:
@@ -55,34 +63,34 @@ class CallbackHandler:
             if quality == 'best' and vip_active:
                 quality = '4k'  # ترقية الجودة إذا كان لدى المستخدم مكافأة VIP
             
-            file_path = await download_video(url, quality)
-            
-            if not file_path:
-                await query.edit_message_text("❌ فشل تحميل الفيديو")
-                return
-            
-            file_size = format_file_size(os.path.getsize(file_path))
-            await query.message.reply_video(
-                video=open(file_path, 'rb'),
-                caption=f"تم التحميل بنجاح 🎬\nالجودة: {quality.upper()}\nالحجم: {file_size}",
-                supports_streaming=True
-            )
-            
-            # تحديث سجل التحميلات
-            with get_db() as conn:
-                conn.execute(
-                    """INSERT INTO downloads 
-                    (user_id, url, platform, download_date, file_size) 
-                    VALUES (?, ?, ?, ?, ?)""",
-                    (user_id, url, await self._get_platform(url), datetime.now(), os.path.getsize(file_path))
+            async with workspace_manager.job() as workspace:
+                job = await job_store.create(
+                    user_id=user_id,
+                    chat_id=query.message.chat_id,
+                    message_id=query.message.message_id,
+                    url=url,
+                    quality=quality,
+                    max_size_mb=config.EFFECTIVE_MAX_FILE_SIZE_MB
+                )
+                result = await run_download_job(
+                    job,
+                    query.message,
+                    workspace,
+                    title=f"⏳ جاري تحميل الفيديو بجودة {quality}..."
                 )
-                conn.commit()
             
-            await query.delete_message()
-            os.remove(file_path)
+                if not result:
+                    await query.edit_message_text("❌ فشل تحميل الفيديو")
+                    return
             
+                await query.delete_message()
+            
+        except WorkspaceFullError:
+            await query.edit_message_text("⏳ الخادم مشغول حالياً، يرجى المحاولة بعد قليل")
+        except PlatformBlockedError as e:
+            await query.edit_message_text(f"⏳ المنصة تقيد الطلبات حالياً، يرجى المحاولة بعد {int(e.retry_after // 60) + 1} دقيقة")
         except Exception as e:
-            logger.error(f"Download callback failed: {e}")
+            logger.error("Download callback failed: %s", e)
             await query.edit_message_text("❌ حدث خطأ غير متوقع أثناء التحميل")
 
     async def handle_reward_callback(self, query, data: list) -> None:
@@ -114,24 +122,44 @@ class CallbackHandler:
             )
             
         except Exception as e:
-            logger.error(f"Reward purchase failed: {e}")
+            logger.error("Reward purchase failed: %s", e)
             await query.answer("❌ فشلت عملية الشراء", show_alert=True)
 
     async def handle_quality_callback(self, query, data: list) -> None:
         """تغيير جودة التحميل المفضلة"""
         quality = data[0]
         user_id = query.from_user.id
-        
-        with get_db() as conn:
-            conn.execute(
-                "UPDATE settings SET default_quality = ? WHERE user_id = ?",
-                (quality, user_id)
-            )
-            conn.commit()
-        
+
+        def save(session) -> None:
+            db_user_id = session.execute(select(User.id).where(User.telegram_id == user_id)).scalar()
+            if db_user_id is None:
+                return
+            settings = session.execute(
+                select(UserSettings).where(UserSettings.user_id == db_user_id)
+            ).scalar_one_or_none()
+            if settings is None:
+                session.add(UserSettings(user_id=db_user_id, default_quality=quality))
+            else:
+                settings.default_quality = quality
+
+        await run_in_session(save)
+
         await query.answer(f"تم تعيين الجودة الافتراضية إلى {quality.upper()}")
         await query.edit_message_reply_markup(self._build_quality_keyboard(quality))
 
+    async def handle_history_callback(self, query, data: list) -> None:
+        """التنقل بين صفحات سجل التحميلات (history:o|n:الموضع:المنصة:الحالة)"""
+        direction, cursor, platform, status = (data + [''] * 4)[:4]
+        page = await history_store.page(
+            query.from_user.id,
+            cursor=cursor or None,
+            newer=direction == 'n',
+            platform=platform or None,
+            status=status or None
+        )
+        history_text, keyboard = render_history_page(page, platform, status)
+        await query.edit_message_text(history_text, parse_mode='HTML', reply_markup=keyboard)
+
     def _build_quality_keyboard(self, selected_quality: str) -> InlineKeyboardMarkup:
         """بناء لوحة أزرار اختيار الجودة"""
         qualities = [
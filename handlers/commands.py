@@ -1,8 +1,9 @@
 import os
 import re
+import html
 import logging
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
 from telegram import (
     Update,
@@ -17,10 +18,19 @@ from database.session import get_db
 from services.downloader import (
     download_video,
     get_video_info,
+    fetch_video_info,
     clean_url,
     compress_video,
+    compress_from_url,
     download_with_ytdlp
 )
+from services.progress import ProgressReporter
+from services.uploader import upload_video
+from services.workspace import workspace_manager, WorkspaceFullError
+from services.rate_limiter import PlatformBlockedError
+from services.profile_sync import profile_sync
+from services.history import history_store, HISTORY_PLATFORMS, HISTORY_STATUSES
+from handlers.messages import message_handler
 from services.reward_service import (
     get_user_points,
     get_active_rewards,
@@ -73,7 +83,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             conn.commit()
             
     except Exception as e:
-        logger.error(f"خطأ في أمر start: {e}")
+        logger.error("خطأ في أمر start: %s", e)
         await update.message.reply_text("❌ حدث خطأ أثناء تحميل رسالة الترحيب")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -86,9 +96,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 /info [رابط] - عرض معلومات الفيديو
 /formats [رابط] - عرض جودات التحميل
 /compress [حجم] [رابط] - ضغط الفيديو (مثال: /compress 25MB رابط)
+/latest [رابط حساب أو قصة] - تحميل الجديد فقط منذ طلبك السابق
 
 📊 <u>أوامر الحساب:</u>
-/history - سجل التحميلات (آخر 10)
+/history [منصة] [حالة] - سجل التحميلات مع التنقل بين الصفحات
 /settings - ضبط إعدادات الجودة والحجم
 /rewards - نظام المكافآت والنقاط
 
@@ -106,7 +117,7 @@ async def video_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             await update.message.reply_text("⚠️ يرجى إرسال رابط الفيديو مع الأمر\nمثال: /info https://youtu.be/xyz")
             return
 
-        url = clean_url(' '.join(context.args))
+        url = await clean_url(' '.join(context.args))
         if not validate_url(url):
             await update.message.reply_text("❌ الرابط غير مدعوم أو غير صالح")
             return
@@ -131,10 +142,10 @@ async def video_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             try:
                 await update.message.reply_photo(video_data['thumbnail'])
             except Exception as e:
-                logger.warning(f"فشل إرسال الصورة المصغرة: {e}")
+                logger.warning("فشل إرسال الصورة المصغرة: %s", e)
 
     except Exception as e:
-        logger.error(f"خطأ في أمر video_info: {e}")
+        logger.error("خطأ في أمر video_info: %s", e)
         await update.message.reply_text("❌ حدث خطأ أثناء معالجة طلبك")
 
 async def list_formats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -144,7 +155,7 @@ async def list_formats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             await update.message.reply_text("⚠️ يرجى إرسال رابط الفيديو مع الأمر\nمثال: /formats https://youtu.be/xyz")
             return
 
-        url = clean_url(' '.join(context.args))
+        url = await clean_url(' '.join(context.args))
         if not validate_url(url):
             await update.message.reply_text("❌ الرابط غير مدعوم أو غير صالح")
             return
@@ -189,7 +200,7 @@ async def list_formats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
 
     except Exception as e:
-        logger.error(f"خطأ في أمر list_formats: {e}")
+        logger.error("خطأ في أمر list_formats: %s", e)
         await update.message.reply_text("❌ حدث خطأ أثناء جلب الجودات المتاحة")
 
 async def compress_video_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -215,73 +226,151 @@ async def compress_video_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("⚠️ حجم غير صالح. يرجى استخدام أرقام فقط (مثال: 25MB)")
             return
 
-        url = clean_url(' '.join(context.args[1:]))
+        url = await clean_url(' '.join(context.args[1:]))
         if not validate_url(url):
             await update.message.reply_text("❌ الرابط غير مدعوم أو غير صالح")
             return
 
         msg = await update.message.reply_text(f"⏳ جاري تحميل الفيديو للضغط إلى {target_size}MB...")
 
-        video_path = await download_with_ytdlp(url)
-        if not video_path:
+        # استخراج واحد يُستخدم في البث وفي التحميل الكامل عند الرجوع إليه
+        info = await fetch_video_info(url)
+        if not info:
             await msg.edit_text("❌ فشل تحميل الفيديو. يرجى التأكد من الرابط")
             return
 
-        await msg.edit_text("🔧 جاري ضغط الفيديو...")
-        compressed_path = await compress_video(video_path, target_size)
-
-        file_size = os.path.getsize(compressed_path) / (1024 * 1024)
-        await msg.edit_text(f"✅ تم ضغط الفيديو بنجاح إلى {file_size:.1f}MB")
-
-        await update.message.reply_video(
-            video=open(compressed_path, 'rb'),
-            caption=f"تم ضغط الفيديو إلى {file_size:.1f}MB",
-            supports_streaming=True
-        )
-
-        # تنظيف الملفات المؤقتة
-        os.remove(video_path)
-        os.remove(compressed_path)
+        # الحجز للملف الأصلي (الأكبر) بحجمه المعروف من المنصة، وإلا بحد الخادم، ثم الناتج المضغوط
+        source_bytes = info.get('filesize') or info.get('filesize_approx')
+        source_mb = source_bytes / (1024 * 1024) if source_bytes else config.EFFECTIVE_MAX_FILE_SIZE_MB
+
+        # الملفات الأصلية والمضغوطة تُحذف مع مجلد المهمة
+        async with workspace_manager.job(reserve_mb=source_mb + target_size) as workspace:
+            # محاولة الضغط أثناء التحميل أولاً (بدون ملف وسيط)
+            progress = ProgressReporter(msg, f"🔧 جاري تحميل وضغط الفيديو إلى {target_size}MB...")
+            compressed_path = await compress_from_url(
+                url,
+                str(workspace.path / 'compressed.mp4'),
+                target_size,
+                progress=progress,
+                user_id=update.message.from_user.id,
+                info=info
+            )
+            await progress.close()
+
+            if not compressed_path:
+                # الحاوية تحتاج التنقل أو فشل البث: تحميل الملف كاملاً ثم ضغطه
+                progress = ProgressReporter(msg, f"⏳ جاري تحميل الفيديو للضغط إلى {target_size}MB...")
+                video_path = await download_with_ytdlp(
+                    url,
+                    progress=progress,
+                    output_dir=str(workspace.path),
+                    info=info
+                )
+                await progress.close()
+                if not video_path:
+                    await msg.edit_text("❌ فشل تحميل الفيديو. يرجى التأكد من الرابط")
+                    return
+
+                await msg.edit_text("🔧 جاري ضغط الفيديو...")
+                progress = ProgressReporter(msg, "🔧 جاري ضغط الفيديو...")
+                compressed_path = await compress_video(
+                    video_path,
+                    target_size,
+                    progress=progress,
+                    user_id=update.message.from_user.id
+                )
+                await progress.close()
+
+            if not compressed_path:
+                await msg.edit_text(f"❌ تعذر ضغط الفيديو إلى {target_size}MB")
+                return
+
+            file_size = os.path.getsize(compressed_path) / (1024 * 1024)
+            await msg.edit_text(f"✅ تم ضغط الفيديو بنجاح إلى {file_size:.1f}MB")
+
+            await upload_video(
+                chat_id=update.message.chat_id,
+                file_path=compressed_path,
+                caption=f"تم ضغط الفيديو إلى {file_size:.1f}MB"
+            )
 
+    except WorkspaceFullError:
+        await update.message.reply_text("⏳ الخادم مشغول حالياً، يرجى المحاولة بعد قليل")
+    except PlatformBlockedError as e:
+        await update.message.reply_text(f"⏳ المنصة تقيد الطلبات حالياً، يرجى المحاولة بعد {int(e.retry_after // 60) + 1} دقيقة")
     except Exception as e:
-        logger.error(f"خطأ في أمر compress: {e}")
+        logger.error("خطأ في أمر compress: %s", e)
         await update.message.reply_text("❌ حدث خطأ أثناء معالجة الفيديو")
 
 # ========== أوامر إدارة الحساب ==========
 
+# أسماء الفلاتر التي يكتبها المستخدم بعد /history
+HISTORY_FILTER_WORDS = {
+    'youtube': ('platform', 'yt'),
+    'tiktok': ('platform', 'tt'),
+    'instagram': ('platform', 'ig'),
+    'twitter': ('platform', 'x'),
+    'x': ('platform', 'x'),
+    'facebook': ('platform', 'fb'),
+    'completed': ('status', 'c'),
+    'failed': ('status', 'f'),
+    'pending': ('status', 'p')
+}
+HISTORY_STATUS_ICONS = {'completed': "✅", 'failed': "❌", 'pending': "⏳"}
+
+def render_history_page(page: Dict[str, Any], platform: str = '', status: str = '') -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """نص صفحة السجل وأزرار التنقل (كل زر يحمل موضع الصفحة والفلاتر)"""
+    filters_text = ' | '.join(
+        value for value in (HISTORY_PLATFORMS.get(platform), HISTORY_STATUSES.get(status)) if value
+    )
+    history_text = "⏳ <b>سجل التحميلات</b>"
+    if filters_text:
+        history_text += f" ({filters_text})"
+    history_text += "\n━━━━━━━━━━━━━━\n"
+
+    if not page['items']:
+        return history_text + "📭 لا توجد تحميلات مطابقة.", None
+
+    for idx, item in enumerate(page['items'], 1):
+        date = item['download_date'].strftime('%d/%m/%Y %H:%M')
+        status_icon = HISTORY_STATUS_ICONS.get(item['status'], "❔")
+        history_text += (
+            f"{idx}. {status_icon} <b>{item['platform']}</b>\n"
+            f"   📅 {date} | 📦 {format_file_size(item['file_size'] or 0)}\n"
+            f"   🔗 {html.escape(item['url'][:30])}...\n\n"
+        )
+
+    buttons = []
+    if page['newer']:
+        buttons.append(InlineKeyboardButton("⏩ الأحدث", callback_data=f"history:n:{page['newer']}:{platform}:{status}"))
+    if page['older']:
+        buttons.append(InlineKeyboardButton("الأقدم ⏪", callback_data=f"history:o:{page['older']}:{platform}:{status}"))
+    return history_text, InlineKeyboardMarkup([buttons]) if buttons else None
+
 async def download_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """عرض سجل التحميلات للمستخدم"""
+    """عرض سجل التحميلات للمستخدم (مع فلاتر اختيارية: /history youtube failed)"""
     try:
         user_id = update.message.from_user.id
-        
-        with get_db() as conn:
-            history = conn.execute(
-                """SELECT url, platform, download_date, file_size, status 
-                FROM downloads 
-                WHERE user_id = ? 
-                ORDER BY download_date DESC 
-                LIMIT 10""",
-                (user_id,)
-            ).fetchall()
-
-        if not history:
+        filters = {'platform': '', 'status': ''}
+        for word in context.args or []:
+            match = HISTORY_FILTER_WORDS.get(word.lower())
+            if not match:
+                await update.message.reply_text(
+                    "⚠️ الفلاتر المتاحة: youtube, tiktok, instagram, twitter, facebook, completed, failed, pending"
+                )
+                return
+            filters[match[0]] = match[1]
+
+        page = await history_store.page(user_id, **{key: value or None for key, value in filters.items()})
+        if not page['items'] and not any(filters.values()):
             await update.message.reply_text("📭 لم تقم بأي تحميلات بعد.")
             return
 
-        history_text = "⏳ <b>سجل آخر 10 تحميلات:</b>\n━━━━━━━━━━━━━━\n"
-        for idx, item in enumerate(history, 1):
-            date = datetime.strptime(item['download_date'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M')
-            status_icon = "✅" if item['status'] == 'completed' else "❌"
-            history_text += (
-                f"{idx}. {status_icon} <b>{item['platform']}</b>\n"
-                f"   📅 {date} | 📦 {format_file_size(item['file_size'])}\n"
-                f"   🔗 {item['url'][:30]}...\n\n"
-            )
-
-        await update.message.reply_text(history_text, parse_mode='HTML')
+        history_text, keyboard = render_history_page(page, **filters)
+        await update.message.reply_text(history_text, parse_mode='HTML', reply_markup=keyboard)
 
     except Exception as e:
-        logger.error(f"خطأ في أمر history: {e}")
+        logger.error("خطأ في أمر history: %s", e)
         await update.message.reply_text("❌ حدث خطأ أثناء جلب سجل التحميلات")
 
 async def settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -324,7 +413,7 @@ async def settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
 
     except Exception as e:
-        logger.error(f"خطأ في أمر settings: {e}")
+        logger.error("خطأ في أمر settings: %s", e)
         await update.message.reply_text("❌ حدث خطأ أثناء تحميل الإعدادات")
 
 async def rewards_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -363,9 +452,25 @@ async def rewards_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
 
     except Exception as e:
-        logger.error(f"خطأ في أمر rewards: {e}")
+        logger.error("خطأ في أمر rewards: %s", e)
         await update.message.reply_text("❌ حدث خطأ أثناء تحميل نظام المكافآت")
 
+async def latest_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """تحميل العناصر الجديدة من حساب تيك توك/إنستغرام أو من قصص إنستغرام"""
+    if not context.args:
+        await update.message.reply_text(
+            "👤 يرجى إرسال رابط الحساب أو القصة\n"
+            "مثال: /latest https://www.tiktok.com/@username"
+        )
+        return
+
+    url = context.args[0]
+    if not profile_sync.match(url):
+        await update.message.reply_text("❌ الرابط ليس حساباً أو قصة مدعومة")
+        return
+
+    await message_handler.handle_profile_url(update, context, url)
+
 # ========== تسجيل الأوامر ==========
 
 def setup(application):
@@ -376,6 +481,7 @@ def setup(application):
         ('info', video_info),
         ('formats', list_formats),
         ('compress', compress_video_cmd),
+        ('latest', latest_command),
         ('history', download_history),
         ('settings', settings_menu),
         ('rewards', rewards_command)
@@ -2,13 +2,22 @@ import re
 import logging
 from typing import Dict, Any
 from telegram import Update, ReplyKeyboardMarkup
-from telegram.ext import ContextTypes, MessageHandler, filters
+from telegram.ext import ContextTypes, MessageHandler as TelegramMessageHandler, filters
 from config import config
 from services.downloader import download_video, get_video_info, clean_url
+from services.download_jobs import job_store, run_download_job
+from services.compression_planner import CompressionFailedError
+from services.playlist import playlist_downloader
+from services.profile_sync import profile_sync
+from services.workspace import workspace_manager, WorkspaceFullError
+from services.rate_limiter import PlatformBlockedError
 from services.reward_service import get_user_points
 from utils.helpers import format_file_size
 from utils.logger import logger
-from database.session import get_db
+from utils.tracing import traced
+from sqlalchemy import select
+from database.session import get_db, run_in_session
+from database.models import User, UserSettings
 
 class MessageHandler:
     """معالج الرسائل النصية الواردة من المستخدمين"""
@@ -30,6 +39,17 @@ class MessageHandler:
             if await self._check_settings_state(update, context, text):
                 return
                 
+            # قوائم التشغيل تُحمّل في الخلفية كمهام فرعية حتى لا يتوقف المعالج
+            if playlist_downloader.is_playlist(text):
+                await self.handle_playlist_url(update, context, text)
+                return
+                
+            # روابط الحسابات والقصص: تحميل ما لم يستلمه المستخدم منها فقط
+            # (قبل الروابط المباشرة لأن SUPPORTED_PATTERNS تطابق روابط القصص أيضاً)
+            if profile_sync.match(text):
+                await self.handle_profile_url(update, context, text)
+                return
+                
             # معالجة الروابط المباشرة
             if await self._is_supported_url(text):
                 await self.handle_video_url(update, text)
@@ -39,7 +59,7 @@ class MessageHandler:
             await self._handle_text_commands(update, text)
                 
         except Exception as e:
-            logger.error(f"Message handling error: {e}", exc_info=True)
+            logger.error("Message handling error: %s", e, exc_info=True)
             await update.message.reply_text("❌ حدث خطأ غير متوقع أثناء معالجة رسالتك")
 
     async def _check_settings_state(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> bool:
@@ -51,6 +71,7 @@ class MessageHandler:
             return True
         return False
 
+    @traced('url.parse')
     async def _is_supported_url(self, text: str) -> bool:
         """التحقق مما إذا كان النص يحتوي على رابط مدعوم"""
         cleaned_url = await clean_url(text)
@@ -63,49 +84,110 @@ class MessageHandler:
         
         try:
             # الحصول على إعدادات المستخدم
-            with get_db() as conn:
-                settings = conn.execute(
-                    "SELECT default_quality, max_size FROM settings WHERE user_id = ?",
-                    (user.id,)
-                ).fetchone() or {'default_quality': 'best', 'max_size': 50}
+            settings = await self._get_user_settings(user.id)
+            max_size = min(settings['max_size'], config.EFFECTIVE_MAX_FILE_SIZE_MB)
             
-            # تحميل الفيديو
-            file_path = await download_video(url, settings['default_quality'])
-            if not file_path:
-                await msg.edit_text("❌ فشل تحميل الفيديو، يرجى التحقق من الرابط")
-                return
-            
-            # التحقق من الحجم
-            file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-            if file_size_mb > settings['max_size']:
-                await msg.edit_text(f"⚠️ جاري ضغط الفيديو (الحد الأقصى: {settings['max_size']}MB)...")
-                file_path = await compress_video(file_path, settings['max_size'])
-                file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-            
-            # إرسال الفيديو
-            await update.message.reply_video(
-                video=open(file_path, 'rb'),
-                caption=f"تم التحميل بنجاح 🎬\nالحجم: {format_file_size(file_size_mb * 1024 * 1024)}",
-                supports_streaming=True
-            )
-            
-            # تسجيل التحميل
-            with get_db() as conn:
-                conn.execute(
-                    """INSERT INTO downloads 
-                    (user_id, url, platform, download_date, file_size) 
-                    VALUES (?, ?, ?, ?, ?)""",
-                    (user.id, url, await self._get_platform(url), datetime.now(), file_size_mb * 1024 * 1024)
+            # مجلد مؤقت للمهمة يُحذف بكل ملفاته عند الانتهاء أو الفشل،
+            # والمهمة مسجلة في مخزن المهام لتُستأنف إذا أُعيد تشغيل الخادم أثناء التحميل
+            async with workspace_manager.job(reserve_mb=max_size * 2) as workspace:
+                job = await job_store.create(
+                    user_id=user.id,
+                    chat_id=update.message.chat_id,
+                    message_id=msg.message_id,
+                    url=url,
+                    quality=settings['default_quality'],
+                    max_size_mb=max_size,
+                    compress=True
                 )
-                conn.commit()
-            
-            await msg.delete()
-            os.remove(file_path)
+                result = await run_download_job(job, msg, workspace)
+                if not result:
+                    await msg.edit_text("❌ فشل تحميل الفيديو، يرجى التحقق من الرابط")
+                    return
+
+                await msg.delete()
             
+        except CompressionFailedError as e:
+            await msg.edit_text(f"❌ تعذر ضغط الفيديو إلى {e.target_size_mb:g}MB")
+        except WorkspaceFullError:
+            await msg.edit_text("⏳ الخادم مشغول حالياً، يرجى المحاولة بعد قليل")
+        except PlatformBlockedError as e:
+            await msg.edit_text(f"⏳ المنصة تقيد الطلبات حالياً، يرجى المحاولة بعد {int(e.retry_after // 60) + 1} دقيقة")
         except Exception as e:
-            logger.error(f"Video URL handling failed: {e}")
+            logger.error("Video URL handling failed: %s", e)
             await msg.edit_text("❌ حدث خطأ أثناء معالجة الفيديو")
 
+    async def handle_playlist_url(self, update: Update, context: ContextTypes.DEFAULT_TYPE, url: str) -> None:
+        """بدء تحميل قائمة تشغيل في الخلفية"""
+        user = update.message.from_user
+        msg = await update.message.reply_text("📃 جاري قراءة قائمة التشغيل...")
+        settings = await self._get_user_settings(user.id)
+        max_size = min(settings['max_size'], config.EFFECTIVE_MAX_FILE_SIZE_MB)
+        context.application.create_task(
+            self._run_batch(
+                msg,
+                playlist_downloader.download(url, msg, user.id, quality=settings['default_quality'], max_size_mb=max_size),
+                "❌ لم يتم العثور على فيديوهات في قائمة التشغيل"
+            ),
+            update=update
+        )
+
+    async def handle_profile_url(self, update: Update, context: ContextTypes.DEFAULT_TYPE, url: str) -> None:
+        """بدء تحميل العناصر الجديدة من حساب أو قصة في الخلفية"""
+        user = update.message.from_user
+        msg = await update.message.reply_text("👤 جاري البحث عن العناصر الجديدة...")
+        settings = await self._get_user_settings(user.id)
+        max_size = min(settings['max_size'], config.EFFECTIVE_MAX_FILE_SIZE_MB)
+        context.application.create_task(
+            self._run_batch(
+                msg,
+                profile_sync.sync(url, msg, user.id, quality=settings['default_quality'], max_size_mb=max_size),
+                "✅ لا توجد عناصر جديدة منذ طلبك السابق"
+            ),
+            update=update
+        )
+
+    async def _run_batch(self, msg, batch, empty_text: str) -> None:
+        """تنفيذ تحميل دفعة (قائمة أو حساب) وعرض الملخص النهائي في رسالتها"""
+        try:
+            stats = await batch
+            if not stats or not stats['found']:
+                await msg.edit_text(empty_text)
+                return
+            await msg.edit_text(
+                f"✅ اكتمل التحميل\n"
+                f"تم إرسال {stats['completed']} من {stats['found']} فيديو"
+                + (f"\n❌ تعذر تحميل {stats['failed']}" if stats['failed'] else "")
+                + (f"\n⏭ تم تخطي {stats['skipped']} مستلمة سابقاً" if stats.get('skipped') else "")
+            )
+        except PlatformBlockedError as e:
+            await msg.edit_text(f"⏳ المنصة تقيد الطلبات حالياً، يرجى المحاولة بعد {int(e.retry_after // 60) + 1} دقيقة")
+        except Exception as e:
+            logger.error("Batch handling failed: %s", e)
+            await msg.edit_text("❌ حدث خطأ أثناء قراءة الروابط")
+
+    async def _get_user_settings(self, user_id: int) -> Dict[str, Any]:
+        """إعدادات التحميل الخاصة بالمستخدم أو القيم الافتراضية (عند عدم وجودها أو تعذر قراءتها)"""
+        defaults = {'default_quality': 'best', 'max_size': config.EFFECTIVE_MAX_FILE_SIZE_MB}
+
+        def load(session):
+            return session.execute(
+                select(UserSettings.default_quality, UserSettings.max_file_size)
+                .join(User, User.id == UserSettings.user_id)
+                .where(User.telegram_id == user_id)
+            ).first()
+
+        try:
+            row = await run_in_session(load)
+        except Exception as e:
+            logger.warning("تعذر قراءة إعدادات المستخدم %s: %s", user_id, e)
+            return defaults
+        if row is None:
+            return defaults
+        return {
+            'default_quality': row.default_quality or defaults['default_quality'],
+            'max_size': row.max_file_size or defaults['max_size']
+        }
+
     async def _handle_text_commands(self, update: Update, text: str) -> None:
         """معالجة الأوامر النصية غير المرتبطة بالإعدادات"""
         user = update.message.from_user
@@ -167,6 +249,9 @@ class MessageHandler:
             max_size = int(text)
             if max_size <= 0:
                 raise ValueError
+            if max_size > config.EFFECTIVE_MAX_FILE_SIZE_MB:
+                await update.message.reply_text(f"⚠️ الحد الأقصى المسموح به هو {config.EFFECTIVE_MAX_FILE_SIZE_MB}MB")
+                return
                 
             with get_db() as conn:
                 conn.execute(
@@ -259,5 +344,5 @@ message_handler = MessageHandler()
 
 # دالة التسجيل للاستخدام في التطبيق
 def setup(application):
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler.handle_message))
+    application.add_handler(TelegramMessageHandler(filters.TEXT & ~filters.COMMAND, message_handler.handle_message))
     logger.info("تم تسجيل معالج الرسائل النصية")
\ No newline at end of file
@@ -10,6 +10,7 @@ from webhooks.telegram import TelegramWebhookManager
 from utils.logger import logger
 import uvicorn
 import os
+import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -23,13 +24,37 @@ async def lifespan(app: FastAPI):
         logger.info("✅ تم تهيئة قاعدة البيانات")
         
         # تهيئة بوت تليجرام
-        from handlers import setup_commands, setup_callbacks
-        application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
-        setup_commands(application)
-        setup_callbacks(application)
+        from handlers import setup_all
+        api_base = config.TELEGRAM_API_BASE_URL.rstrip('/')
+        application = (
+            Application.builder()
+            .token(config.TELEGRAM_TOKEN)
+            .base_url(f"{api_base}/bot")
+            .base_file_url(f"{api_base}/file/bot")
+            .local_mode(config.TELEGRAM_LOCAL_MODE)
+            .build()
+        )
+        if config.TELEGRAM_LOCAL_MODE:
+            logger.info("📡 استخدام خادم Bot API محلي: %s (حد الحجم %sMB)", api_base, config.EFFECTIVE_MAX_FILE_SIZE_MB)
+        setup_all(application)
+        # process_update يرفض التحديثات قبل تهيئة التطبيق (وتهيئة البوت تجلب بياناته عبر getMe)
+        await application.initialize()
         app.state.application = application
         app.state.webhook_manager = TelegramWebhookManager(application)
         
+        # تجهيز نسخ yt-dlp لملفات الإعدادات المسجلة (تُسجل عند استيراد المعالجات لـ downloader)
+        from services.ydl_pool import ydl_pool
+        await asyncio.to_thread(ydl_pool.warm)
+        
+        # استئناف التحميلات التي قطعها إيقاف الخادم (قبل الكنس حتى تبقى ملفات .part)
+        from services.workspace import workspace_manager
+        if config.JOB_RESUME_ENABLED:
+            from services.download_jobs import download_resumer
+            await download_resumer.resume_all(application.bot)
+        
+        # كنس الملفات المؤقتة المتروكة من تشغيل سابق وبدء الكنس الدوري
+        await workspace_manager.start()
+        
         if config.ENV == "prod":
             logger.info("🔄 إعداد Webhook في بيئة الإنتاج...")
             await app.state.webhook_manager.setup_webhook()
@@ -49,9 +74,28 @@ async def lifespan(app: FastAPI):
             from database.session import async_engine
             await async_engine.dispose()
         
+        # إغلاق عملاء HTTP المشتركة للرفع والتحميل المتوازي
+        from services.uploader import uploader
+        from services.range_downloader import range_downloader
+        await uploader.close()
+        await range_downloader.close()
+        
+        from services.ydl_pool import ydl_pool
+        ydl_pool.close()
+        
+        # تصدير الـ spans المتبقية
+        from utils.tracing import tracer
+        tracer.shutdown()
+        
+        from services.workspace import workspace_manager
+        await workspace_manager.stop()
+        
         # إزالة webhook في بيئة الإنتاج
         if config.ENV == "prod":
             await app.state.webhook_manager.delete_webhook()
+        
+        if hasattr(app.state, "application"):
+            await app.state.application.shutdown()
             
         logger.info("✅ تم إيقاف التطبيق بنجاح")
 
@@ -73,8 +117,9 @@ app.add_middleware(
 )
 
 # استيراد واجهات API
-from api import router
+from api import router, global_exception_handler
 app.include_router(router)
+app.add_exception_handler(Exception, global_exception_handler)
 
 if __name__ == "__main__":
     # تحديد المنفذ من المتغيرات البيئية أو الإعدادات
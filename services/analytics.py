@@ -44,7 +44,7 @@ class AnalyticsService:
             }
 
         except Exception as e:
-            logger.error(f"Download stats error: {str(e)}")
+            logger.error("Download stats error: %s", e)
             return {}
 
     async def get_platform_distribution(self) -> Dict[str, float]:
@@ -61,7 +61,7 @@ class AnalyticsService:
                 for item in result
             }
         except Exception as e:
-            logger.error(f"Platform distribution error: {str(e)}")
+            logger.error("Platform distribution error: %s", e)
             return {}
 
     # ---------------------- تحليلات المستخدمين ----------------------
@@ -85,7 +85,7 @@ class AnalyticsService:
             
             return activity
         except Exception as e:
-            logger.error(f"User activity error: {str(e)}")
+            logger.error("User activity error: %s", e)
             return {}
 
     def _get_weekly_activity(self, user_id: int, start_date: datetime) -> Dict[str, int]:
@@ -115,7 +115,7 @@ class AnalyticsService:
             }
             return stats
         except Exception as e:
-            logger.error(f"System health error: {str(e)}")
+            logger.error("System health error: %s", e)
             return {}
 
     def _get_database_status(self) -> Dict[str, Any]:
@@ -137,7 +137,7 @@ class AnalyticsService:
                 "redemption_rate": self._calculate_redemption_rate()
             }
         except Exception as e:
-            logger.error(f"Reward analytics error: {str(e)}")
+            logger.error("Reward analytics error: %s", e)
             return {}
 
     def _get_popular_rewards(self) -> List[Dict]:
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import config
+from utils.helpers import format_file_size
+from utils.logger import logger
+from services.media_probe import MediaProbe, probe_media
+from services.progress import ProgressReporter, run_ffmpeg_with_progress
+from services.transcode_scheduler import transcode_scheduler
+
+# سلم الدقات المسموح بها (الارتفاع) من الأعلى إلى الأدنى
+RESOLUTION_LADDER = [1080, 720, 540, 480, 360, 240]
+
+# أقل عدد بتات لكل بكسل في الإطار يعطي صورة مقبولة مع libx264
+MIN_BITS_PER_PIXEL = 0.06
+
+# نسبة حاوية MP4 (moov, headers) من الحجم الكلي
+CONTAINER_OVERHEAD = 0.02
+
+# سلم معدل بت الصوت: (أقل معدل كلي kbps, معدل الصوت kbps)
+AUDIO_LADDER = [(1500, 128), (600, 96), (250, 64), (0, 32)]
+
+# حدود تكلفة الترميز (بكسل × إطار) لاختيار preset
+PRESET_LADDER = [(2e9, 'slow'), (2e10, 'medium'), (1e11, 'fast'), (float('inf'), 'veryfast')]
+
+# دالة الترميز: (المدخل, المخرج, معاملات الفيديو, معاملات الصوت, مراسل التقدم, المدة, threads=)
+EncodeFunc = Callable[
+    [str, str, List[str], List[str], Optional[ProgressReporter], float],
+    Awaitable[bool]
+]
+
+class CompressionFailedError(RuntimeError):
+    """تعذر ضغط الفيديو إلى الحجم المستهدف (compress أعاد None)"""
+
+    def __init__(self, target_size_mb: float):
+        super().__init__(f"تعذر ضغط الفيديو إلى {target_size_mb:g}MB")
+        self.target_size_mb = target_size_mb
+
+class CompressionPlanner:
+    """
+    مخطط الضغط حسب الحجم المستهدف
+    يختار الدقة ومعدل الإطارات و preset ومعدل الصوت من الحجم المطلوب وفحص المصدر،
+    ويعيد الترميز بميزانية أقل إذا تجاوز الناتج الحد، ويسجل الحجم المتوقع مقابل الفعلي
+    """
+
+    def __init__(self):
+        self.safety_margin = config.COMPRESSION_SAFETY_MARGIN
+        self.max_attempts = config.COMPRESSION_MAX_ATTEMPTS
+        self.stats_file = Path(config.COMPRESSION_STATS_FILE)
+
+    def plan(
+        self,
+        info: Dict[str, Any],
+        target_size_mb: float,
+        budget_scale: float = 1.0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        حساب خطة الضغط
+        Args:
+            info: نتيجة فحص ffprobe للملف المصدر
+            target_size_mb: الحجم المستهدف بالميجابايت
+            budget_scale: معامل تصغير الميزانية (من المعايرة أو المحاولات السابقة)
+        Returns:
+            قاموس الخطة أو None إذا تعذر حساب المدة
+        """
+        source = self._source_params(info)
+        duration = source['duration']
+        if duration <= 0:
+            return None
+
+        target_bytes = int(target_size_mb * 1024 * 1024)
+        usable_bytes = target_bytes * (1 - CONTAINER_OVERHEAD) * self.safety_margin * budget_scale
+        total_kbps = usable_bytes * 8 / duration / 1000
+
+        # الصوت أولاً لأنه يأخذ جزءاً ثابتاً من الميزانية
+        audio_kbps = 0
+        if source['has_audio']:
+            audio_kbps = next(kbps for threshold, kbps in AUDIO_LADDER if total_kbps >= threshold)
+            if source['audio_kbps']:
+                audio_kbps = min(audio_kbps, source['audio_kbps'])
+        video_kbps = max(int(total_kbps - audio_kbps), 50)
+
+        fps = source['fps']
+        if fps > 30 and video_kbps < 4000:
+            fps = 30.0
+
+        # أعلى دقة (بدون تكبير) تحقق الحد الأدنى من البتات لكل بكسل
+        aspect = source['width'] / source['height'] if source['height'] else 16 / 9
+        native_height = min(source['height'] or RESOLUTION_LADDER[0], RESOLUTION_LADDER[0])
+        candidates = [native_height] + [h for h in RESOLUTION_LADDER if h < native_height]
+        for height in candidates:
+            if video_kbps * 1000 / (height * height * aspect * fps) >= MIN_BITS_PER_PIXEL:
+                break
+        width = int(height * aspect) // 2 * 2
+
+        if video_kbps * 1000 / (width * height * fps) < MIN_BITS_PER_PIXEL and fps > 24:
+            fps = 24.0
+
+        pixel_frames = width * height * fps * duration
+        preset = next(name for limit, name in PRESET_LADDER if pixel_frames < limit)
+
+        return {
+            'duration': duration,
+            'width': width,
+            'height': height,
+            'fps': fps,
+            'scale': height < source['height'],
+            'video_kbps': video_kbps,
+            'audio_kbps': audio_kbps,
+            'preset': preset,
+            'target_bytes': target_bytes,
+            'predicted_bytes': int((video_kbps + audio_kbps) * 1000 / 8 * duration / (1 - CONTAINER_OVERHEAD))
+        }
+
+    def build_args(self, plan: Dict[str, Any], crf: Optional[int] = None) -> List[str]:
+        """
+        تحويل الخطة إلى معاملات ffmpeg الكاملة
+        Args:
+            plan: خطة الضغط
+            crf: عند تمريره يُستخدم CRF مع سقف معدل البت بدل معدل البت المتوسط
+        """
+        return self.build_video_args(plan, crf) + self.build_audio_args(plan) + ['-movflags', '+faststart']
+
+    def build_video_args(self, plan: Dict[str, Any], crf: Optional[int] = None) -> List[str]:
+        """معاملات ترميز مسار الفيديو فقط"""
+        video_kbps = plan['video_kbps']
+        args = ['-c:v', 'libx264', '-preset', plan['preset']]
+        if crf is not None:
+            args += ['-crf', str(crf)]
+        else:
+            args += ['-b:v', f"{video_kbps}k"]
+        args += ['-maxrate', f"{video_kbps}k", '-bufsize', f"{video_kbps * 2}k"]
+
+        if plan['scale']:
+            args += ['-vf', f"scale=-2:{plan['height']}"]
+        return args + ['-r', f"{plan['fps']:g}"]
+
+    def build_audio_args(self, plan: Dict[str, Any]) -> List[str]:
+        """معاملات ترميز مسار الصوت فقط"""
+        if not plan['audio_kbps']:
+            return ['-an']
+
+        args = ['-c:a', 'aac', '-b:a', f"{plan['audio_kbps']}k"]
+        if plan['audio_kbps'] <= 32:
+            args += ['-ac', '1']
+        return args
+
+    async def calibrate(self, input_path: str, plan: Dict[str, Any], crf: Optional[int] = None) -> float:
+        """
+        ترميز عينة قصيرة من منتصف الفيديو لقياس الانحراف عن معدل البت المطلوب
+        Returns:
+            معامل تصغير الميزانية (1.0 إذا لم تتجاوز العينة التوقع)
+        """
+        sample_seconds = config.COMPRESSION_SAMPLE_SECONDS
+        if plan['duration'] < sample_seconds * 3:
+            return 1.0
+
+        sample_path = f"{input_path}.sample.mp4"
+        start = plan['duration'] / 2 - sample_seconds / 2
+        cmd = [
+            'ffmpeg', '-ss', f"{start:.2f}", '-t', str(sample_seconds),
+            '-i', input_path, *self.build_args(plan, crf), '-y', sample_path
+        ]
+
+        try:
+            returncode, _ = await run_ffmpeg_with_progress(cmd)
+            if returncode != 0 or not os.path.exists(sample_path):
+                return 1.0
+            actual_kbps = os.path.getsize(sample_path) * 8 / sample_seconds / 1000
+            expected_kbps = plan['video_kbps'] + plan['audio_kbps']
+            ratio = actual_kbps / expected_kbps if expected_kbps else 1.0
+            logger.info("معايرة الضغط: المتوقع %skbps والفعلي %.0fkbps", expected_kbps, actual_kbps)
+            return min(1.0, 1 / ratio) if ratio > 0 else 1.0
+        finally:
+            if os.path.exists(sample_path):
+                os.remove(sample_path)
+
+    async def compress(
+        self,
+        input_path: str,
+        output_path: str,
+        target_size_mb: float,
+        progress: Optional[ProgressReporter] = None,
+        crf: Optional[int] = None,
+        encode: Optional[EncodeFunc] = None,
+        user_id: Optional[int] = None
+    ) -> Optional[str]:
+        """
+        ضغط الفيديو مع ضمان عدم تجاوز الحجم المستهدف
+        Args:
+            input_path: مسار الملف المدخل
+            output_path: مسار الملف الناتج
+            target_size_mb: الحجم المستهدف بالميجابايت
+            progress: مراسل التقدم (اختياري)
+            crf: وضع CRF مع سقف معدل البت (اختياري)
+            encode: دالة الترميز (الافتراضي عملية ffmpeg واحدة)
+            user_id: صاحب الطلب لجدولة الترميز بعدالة بين المستخدمين
+        Returns:
+            مسار الملف الناتج أو None
+        """
+        info = await probe_media(input_path)
+        if not info:
+            return None
+
+        plan = self.plan(info, target_size_mb)
+        if not plan:
+            logger.error("تعذر تحديد مدة الفيديو: %s", input_path)
+            return None
+
+        cost = transcode_scheduler.estimate_cost(plan['duration'], plan['width'], plan['height'], plan['preset'])
+        async with transcode_scheduler.slot(user_id, cost) as threads:
+            return await self._compress_planned(
+                input_path, output_path, info, plan, target_size_mb,
+                progress, crf, encode or self._encode_single, threads
+            )
+
+    async def _compress_planned(
+        self,
+        input_path: str,
+        output_path: str,
+        info: Dict[str, Any],
+        plan: Dict[str, Any],
+        target_size_mb: float,
+        progress: Optional[ProgressReporter],
+        crf: Optional[int],
+        encode: EncodeFunc,
+        threads: int
+    ) -> Optional[str]:
+        """المعايرة ثم الترميز مع إعادة المحاولة حتى يتسع الناتج للحجم المستهدف"""
+        budget_scale = 1.0
+        if config.COMPRESSION_CALIBRATE:
+            budget_scale = await self.calibrate(input_path, plan, crf)
+            plan = self.plan(info, target_size_mb, budget_scale)
+
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.monotonic()
+            encoded = await encode(
+                input_path,
+                output_path,
+                self.build_video_args(plan, crf),
+                self.build_audio_args(plan),
+                progress,
+                plan['duration'],
+                threads=threads
+            )
+            if not encoded:
+                return None
+
+            actual_bytes = os.path.getsize(output_path)
+            self.record(input_path, plan, actual_bytes, attempt, time.monotonic() - started)
+            if actual_bytes <= plan['target_bytes']:
+                return output_path
+
+            # الناتج أكبر من المطلوب: تصغير الميزانية بنسبة التجاوز وإعادة المحاولة
+            budget_scale *= plan['target_bytes'] / actual_bytes * 0.97
+            plan = self.plan(info, target_size_mb, budget_scale)
+            logger.warning(
+                "الناتج %s تجاوز الهدف %sMB، "
+                "إعادة المحاولة بمعامل %.2f",
+                format_file_size(actual_bytes),
+                target_size_mb,
+                budget_scale
+            )
+
+        os.remove(output_path)
+        logger.error("تعذر ضغط %s إلى %sMB بعد %s محاولات", input_path, target_size_mb, self.max_attempts)
+        return None
+
+    def record(
+        self,
+        input_path: str,
+        plan: Dict[str, Any],
+        actual_bytes: int,
+        attempt: int,
+        elapsed: float
+    ) -> None:
+        """تسجيل الحجم المتوقع مقابل الفعلي لضبط المعاملات لاحقاً"""
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'input': Path(input_path).name,
+            'attempt': attempt,
+            'elapsed': round(elapsed, 2),
+            'predicted_bytes': plan['predicted_bytes'],
+            'actual_bytes': actual_bytes,
+            'target_bytes': plan['target_bytes'],
+            'error_ratio': round(actual_bytes / plan['predicted_bytes'], 4) if plan['predicted_bytes'] else None,
+            'plan': {k: plan[k] for k in ('width', 'height', 'fps', 'video_kbps', 'audio_kbps', 'preset')}
+        }
+        try:
+            self.stats_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.stats_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            logger.warning("تعذر حفظ إحصائيات الضغط: %s", e)
+
+    @staticmethod
+    async def _encode_single(
+        input_path: str,
+        output_path: str,
+        video_args: List[str],
+        audio_args: List[str],
+        progress: Optional[ProgressReporter],
+        duration: float,
+        threads: int = 0
+    ) -> bool:
+        """ترميز الملف بعملية ffmpeg واحدة"""
+        cmd = [
+            'ffmpeg', '-i', input_path,
+            *video_args, '-threads', str(threads), *audio_args,
+            '-movflags', '+faststart',
+            '-y', output_path
+        ]
+        returncode, stderr = await run_ffmpeg_with_progress(cmd, progress, duration)
+        if returncode != 0:
+            logger.error("Compression failed: %s", stderr.decode(errors='ignore'))
+            return False
+        return True
+
+    @staticmethod
+    def _source_params(info: Dict[str, Any]) -> Dict[str, Any]:
+        """استخراج المدة والدقة ومعدل الإطارات والصوت من نتيجة الفحص"""
+        summary = MediaProbe.summarize(info)
+        return {
+            'duration': summary['duration'],
+            'width': summary['width'],
+            'height': summary['height'],
+            'fps': summary['fps'],
+            'has_audio': summary['has_audio'],
+            'audio_kbps': summary['bitrates']['audio']
+        }
+
+# إنشاء نسخة واحدة من المخطط
+compression_planner = CompressionPlanner()
@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import select, update
+
+from config import config
+from database.session import run_in_session
+from database.models import Download, DownloadJob, SystemLog
+from utils.helpers import format_file_size
+from utils.logger import logger, log_context
+from utils.tracing import tracer
+from services.downloader import downloader, download_video, compress_video
+from services.compression_planner import CompressionFailedError
+from services.progress import ProgressReporter
+from services.uploader import upload_video
+from services.workspace import workspace_manager, JobWorkspace, WorkspaceFullError
+
+# الحالات التي تعني أن المهمة لم تنتهِ بعد وتُستأنف عند إعادة التشغيل
+ACTIVE_STATUSES = ('downloading', 'processing')
+
+# طول عمود system_logs.description
+TRACE_DESCRIPTION_MAX = 500
+
+class DownloadJobStore:
+    """
+    مخزن مهام التحميل في قاعدة البيانات
+    يحفظ موضع التحميل ومجلد المهمة ورسالة الحالة حتى تُستكمل المهمة بعد إعادة التشغيل
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        self.flush_interval = config.JOB_PROGRESS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._table_ready = False
+
+    async def _run(self, func: Callable) -> Any:
+        with tracer.span('db.query', table=DownloadJob.__tablename__):
+            return await run_in_session(func)
+
+    async def ensure_table(self) -> None:
+        """إنشاء جدول المهام إذا لم يكن موجوداً"""
+        if not self._table_ready:
+            await self._run(lambda session: DownloadJob.__table__.create(session.connection(), checkfirst=True))
+            self._table_ready = True
+
+    @staticmethod
+    def _to_dict(job: DownloadJob) -> Dict[str, Any]:
+        return {column.name: getattr(job, column.name) for column in DownloadJob.__table__.columns}
+
+    async def create(
+        self,
+        user_id: int,
+        chat_id: int,
+        message_id: Optional[int],
+        url: str,
+        quality: str = 'best',
+        max_size_mb: Optional[float] = None,
+        compress: bool = False
+    ) -> Dict[str, Any]:
+        """تسجيل مهمة تحميل جديدة"""
+        await self.ensure_table()
+
+        def insert(session) -> Dict[str, Any]:
+            job = DownloadJob(
+                user_id=user_id,
+                chat_id=chat_id,
+                message_id=message_id,
+                url=url,
+                quality=quality,
+                max_size_mb=max_size_mb,
+                compress=compress,
+                status='downloading',
+                downloaded_bytes=0,
+                attempts=0
+            )
+            session.add(job)
+            session.flush()
+            return self._to_dict(job)
+
+        return await self._run(insert)
+
+    async def update(self, job_id: int, **fields) -> None:
+        """تحديث حقول المهمة"""
+        fields['updated_at'] = datetime.utcnow()
+        await self._run(lambda session: session.execute(
+            update(DownloadJob).where(DownloadJob.id == job_id).values(**fields)
+        ))
+
+    async def pending(self) -> List[Dict[str, Any]]:
+        """المهام التي لم تكتمل"""
+        await self.ensure_table()
+        return await self._run(lambda session: [
+            self._to_dict(job) for job in session.execute(
+                select(DownloadJob).where(DownloadJob.status.in_(ACTIVE_STATUSES)).order_by(DownloadJob.id)
+            ).scalars()
+        ])
+
+    async def record_trace(self, job: Dict[str, Any], summary: Dict[str, Any]) -> None:
+        """حفظ ملخص أزمنة مراحل المهمة في system_logs"""
+        if not summary:
+            return
+        description = self._trace_description(job['id'], summary)
+        try:
+            await self._run(lambda session: session.add(SystemLog(event_type='job_trace', description=description)))
+        except Exception as e:
+            logger.warning("تعذر حفظ ملخص تتبع المهمة %s: %s", job['id'], e)
+
+    @staticmethod
+    def _trace_description(job_id: int, summary: Dict[str, Any]) -> str:
+        """
+        ترميز الملخص كـ JSON صالح ضمن طول العمود
+        عند التجاوز تُحذف أسرع المراحل أولاً ويُسجل عدد المحذوف في 'dropped' بدلاً من قص النص
+        """
+        spans = sorted((summary.get('spans') or {}).items(), key=lambda item: item[1]['ms'], reverse=True)
+        for keep in range(len(spans), -1, -1):
+            record = {'job_id': job_id, **summary, 'spans': dict(spans[:keep])}
+            if keep < len(spans):
+                record['dropped'] = len(spans) - keep
+            description = json.dumps(record, ensure_ascii=False)
+            if len(description) <= TRACE_DESCRIPTION_MAX:
+                return description
+        return json.dumps({'job_id': job_id, 'trace_id': summary.get('trace_id'), 'total_ms': summary.get('total_ms')})
+
+    async def record_download(self, job: Dict[str, Any], platform: str, status: str, file_size: Optional[int] = None) -> None:
+        """
+        إضافة المهمة إلى سجل تحميلات المستخدم (downloads)
+        فشل التسجيل لا يُفشل المهمة بعد تحميل الملف ورفعه
+        """
+        def insert(session) -> None:
+            session.add(Download(
+                user_id=job['user_id'],
+                url=job['url'],
+                platform=platform,
+                download_date=datetime.utcnow(),
+                file_size=file_size,
+                status=status
+            ))
+
+        try:
+            await self._run(insert)
+        except Exception as e:
+            logger.warning("تعذر تسجيل التحميل للمهمة %s: %s", job['id'], e)
+
+    def tracker(self, job_id: int) -> Callable[[Dict[str, Any]], None]:
+        """
+        دالة progress_hooks تحفظ موضع التحميل كل flush_interval ثانية
+        (تُستدعى من خيط yt-dlp فتُرسل الكتابة إلى حلقة الأحداث)
+        """
+        loop = asyncio.get_running_loop()
+        last_flush = 0.0
+
+        def hook(d: Dict[str, Any]) -> None:
+            nonlocal last_flush
+            if d.get('status') != 'downloading':
+                return
+            now = time.monotonic()
+            if now - last_flush < self.flush_interval:
+                return
+            last_flush = now
+            asyncio.run_coroutine_threadsafe(self.update(
+                job_id,
+                downloaded_bytes=int(d.get('downloaded_bytes') or 0),
+                total_bytes=int(d.get('total_bytes') or d.get('total_bytes_estimate') or 0) or None,
+                part_path=d.get('tmpfilename')
+            ), loop)
+
+        return hook
+
+async def run_download_job(
+    job: Dict[str, Any],
+    message,
+    workspace: JobWorkspace,
+    title: str = "⏳ جاري تحميل الفيديو..."
+) -> Optional[Dict[str, Any]]:
+    """
+    تنفيذ مهمة مسجلة: التحميل (أو استكماله) ثم الضغط عند الحاجة ثم الرفع
+    Args:
+        job: سجل المهمة من DownloadJobStore
+        message: رسالة الحالة لعرض التقدم
+        workspace: مجلد المهمة (يبقى عند إيقاف الخادم لاستكمال ملفات .part)
+    Returns:
+        {'file_path', 'file_size'} أو None إذا فشل التحميل
+    """
+    # كل سجلات التحميل والضغط والرفع تحمل رقم المهمة ومنصتها (تصنيف مقاييس المراحل)،
+    # وأزمنة مراحلها تُجمع في span المهمة
+    platform = await downloader.get_platform(job['url'])
+    with log_context(job_id=job['id'], user_id=job['user_id'], platform=platform):
+        span = tracer.span('download.job', summarize=True, job_id=job['id'], url=job['url'])
+        try:
+            with span:
+                return await _execute_job(job, message, workspace, title, platform)
+        finally:
+            summary = span.summary()
+            if summary:
+                logger.info("مراحل المهمة %s: %s", job['id'], summary['spans'], extra={'duration_ms': summary['total_ms']})
+                await job_store.record_trace(job, summary)
+
+async def _execute_job(
+    job: Dict[str, Any],
+    message,
+    workspace: JobWorkspace,
+    title: str,
+    platform: str
+) -> Optional[Dict[str, Any]]:
+    workspace.persistent = True
+    job['attempts'] = (job.get('attempts') or 0) + 1
+    await job_store.update(
+        job['id'],
+        status='downloading',
+        workspace_dir=str(workspace.path),
+        attempts=job['attempts']
+    )
+
+    try:
+        progress = ProgressReporter(message, title)
+        try:
+            file_path = await download_video(
+                job['url'],
+                job['quality'],
+                progress=progress,
+                max_size_mb=job['max_size_mb'],
+                output_dir=str(workspace.path),
+                progress_hooks=[job_store.tracker(job['id'])]
+            )
+        finally:
+            await progress.close()
+
+        if not file_path:
+            await job_store.update(job['id'], status='failed', error='download failed')
+            await job_store.record_download(job, platform, 'failed')
+            return None
+
+        file_size = os.path.getsize(file_path)
+        await job_store.update(job['id'], status='processing', downloaded_bytes=file_size, total_bytes=file_size)
+
+        max_size = job['max_size_mb']
+        if job['compress'] and max_size and file_size > max_size * 1024 * 1024:
+            status_text = f"⚠️ جاري ضغط الفيديو (الحد الأقصى: {max_size:g}MB)..."
+            await message.edit_text(status_text)
+            progress = ProgressReporter(message, status_text)
+            try:
+                compressed_path = await compress_video(file_path, max_size, progress=progress, user_id=job['user_id'])
+            finally:
+                await progress.close()
+            if not compressed_path:
+                await job_store.record_download(job, platform, 'failed')
+                raise CompressionFailedError(max_size)
+            file_path = compressed_path
+            file_size = os.path.getsize(file_path)
+
+        await upload_video(
+            chat_id=job['chat_id'],
+            file_path=file_path,
+            caption=f"تم التحميل بنجاح 🎬\nالجودة: {job['quality'].upper()}\nالحجم: {format_file_size(file_size)}"
+        )
+        await job_store.update(job['id'], status='completed')
+        await job_store.record_download(job, platform, 'completed', file_size)
+        return {'file_path': file_path, 'file_size': file_size}
+
+    except asyncio.CancelledError:
+        # إيقاف الخادم: تبقى المهمة نشطة لتُستأنف بعد إعادة التشغيل
+        raise
+    except Exception as e:
+        await job_store.update(job['id'], status='failed', error=str(e)[:500])
+        raise
+
+class DownloadResumer:
+    """استئناف المهام غير المكتملة عند بدء التشغيل وتحديث رسائل الحالة الخاصة بها"""
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def resume_all(self, bot) -> int:
+        """
+        تبني مجلدات المهام غير المكتملة وجدولة استكمالها
+        يجب استدعاؤها قبل workspace_manager.start() حتى لا يحذف الكنس ملفات .part
+        Returns:
+            عدد المهام المستأنفة
+        """
+        try:
+            jobs = await job_store.pending()
+        except Exception as e:
+            logger.error("تعذر قراءة مهام التحميل غير المكتملة: %s", e)
+            return 0
+        if not jobs:
+            return 0
+
+        await bot.initialize()
+        cutoff = datetime.utcnow() - timedelta(seconds=config.JOB_RESUME_MAX_AGE)
+        resumed = 0
+        for job in jobs:
+            if (job['updated_at'] and job['updated_at'] < cutoff) or (job['attempts'] or 0) >= config.JOB_MAX_ATTEMPTS:
+                await job_store.update(job['id'], status='failed', error='expired')
+                await self._notify(bot, job, "❌ تعذر إكمال طلب التحميل، يرجى إرسال الرابط مجدداً")
+                continue
+
+            workspace = workspace_manager.adopt(job['workspace_dir']) if job['workspace_dir'] else None
+            task = asyncio.create_task(self._resume(bot, job, workspace))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            resumed += 1
+
+        logger.info("🔄 استئناف %s مهام تحميل غير مكتملة", resumed)
+        return resumed
+
+    async def _resume(self, bot, job: Dict[str, Any], workspace: Optional[JobWorkspace]) -> None:
+        """استكمال مهمة واحدة في رسالة الحالة الأصلية"""
+        done = format_file_size(job['downloaded_bytes'] or 0)
+        message = await self._notify(bot, job, f"🔄 تم استئناف التحميل بعد إعادة تشغيل الخادم ({done} محمّلة مسبقاً)...")
+        if message is None:
+            await job_store.update(job['id'], status='failed', error='status message unavailable')
+            if workspace:
+                await workspace_manager.release(workspace)
+            return
+
+        try:
+            async with workspace_manager.job(workspace=workspace) as ws:
+                result = await run_download_job(job, message, ws, title="🔄 جاري استكمال التحميل...")
+            if result:
+                await message.delete()
+            else:
+                await message.edit_text("❌ فشل استكمال التحميل، يرجى التحقق من الرابط")
+        except CompressionFailedError as e:
+            await message.edit_text(f"❌ تعذر ضغط الفيديو إلى {e.target_size_mb:g}MB")
+        except WorkspaceFullError:
+            await job_store.update(job['id'], status='failed', error='workspace full')
+            await message.edit_text("⏳ الخادم مشغول حالياً، يرجى إرسال الرابط مجدداً بعد قليل")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("فشل استئناف المهمة %s: %s", job['id'], e)
+            await message.edit_text("❌ حدث خطأ أثناء استكمال التحميل")
+
+    @staticmethod
+    async def _notify(bot, job: Dict[str, Any], text: str):
+        """تعديل رسالة الحالة الأصلية أو إرسال رسالة جديدة إذا حُذفت"""
+        try:
+            if job['message_id']:
+                return await bot.edit_message_text(text, chat_id=job['chat_id'], message_id=job['message_id'])
+        except Exception as e:
+            logger.warning("تعذر تعديل رسالة المهمة %s: %s", job['id'], e)
+        try:
+            message = await bot.send_message(job['chat_id'], text)
+            await job_store.update(job['id'], message_id=message.message_id)
+            return message
+        except Exception as e:
+            logger.error("تعذر إرسال رسالة المهمة %s: %s", job['id'], e)
+            return None
+
+# إنشاء نسخ واحدة لمشاركتها بين المعالجات
+job_store = DownloadJobStore()
+download_resumer = DownloadResumer()
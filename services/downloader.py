@@ -1,21 +1,35 @@
 import os
 import re
+import time
+import asyncio
 import logging
-import yt_dlp
-import subprocess
-from typing import Optional, Dict, Any
-from datetime import datetime
+from typing import Optional, Dict, Any, Callable, List, Tuple
 from pathlib import Path
 from urllib.parse import urlparse
 
 from config import config
 from utils.helpers import format_file_size
-from utils.logger import logger
-from database.session import get_db
+from utils.logger import logger, log_context
+from utils.tracing import traced
+from utils.metrics import timed, STAGE_SECONDS, TRANSFER_BYTES
+from services.progress import ProgressReporter, run_ffmpeg_with_progress
+from services.media_probe import probe_media, build_mp4_codec_args, is_mp4_ready
+from services.compression_planner import compression_planner
+from services.format_selector import format_selector
+from services.rate_limiter import rate_limiter, PlatformBlockedError
+from services.range_downloader import range_downloader, pick_direct_format, RangeHTTPError
+from services.stream_pipeline import stream_pipeline
+from services.ydl_pool import ydl_pool
 
 class VideoDownloader:
     """فئة مسؤولة عن تحميل ومعالجة الفيديوهات من مختلف المنصات"""
     
+    QUALITY_FORMATS = {
+        'best': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+        'medium': 'bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+        'low': 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+    }
+    
     def __init__(self):
         self.temp_dir = Path("temp")
         self.temp_dir.mkdir(exist_ok=True)
@@ -23,8 +37,28 @@ class VideoDownloader:
             'quiet': True,
             'no_warnings': True,
             'force_ipv4': True,
+            # روابط الفيديو داخل قائمة (&list=) تُحمّل كفيديو واحد، والقوائم عبر services/playlist.py
+            'noplaylist': True,
             'outtmpl': str(self.temp_dir / '%(id)s.%(ext)s'),
+            # استكمال ملفات .part الموجودة بدل البدء من الصفر
+            'continuedl': True,
+            # تحميل أجزاء HLS/DASH بالتوازي وحد السرعة لكل تحميل
+            'concurrent_fragment_downloads': config.RANGE_DOWNLOAD_CONNECTIONS,
+            'ratelimit': config.DOWNLOAD_BANDWIDTH_LIMIT or None,
         }
+        
+        # ملفات إعدادات yt-dlp التي تُعاد نسخها بين الطلبات
+        ydl_pool.register('default', self.ydl_opts)
+        for quality, fmt in self.QUALITY_FORMATS.items():
+            ydl_pool.register(quality, {**self.ydl_opts, 'format': fmt})
+        ydl_pool.register('twitter', {
+            **self.ydl_opts,
+            'format': self.QUALITY_FORMATS['best'],
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                'Referer': 'https://twitter.com/'
+            }
+        })
 
     async def clean_url(self, url: str) -> str:
         """تنظيف الروابط من المعاملات الإضافية"""
@@ -53,21 +87,50 @@ class VideoDownloader:
     async def get_video_info(self, url: str) -> Optional[Dict[str, Any]]:
         """الحصول على معلومات الفيديو بدون تحميل"""
         try:
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                return {
-                    'title': info.get('title', 'Untitled'),
-                    'duration': info.get('duration', 0),
-                    'thumbnail': info.get('thumbnail', ''),
-                    'filesize': info.get('filesize_approx', 0),
-                    'formats': info.get('formats', []),
-                    'resolution': self._get_best_resolution(info),
-                    'ext': info.get('ext', 'mp4')
-                }
+            info = await rate_limiter.run(
+                await self.get_platform(url),
+                asyncio.to_thread,
+                self._extract_info,
+                url
+            )
+            return {
+                'title': info.get('title', 'Untitled'),
+                'duration': info.get('duration', 0),
+                'thumbnail': info.get('thumbnail', ''),
+                'filesize': info.get('filesize_approx', 0),
+                'formats': info.get('formats', []),
+                'resolution': self._get_best_resolution(info),
+                'ext': info.get('ext', 'mp4')
+            }
+        except Exception as e:
+            logger.error("Failed to get video info: %s", e)
+            return None
+
+    async def fetch_info(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        نتيجة extract_info الكاملة ضمن حدود المنصة، لتمريرها إلى الضغط أثناء البث
+        ثم إلى download_with_ytdlp بدلاً من استخراجها مرتين
+        """
+        try:
+            return await rate_limiter.run(
+                await self.get_platform(url),
+                asyncio.to_thread,
+                self._extract_info,
+                url
+            )
+        except PlatformBlockedError:
+            raise
         except Exception as e:
-            logger.error(f"Failed to get video info: {e}")
+            logger.error("Failed to get video info: %s", e)
             return None
 
+    @traced('ytdlp.extract_info')
+    @timed(STAGE_SECONDS, 'extract')
+    def _extract_info(self, url: str) -> Dict[str, Any]:
+        """استخراج المعلومات بشكل متزامن (يُشغل في خيط منفصل)"""
+        with ydl_pool.checkout() as ydl:
+            return ydl.extract_info(url, download=False)
+
     def _get_best_resolution(self, info: Dict[str, Any]) -> str:
         """الحصول على أفضل دقة متاحة"""
         formats = info.get('formats', [])
@@ -77,115 +140,239 @@ class VideoDownloader:
         resolutions = [f.get('resolution') for f in formats if f.get('vcodec') != 'none']
         return max(resolutions, key=lambda x: int(x.split('x')[1]) if resolutions else 'Unknown')
 
-    async def download_with_ytdlp(self, url: str, quality: str = 'best') -> Optional[str]:
-        """تحميل الفيديو باستخدام yt-dlp"""
-        opts = {**self.ydl_opts, 'format': self._get_quality_format(quality)}
+    async def download_with_ytdlp(
+        self,
+        url: str,
+        quality: str = 'best',
+        progress: Optional[ProgressReporter] = None,
+        max_size_mb: Optional[float] = None,
+        output_dir: Optional[str] = None,
+        progress_hooks: Optional[List[Callable[[Dict[str, Any]], None]]] = None,
+        info: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """
+        تحميل الفيديو باستخدام yt-dlp
+        Args:
+            url: رابط الفيديو
+            quality: الجودة المطلوبة
+            progress: مراسل التقدم (اختياري)
+            max_size_mb: الحد الأقصى للحجم لاختيار صيغة لا تحتاج ضغطاً إن وجدت
+            output_dir: مجلد المهمة من WorkspaceManager (الافتراضي temp/)
+            progress_hooks: دوال إضافية تستقبل أحداث التقدم (مثل تتبع مخزن المهام)
+            info: نتيجة fetch_info إن كانت مستخرجة مسبقاً (لتجنب استخراج ثانٍ)
+        """
+        # إعدادات الطلب فقط، والباقي من ملف إعدادات الجودة في ydl_pool
+        profile = quality if quality in self.QUALITY_FORMATS else 'best'
+        opts: Dict[str, Any] = {}
+        if output_dir:
+            opts['outtmpl'] = str(Path(output_dir) / '%(id)s.%(ext)s')
+        hooks = ([progress.ytdlp_hook] if progress else []) + list(progress_hooks or [])
+        if hooks:
+            opts['progress_hooks'] = hooks
         
         try:
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                filepath = ydl.prepare_filename(info)
-                
-                # تسجيل التحميل في قاعدة البيانات
-                await self._log_download(
-                    user_id=None,  # سيتم تعبئته عند الاستدعاء
-                    url=url,
-                    platform=await self.get_platform(url),
-                    file_size=os.path.getsize(filepath)
+            # التشغيل في خيط منفصل حتى لا تتوقف حلقة الأحداث وتصل تحديثات التقدم،
+            # وضمن حدود المنصة مع التراجع التلقائي عند التقييد
+            platform = await self.get_platform(url)
+            started = time.monotonic()
+            with log_context(platform=platform):
+                filepath = await rate_limiter.run(
+                    platform,
+                    self._run_download,
+                    profile,
+                    opts,
+                    url,
+                    quality,
+                    max_size_mb,
+                    info
+                )
+                file_size = os.path.getsize(filepath)
+                TRANSFER_BYTES.inc(file_size, 'download', platform)
+                logger.info(
+                    "تم تحميل %s (%s)",
+                    url,
+                    format_file_size(file_size),
+                    extra={'duration_ms': round((time.monotonic() - started) * 1000), 'bytes': file_size}
                 )
-                return filepath
+            
+            return filepath
+        except PlatformBlockedError:
+            raise
         except Exception as e:
-            logger.error(f"Download failed: {e}")
+            logger.error("Download failed: %s", e)
+            return None
+
+    async def _run_download(
+        self,
+        profile: str,
+        opts: Dict[str, Any],
+        url: str,
+        quality: str = 'best',
+        max_size_mb: Optional[float] = None,
+        info: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        تنفيذ التحميل وإرجاع مسار الملف
+        الصيغ المباشرة الكبيرة تُحمّل بعدة اتصالات، والباقي عبر yt-dlp في خيط منفصل
+        """
+        info, opts = await asyncio.to_thread(self._extract_and_select, profile, opts, url, quality, max_size_mb, info)
+
+        direct = pick_direct_format(info, opts.get('format'))
+        if direct:
+            headers = dict(direct.get('http_headers') or {})
+            with ydl_pool.checkout(profile, opts) as ydl:
+                output_path = ydl.prepare_filename({**info, 'ext': direct.get('ext') or 'mp4'})
+                # كوكيز الجلسة لا تأتي ضمن http_headers، وبدونها ترفض بعض المنصات الرابط بـ 403
+                cookies = ydl.cookiejar.get_cookie_header(direct['url'])
+            if cookies:
+                headers['Cookie'] = cookies
+            try:
+                return await range_downloader.download(
+                    direct['url'],
+                    output_path,
+                    headers=headers,
+                    progress_hook=self._chain_hooks(opts.get('progress_hooks'))
+                )
+            except Exception as e:
+                # 429 فقط تقييد فعلي يُحتسب على المنصة؛ أي خطأ آخر (403 لرابط موقّع منتهٍ،
+                # أو نقص كوكيز) يكمله yt-dlp بدون أن يصل إلى قاطع الدائرة
+                if isinstance(e, RangeHTTPError) and e.status_code == 429:
+                    raise
+                logger.warning("فشل التحميل المتوازي، الرجوع إلى yt-dlp: %s", e)
+
+        return await asyncio.to_thread(self._process_download, profile, opts, info)
+
+    @staticmethod
+    def _chain_hooks(hooks: Optional[List[Callable]]) -> Optional[Callable[[Dict[str, Any]], None]]:
+        """دمج دوال progress_hooks في دالة واحدة للتحميل المتوازي"""
+        if not hooks:
             return None
+        def hook(d: Dict[str, Any]) -> None:
+            for h in hooks:
+                h(d)
+        return hook
+
+    @traced('ytdlp.extract_info')
+    @timed(STAGE_SECONDS, 'extract')
+    def _extract_and_select(
+        self,
+        profile: str,
+        opts: Dict[str, Any],
+        url: str,
+        quality: str,
+        max_size_mb: Optional[float],
+        info: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """استخراج المعلومات (إن لم تُمرر) واختيار الصيغة من القائمة المستخرجة بدون طلب استخراج جديد"""
+        if info is None:
+            with ydl_pool.checkout(profile, opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+
+        selected = format_selector.select(info, quality, max_size_mb)
+        if selected:
+            opts = {**opts, 'format': selected['format']}
+            if selected['compatible']:
+                opts['merge_output_format'] = 'mp4'
+        return info, opts
+
+    @traced('ytdlp.download')
+    @timed(STAGE_SECONDS, 'download')
+    def _process_download(self, profile: str, opts: Dict[str, Any], info: Dict[str, Any]) -> str:
+        """تحميل الصيغة المختارة عبر yt-dlp (متزامن)"""
+        with ydl_pool.checkout(profile, opts) as ydl:
+            info = ydl.process_ie_result(info, download=True)
+            return ydl.prepare_filename(info)
 
     def _get_quality_format(self, quality: str) -> str:
         """تحديد تنسيق الجودة المطلوبة"""
-        quality_map = {
-            'best': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'medium': 'bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'low': 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
-        }
-        return quality_map.get(quality, quality_map['best'])
+        return self.QUALITY_FORMATS.get(quality, self.QUALITY_FORMATS['best'])
 
     async def download_twitter_video(self, url: str) -> Optional[str]:
         """تحميل فيديو من تويتر مع معالجة خاصة"""
-        opts = {
-            **self.ydl_opts,
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'https://twitter.com/'
-            }
-        }
-        
         try:
-            with yt_dlp.YoutubeDL(opts) as ydl:
+            with ydl_pool.checkout('twitter') as ydl:
                 info = ydl.extract_info(url, download=True)
                 return ydl.prepare_filename(info)
         except Exception as e:
-            logger.error(f"Twitter download failed: {e}")
+            logger.error("Twitter download failed: %s", e)
             return None
 
     async def convert_to_mp4(self, input_path: str) -> Optional[str]:
-        """تحويل الفيديو إلى صيغة MP4"""
+        """تحويل الفيديو إلى صيغة MP4 (نسخ المسارات المتوافقة بدون إعادة ترميز)"""
+        info = await probe_media(input_path)
+        if Path(input_path).suffix.lower() == '.mp4' and is_mp4_ready(info):
+            return input_path
+
         output_path = Path(input_path).with_suffix('.mp4')
+        if output_path == Path(input_path):
+            output_path = Path(input_path).with_stem(f"{Path(input_path).stem}_converted")
         
         cmd = [
             'ffmpeg', '-i', input_path,
-            '-c:v', 'libx264', '-preset', 'fast',
-            '-c:a', 'aac', '-strict', 'experimental',
+            *build_mp4_codec_args(
+                info,
+                video_encode=['-c:v', 'libx264', '-preset', 'fast'],
+                audio_encode=['-c:a', 'aac']
+            ),
             '-y', str(output_path)
         ]
         
-        try:
-            subprocess.run(cmd, check=True, capture_output=True)
-            return str(output_path)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Conversion failed: {e.stderr.decode()}")
+        returncode, stderr = await run_ffmpeg_with_progress(cmd)
+        if returncode != 0:
+            logger.error("Conversion failed: %s", stderr.decode(errors='ignore'))
             return None
+        return str(output_path)
 
-    async def compress_video(self, input_path: str, target_size_mb: int) -> Optional[str]:
-        """ضغط الفيديو لتقليل حجمه"""
-        output_path = Path(input_path).with_stem(f"{Path(input_path).stem}_compressed")
-        
-        # حساب معدل البت المطلوب
-        duration = float(subprocess.run([
-            'ffprobe', '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            input_path
-        ], capture_output=True, text=True).stdout)
-        
-        target_bits = target_size_mb * 8 * 1024 * 1024
-        bitrate = int(target_bits / duration / 1024)  # كيلوبت في الثانية
-        
-        cmd = [
-            'ffmpeg', '-i', input_path,
-            '-c:v', 'libx264', '-preset', 'slow',
-            '-b:v', f'{bitrate}k', '-maxrate', f'{bitrate}k',
-            '-bufsize', f'{bitrate * 2}k',
-            '-c:a', 'aac', '-b:a', '128k',
-            '-y', str(output_path)
-        ]
-        
+    async def compress_video(
+        self,
+        input_path: str,
+        target_size_mb: int,
+        progress: Optional[ProgressReporter] = None,
+        user_id: Optional[int] = None
+    ) -> Optional[str]:
+        """ضغط الفيديو لتقليل حجمه مع ضمان عدم تجاوز الحجم المستهدف"""
+        output_path = Path(input_path).with_stem(f"{Path(input_path).stem}_compressed").with_suffix('.mp4')
+        return await compression_planner.compress(
+            input_path,
+            str(output_path),
+            target_size_mb,
+            progress,
+            user_id=user_id
+        )
+
+    async def compress_streaming(
+        self,
+        url: str,
+        output_path: str,
+        target_size_mb: float,
+        progress: Optional[ProgressReporter] = None,
+        user_id: Optional[int] = None,
+        info: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """
+        ضغط الفيديو أثناء تحميله بدون كتابة الملف الأصلي على القرص
+        Args:
+            info: نتيجة fetch_info؛ يُفضل تمريرها لإعادة استخدامها في download_with_ytdlp عند الرجوع
+        Returns:
+            مسار الملف المضغوط، أو None إذا لزم التحميل ثم الضغط (حاوية تحتاج التنقل، أو فشل البث)
+        """
+        if not config.STREAM_COMPRESS_ENABLED:
+            return None
         try:
-            subprocess.run(cmd, check=True, capture_output=True)
-            return str(output_path)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Compression failed: {e.stderr.decode()}")
+            if info is None:
+                info = await rate_limiter.run(
+                    await self.get_platform(url),
+                    asyncio.to_thread,
+                    self._extract_info,
+                    url
+                )
+            return await stream_pipeline.compress(info, output_path, target_size_mb, progress, user_id)
+        except PlatformBlockedError:
+            raise
+        except Exception as e:
+            logger.warning("تعذر الضغط أثناء البث: %s", e)
             return None
 
-    async def _log_download(self, user_id: int, url: str, platform: str, file_size: int):
-        """تسجيل عملية التحميل في قاعدة البيانات"""
-        with get_db() as conn:
-            conn.execute(
-                """INSERT INTO downloads 
-                (user_id, url, platform, download_date, file_size) 
-                VALUES (?, ?, ?, ?, ?)""",
-                (user_id, url, platform, datetime.now(), file_size)
-            )
-            conn.commit()
-
 # إنشاء نسخة واحدة من Downloader لاستخدامها في جميع أنحاء التطبيق
 downloader = VideoDownloader()
 
@@ -193,11 +380,20 @@ downloader = VideoDownloader()
 async def download_video(*args, **kwargs):
     return await downloader.download_with_ytdlp(*args, **kwargs)
 
+async def download_with_ytdlp(*args, **kwargs):
+    return await downloader.download_with_ytdlp(*args, **kwargs)
+
 async def get_video_info(*args, **kwargs):
     return await downloader.get_video_info(*args, **kwargs)
 
+async def fetch_video_info(*args, **kwargs):
+    return await downloader.fetch_info(*args, **kwargs)
+
 async def clean_url(*args, **kwargs):
     return await downloader.clean_url(*args, **kwargs)
 
 async def compress_video(*args, **kwargs):
-    return await downloader.compress_video(*args, **kwargs)
\ No newline at end of file
+    return await downloader.compress_video(*args, **kwargs)
+
+async def compress_from_url(*args, **kwargs):
+    return await downloader.compress_streaming(*args, **kwargs)
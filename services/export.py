@@ -0,0 +1,139 @@
+import io
+import csv
+import json
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, select
+
+from config import config
+from database.models import Download, SystemLog
+from database.session import async_engine, using_sqlite
+from utils.logger import logger
+
+# الجداول القابلة للتصدير وعمود التاريخ الذي تُحدد به الفترة
+EXPORT_TABLES = {
+    'downloads': (Download, Download.download_date),
+    'system_logs': (SystemLog, SystemLog.timestamp)
+}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _naive_utc(value: datetime) -> datetime:
+    """أعمدة التاريخ في النماذج بدون منطقة زمنية (UTC)"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class DataExporter:
+    """
+    تصدير صفوف الجداول الكبيرة على دفعات بمفتاح (التاريخ, id) (keyset)
+    كل دفعة استعلام قصير مستقل فلا يبقى مؤشر أو قفل قراءة مفتوحاً طوال الاستجابة
+    (قفل SHARED في SQLite كان يوقف كتابات البوت)، ويبقى استهلاك الذاكرة ثابتاً
+    """
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or config.EXPORT_BATCH_SIZE
+
+    def resolve_range(self, start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+        """الفترة [start, end) مع القيم الافتراضية (آخر EXPORT_DEFAULT_DAYS يوماً)"""
+        end = _naive_utc(end) if end else datetime.utcnow()
+        start = _naive_utc(start) if start else end - timedelta(days=config.EXPORT_DEFAULT_DAYS)
+        if start >= end:
+            raise ValueError("بداية الفترة يجب أن تسبق نهايتها")
+        return start, end
+
+    def columns(self, table: str) -> List[str]:
+        model, _ = EXPORT_TABLES[table]
+        return [column.name for column in model.__table__.columns]
+
+    def _query(self, table: str, start: datetime, end: datetime, after: Optional[Tuple[datetime, int]] = None):
+        """دفعة واحدة بعد المفتاح after بترتيب (التاريخ, id) الذي يغطيه فهرس الجدول"""
+        model, date_column = EXPORT_TABLES[table]
+        query = select(*model.__table__.columns).where(date_column >= start, date_column < end)
+        if after:
+            last_date, last_id = after
+            query = query.where(or_(date_column > last_date, and_(date_column == last_date, model.id > last_id)))
+        return query.order_by(date_column, model.id).limit(self.batch_size)
+
+    @staticmethod
+    def _fetch_sync(query) -> Sequence[Any]:
+        with async_engine.connect() as conn:
+            return conn.execute(query).all()
+
+    async def _fetch(self, query) -> Sequence[Any]:
+        """تنفيذ دفعة في اتصال يُعاد إلى المجمع فور قراءتها"""
+        if using_sqlite:
+            # المحرك متزامن: القراءة في خيط حتى لا تتوقف حلقة الأحداث
+            return await asyncio.to_thread(self._fetch_sync, query)
+        async with async_engine.connect() as conn:
+            return (await conn.execute(query)).all()
+
+    async def _partitions(self, table: str, start: datetime, end: datetime) -> AsyncIterator[Sequence[Any]]:
+        model, date_column = EXPORT_TABLES[table]
+        columns = self.columns(table)
+        date_index, id_index = columns.index(date_column.name), columns.index(model.id.name)
+        after = None
+        while True:
+            rows = await self._fetch(self._query(table, start, end, after))
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.batch_size:
+                return
+            after = (rows[-1][date_index], rows[-1][id_index])
+
+    @staticmethod
+    def _encode_ndjson(columns: Sequence[str], rows: Sequence[Any]) -> bytes:
+        return ''.join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default) + '\n'
+            for row in rows
+        ).encode('utf-8')
+
+    @staticmethod
+    def _encode_csv(columns: Sequence[str], rows: Sequence[Any]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+    async def stream(
+        self,
+        table: str,
+        start: datetime,
+        end: datetime,
+        fmt: str = 'ndjson'
+    ) -> AsyncIterator[bytes]:
+        """
+        أجزاء الملف المصدّر دفعة بعد دفعة (لـ StreamingResponse)
+        Args:
+            table: downloads أو system_logs
+            fmt: ndjson أو csv (مع سطر العناوين)
+        """
+        columns = self.columns(table)
+        encode = self._encode_csv if fmt == 'csv' else self._encode_ndjson
+        exported = 0
+        completed = False
+        try:
+            if fmt == 'csv':
+                yield self._encode_csv(columns, [columns])
+            async for rows in self._partitions(table, start, end):
+                exported += len(rows)
+                yield encode(columns, rows)
+            completed = True
+        finally:
+            logger.info(
+                "تصدير %s (%s → %s): %s صف%s",
+                table, start.isoformat(), end.isoformat(), exported, '' if completed else ' (توقف قبل الاكتمال)'
+            )
+
+# إنشاء نسخة واحدة من خدمة التصدير
+data_exporter = DataExporter()
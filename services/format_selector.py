@@ -0,0 +1,137 @@
+from typing import Any, Dict, List, Optional
+
+from utils.logger import logger
+
+# الحد الأقصى للارتفاع حسب الجودة المطلوبة (None = بدون حد)
+QUALITY_HEIGHT_CAP = {
+    'best': None,
+    '4k': None,
+    'medium': 720,
+    'low': 480
+}
+
+# الترميزات التي يشغلها تيليجرام مباشرة داخل MP4
+TELEGRAM_VIDEO_CODECS = ('avc1', 'h264')
+TELEGRAM_AUDIO_CODECS = ('mp4a', 'aac', 'mp3')
+
+class FormatSelector:
+    """
+    اختيار الصيغة المناسبة من قائمة formats المستخرجة مسبقاً
+    الترتيب: يتسع للحجم المسموح ← متوافق مع تيليجرام بدون تحويل ← الدقة ← معدل البت
+    """
+
+    def select(
+        self,
+        info: Dict[str, Any],
+        quality: str = 'best',
+        max_size_mb: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        ترتيب الصيغ واختيار الأفضل
+        Args:
+            info: نتيجة extract_info(download=False)
+            quality: الجودة المطلوبة (best, medium, low, 4k)
+            max_size_mb: الحد الأقصى لحجم الملف بالميجابايت
+        Returns:
+            {'format': محدد الصيغة لـ yt-dlp, 'estimated_size', 'compatible', 'height'}
+            أو None إذا لم تتوفر معلومات كافية
+        """
+        formats = info.get('formats') or []
+        duration = info.get('duration') or 0
+        if not formats:
+            return None
+
+        height_cap = QUALITY_HEIGHT_CAP.get(quality)
+        max_bytes = max_size_mb * 1024 * 1024 if max_size_mb else None
+
+        candidates = self._build_candidates(formats, duration)
+        if height_cap:
+            candidates = [c for c in candidates if (c['height'] or 0) <= height_cap]
+        if not candidates:
+            return None
+
+        fitting = [c for c in candidates if max_bytes is None or (c['size'] and c['size'] <= max_bytes)]
+        if fitting:
+            best = max(fitting, key=lambda c: (c['compatible'], c['height'] or 0, c['tbr'] or 0))
+        else:
+            # لا توجد صيغة تتسع: أصغر صيغة متوافقة لتقليل عمل الضغط لاحقاً
+            sized = [c for c in candidates if c['size']] or candidates
+            best = min(sized, key=lambda c: (-c['compatible'], c['size'] or float('inf')))
+
+        logger.info(
+            "الصيغة المختارة %s (%sp، "
+            "متوافقة=%s، الحجم المقدر=%s)",
+            best['format'],
+            best['height'],
+            best['compatible'],
+            best['size']
+        )
+        return {
+            'format': best['format'],
+            'estimated_size': best['size'],
+            'compatible': best['compatible'] == 2,
+            'height': best['height']
+        }
+
+    def _build_candidates(self, formats: List[Dict[str, Any]], duration: float) -> List[Dict[str, Any]]:
+        """بناء المرشحين: الصيغ المدمجة وأزواج (فيديو + أفضل صوت)"""
+        videos = [f for f in formats if self._has_video(f)]
+        audios = [f for f in formats if not self._has_video(f) and self._has_audio(f)]
+        best_audio = max(audios, key=lambda f: (self._audio_compatible(f), f.get('abr') or f.get('tbr') or 0), default=None)
+
+        candidates = []
+        for video in videos:
+            if self._has_audio(video):
+                candidates.append(self._candidate([video], duration))
+            elif best_audio:
+                candidates.append(self._candidate([video, best_audio], duration))
+        return candidates
+
+    def _candidate(self, parts: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+        """حساب الحجم والتوافق لمرشح مكون من صيغة أو أكثر"""
+        video = parts[0]
+        sizes = [self.estimate_size(f, duration) for f in parts]
+        return {
+            'format': '+'.join(str(f['format_id']) for f in parts),
+            'size': sum(sizes) if all(sizes) else None,
+            'compatible': self._compatibility(parts),
+            'height': video.get('height'),
+            'tbr': sum(f.get('tbr') or 0 for f in parts)
+        }
+
+    @staticmethod
+    def estimate_size(fmt: Dict[str, Any], duration: float) -> Optional[int]:
+        """الحجم المقدر بالبايت من filesize أو filesize_approx أو tbr × المدة"""
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if size:
+            return int(size)
+        if fmt.get('tbr') and duration:
+            return int(fmt['tbr'] * 1000 / 8 * duration)
+        return None
+
+    def _compatibility(self, parts: List[Dict[str, Any]]) -> int:
+        """
+        2: MP4 جاهز لتيليجرام، 1: ترميزات متوافقة تحتاج نقل حاوية فقط، 0: يحتاج إعادة ترميز
+        """
+        video = parts[0]
+        audio = parts[-1] if len(parts) > 1 else video
+        codecs_ok = str(video.get('vcodec', '')).startswith(TELEGRAM_VIDEO_CODECS) \
+            and (not self._has_audio(audio) or self._audio_compatible(audio))
+        if not codecs_ok:
+            return 0
+        return 2 if all(f.get('ext') in ('mp4', 'm4a') for f in parts) else 1
+
+    @staticmethod
+    def _has_video(fmt: Dict[str, Any]) -> bool:
+        return fmt.get('vcodec') not in (None, 'none')
+
+    @staticmethod
+    def _has_audio(fmt: Dict[str, Any]) -> bool:
+        return fmt.get('acodec') not in (None, 'none')
+
+    @staticmethod
+    def _audio_compatible(fmt: Dict[str, Any]) -> bool:
+        return str(fmt.get('acodec', '')).startswith(TELEGRAM_AUDIO_CODECS)
+
+# إنشاء نسخة واحدة من المحدد
+format_selector = FormatSelector()
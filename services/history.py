@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+
+from config import config
+from database.session import run_in_session
+from database.models import Download
+from utils.tracing import tracer
+
+# رموز قصيرة للفلاتر داخل بيانات الأزرار (حد تيليجرام 64 بايت)
+HISTORY_PLATFORMS = {
+    'yt': 'YouTube',
+    'tt': 'TikTok',
+    'ig': 'Instagram',
+    'x': 'Twitter/X',
+    'fb': 'Facebook'
+}
+HISTORY_STATUSES = {
+    'c': 'completed',
+    'f': 'failed',
+    'p': 'pending'
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+def encode_cursor(download_date: datetime, download_id: int) -> str:
+    """موضع الصفحة كنص قصير: الوقت بالميكروثانية ثم المعرف بالنظام 36"""
+    micros = (download_date - _EPOCH) // timedelta(microseconds=1)
+    return f"{_base36(micros)}.{_base36(download_id)}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    micros, download_id = cursor.split('.')
+    return _EPOCH + timedelta(microseconds=int(micros, 36)), int(download_id, 36)
+
+def _base36(value: int) -> str:
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    text = ''
+    while True:
+        value, remainder = divmod(value, 36)
+        text = digits[remainder] + text
+        if not value:
+            return text
+
+class DownloadHistory:
+    """
+    صفحات سجل تحميلات المستخدم بالموضع (keyset) على (download_date, id)
+    كل صفحة تُقرأ من الفهرس مباشرة دون OFFSET أو عدّ السجل كاملاً
+    """
+
+    def __init__(self, page_size: Optional[int] = None):
+        self.page_size = page_size or config.HISTORY_PAGE_SIZE
+        self._index_ready = False
+
+    async def _run(self, func: Callable) -> Any:
+        with tracer.span('db.query', table=Download.__tablename__):
+            return await run_in_session(func)
+
+    async def ensure_index(self) -> None:
+        """إنشاء فهرس الصفحات في قواعد البيانات التي أُنشئت قبل إضافته"""
+        if not self._index_ready:
+            for index in Download.__table__.indexes:
+                await self._run(lambda session, index=index: index.create(session.connection(), checkfirst=True))
+            self._index_ready = True
+
+    async def page(
+        self,
+        user_id: int,
+        cursor: Optional[str] = None,
+        newer: bool = False,
+        platform: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        صفحة من السجل (الأحدث أولاً)
+        Args:
+            cursor: موضع آخر عنصر في الصفحة السابقة (بدونه تبدأ من الأحدث)
+            newer: القراءة نحو الأحدث من الموضع بدل الأقدم
+            platform, status: رمز المنصة أو الحالة من HISTORY_PLATFORMS / HISTORY_STATUSES
+        Returns:
+            {'items': [...], 'older': cursor أو None, 'newer': cursor أو None}
+        """
+        await self.ensure_index()
+        limit = self.page_size
+        position = decode_cursor(cursor) if cursor else None
+
+        def load(session) -> List[Dict[str, Any]]:
+            key = tuple_(Download.download_date, Download.id)
+            query = select(
+                Download.id, Download.url, Download.platform, Download.download_date,
+                Download.file_size, Download.status
+            ).where(Download.user_id == user_id, Download.download_date.is_not(None))
+            if platform:
+                query = query.where(Download.platform == HISTORY_PLATFORMS[platform])
+            if status:
+                query = query.where(Download.status == HISTORY_STATUSES[status])
+            if newer:
+                if position:
+                    query = query.where(key > position)
+                query = query.order_by(Download.download_date.asc(), Download.id.asc())
+            else:
+                if position:
+                    query = query.where(key < position)
+                query = query.order_by(Download.download_date.desc(), Download.id.desc())
+            # عنصر إضافي لمعرفة وجود صفحة تالية بدل العدّ
+            return [dict(row._mapping) for row in session.execute(query.limit(limit + 1))]
+
+        rows = await self._run(load)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if newer:
+            rows.reverse()
+        has_older = (has_more if not newer else True) and bool(rows)
+        has_newer = (has_more if newer else position is not None) and bool(rows)
+        return {
+            'items': rows,
+            'older': encode_cursor(rows[-1]['download_date'], rows[-1]['id']) if has_older else None,
+            'newer': encode_cursor(rows[0]['download_date'], rows[0]['id']) if has_newer else None
+        }
+
+# إنشاء نسخة واحدة من سجل التحميلات
+history_store = DownloadHistory()
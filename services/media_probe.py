@@ -0,0 +1,261 @@
+import os
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+from utils.logger import logger
+from utils.tracing import traced
+from utils.metrics import metrics, CACHE_REQUESTS
+
+# الترميزات التي يمكن نسخها كما هي داخل حاوية MP4 ويشغلها تيليجرام في جميع العملاء
+# (HEVC لا يعمل داخل المحادثة في كل العملاء، فنسخه خلف MP4_COPY_HEVC)
+MP4_COPY_VIDEO_CODECS = {'h264'}
+MP4_COPY_AUDIO_CODECS = {'aac', 'mp3'}
+
+# حجم العينة من بداية ونهاية الملف عند التخزين حسب المحتوى
+CONTENT_HASH_SAMPLE = 1024 * 1024
+
+class MediaProbe:
+    """
+    فحص ملفات الوسائط عبر ffprobe مع تخزين النتائج مؤقتاً
+    المفتاح هو هوية الملف (الجهاز، inode، الحجم، وقت التعديل) أو بصمة المحتوى،
+    فلا يُعاد الفحص عند نقل الملف أو إعادة تسميته ولا تُستخدم نتيجة قديمة بعد تعديله
+    """
+
+    def __init__(self, max_entries: int = 256, by_content: Optional[bool] = None):
+        self.max_entries = max_entries
+        self.by_content = config.PROBE_CACHE_BY_CONTENT if by_content is None else by_content
+        self._cache: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[Tuple, asyncio.Task] = {}
+
+    async def probe(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        تشغيل ffprobe مرة واحدة لكل نسخة من الملف
+        Args:
+            path: مسار ملف الوسائط
+        Returns:
+            مخرجات ffprobe (streams, format) أو None في حالة الفشل
+        """
+        try:
+            key = await self._cache_key(path)
+        except OSError as e:
+            logger.error("تعذر فحص الملف %s: %s", path, e)
+            return None
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            CACHE_REQUESTS.inc(1, 'ffprobe', 'hit')
+            return self._cache[key]
+        CACHE_REQUESTS.inc(1, 'ffprobe', 'miss')
+
+        # الطلبات المتزامنة لنفس الملف تنتظر عملية ffprobe واحدة
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run_ffprobe(path))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+        info = await asyncio.shield(task)
+        if info is not None:
+            self._cache[key] = info
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return info
+
+    async def _cache_key(self, path: str) -> Tuple:
+        """مفتاح التخزين: هوية الملف في نظام الملفات أو بصمة محتواه"""
+        stat = os.stat(path)
+        if self.by_content:
+            return ('content', stat.st_size, await asyncio.to_thread(self._content_hash, path, stat.st_size))
+        return ('inode', stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def _content_hash(path: str, size: int) -> str:
+        """بصمة من بداية الملف ونهايته (قراءة الملف كاملاً مكلفة للفيديوهات الكبيرة)"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            digest.update(f.read(CONTENT_HASH_SAMPLE))
+            if size > CONTENT_HASH_SAMPLE:
+                f.seek(max(CONTENT_HASH_SAMPLE, size - CONTENT_HASH_SAMPLE))
+                digest.update(f.read(CONTENT_HASH_SAMPLE))
+        return digest.hexdigest()
+
+    @staticmethod
+    @traced('ffprobe')
+    async def _run_ffprobe(path: str) -> Optional[Dict[str, Any]]:
+        """تشغيل ffprobe وتحليل مخرجات JSON"""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'ffprobe', '-v', 'error',
+                '-show_streams', '-show_format',
+                '-of', 'json',
+                path,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+        except OSError as e:
+            logger.error("تعذر تشغيل ffprobe: %s", e)
+            return None
+
+        if process.returncode != 0:
+            logger.error("ffprobe failed: %s", stderr.decode(errors='ignore'))
+            return None
+
+        try:
+            return json.loads(stdout or b'{}')
+        except ValueError as e:
+            logger.error("مخرجات ffprobe غير صالحة: %s", e)
+            return None
+
+    def clear(self) -> None:
+        """مسح الذاكرة المؤقتة"""
+        self._cache.clear()
+
+    @staticmethod
+    def get_stream(info: Optional[Dict[str, Any]], codec_type: str) -> Optional[Dict[str, Any]]:
+        """أول مسار من النوع المطلوب (video أو audio)"""
+        for stream in (info or {}).get('streams', []):
+            if stream.get('codec_type') == codec_type:
+                return stream
+        return None
+
+    @staticmethod
+    def get_duration(info: Optional[Dict[str, Any]]) -> float:
+        """المدة بالثواني من الحاوية أو من مسار الفيديو (0 إذا كانت غير معروفة)"""
+        video = MediaProbe.get_stream(info, 'video') or {}
+        for value in ((info or {}).get('format', {}).get('duration'), video.get('duration')):
+            try:
+                duration = float(value)
+            except (TypeError, ValueError):
+                continue
+            if duration > 0:
+                return duration
+        return 0.0
+
+    @staticmethod
+    def get_resolution(info: Optional[Dict[str, Any]]) -> Tuple[int, int]:
+        """(العرض، الارتفاع) لمسار الفيديو الأول أو (0، 0)"""
+        video = MediaProbe.get_stream(info, 'video') or {}
+        return int(video.get('width') or 0), int(video.get('height') or 0)
+
+    @staticmethod
+    def get_fps(info: Optional[Dict[str, Any]], default: float = 30.0) -> float:
+        """معدل الإطارات من avg_frame_rate (بصيغة 30000/1001)"""
+        video = MediaProbe.get_stream(info, 'video') or {}
+        num, _, den = (video.get('avg_frame_rate') or '').partition('/')
+        try:
+            fps = float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            return default
+        return fps if 0 < fps <= 120 else default
+
+    @staticmethod
+    def get_codecs(info: Optional[Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """أسماء ترميز الفيديو والصوت (None عند غياب المسار)"""
+        video = MediaProbe.get_stream(info, 'video')
+        audio = MediaProbe.get_stream(info, 'audio')
+        return {
+            'video': video.get('codec_name') if video else None,
+            'audio': audio.get('codec_name') if audio else None
+        }
+
+    @staticmethod
+    def get_bitrates(info: Optional[Dict[str, Any]]) -> Dict[str, int]:
+        """معدلات البت بالكيلوبت/ثانية للملف كاملاً ولكل مسار (0 إذا كانت غير معروفة)"""
+        def kbps(value: Any) -> int:
+            return int(value) // 1000 if str(value or '').isdigit() else 0
+
+        video = MediaProbe.get_stream(info, 'video') or {}
+        audio = MediaProbe.get_stream(info, 'audio') or {}
+        return {
+            'total': kbps((info or {}).get('format', {}).get('bit_rate')),
+            'video': kbps(video.get('bit_rate')),
+            'audio': kbps(audio.get('bit_rate'))
+        }
+
+    @staticmethod
+    def summarize(info: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """ملخص الخصائص التي تحتاجها الخدمات في قاموس واحد"""
+        width, height = MediaProbe.get_resolution(info)
+        return {
+            'duration': MediaProbe.get_duration(info),
+            'width': width,
+            'height': height,
+            'fps': MediaProbe.get_fps(info),
+            'codecs': MediaProbe.get_codecs(info),
+            'bitrates': MediaProbe.get_bitrates(info),
+            'has_video': MediaProbe.get_stream(info, 'video') is not None,
+            'has_audio': MediaProbe.get_stream(info, 'audio') is not None
+        }
+
+    async def describe(self, path: str) -> Optional[Dict[str, Any]]:
+        """فحص الملف وإرجاع الملخص مباشرة"""
+        info = await self.probe(path)
+        return self.summarize(info) if info is not None else None
+
+    async def is_valid_video(self, path: str) -> bool:
+        """ملف فيديو صالح: يقرأه ffprobe ويحتوي على مسار فيديو"""
+        info = await self.probe(path)
+        return self.get_stream(info, 'video') is not None
+
+def _copy_video_codecs() -> set:
+    """ترميزات الفيديو المسموح نسخها حسب الإعدادات"""
+    return MP4_COPY_VIDEO_CODECS | {'hevc'} if config.MP4_COPY_HEVC else MP4_COPY_VIDEO_CODECS
+
+def build_mp4_codec_args(
+    info: Optional[Dict[str, Any]],
+    video_encode: List[str],
+    audio_encode: List[str],
+    force_video_encode: bool = False
+) -> List[str]:
+    """
+    اختيار النسخ المباشر (-c copy) لكل مسار متوافق مع MP4 وإعادة ترميز غير المتوافق فقط
+    Args:
+        info: نتيجة MediaProbe.probe (None يعني إعادة ترميز كاملة)
+        video_encode: معاملات ترميز الفيديو عند الحاجة
+        audio_encode: معاملات ترميز الصوت عند الحاجة
+        force_video_encode: فرض ترميز الفيديو (مثلاً عند تغيير الدقة)
+    Returns:
+        معاملات ffmpeg الخاصة بالترميز والحاوية
+    """
+    video = MediaProbe.get_stream(info, 'video')
+    audio = MediaProbe.get_stream(info, 'audio')
+    args: List[str] = []
+
+    if video and not force_video_encode and video.get('codec_name') in _copy_video_codecs():
+        args += ['-c:v', 'copy']
+        if video.get('codec_name') == 'hevc':
+            args += ['-tag:v', 'hvc1']
+    else:
+        args += video_encode
+
+    if audio and audio.get('codec_name') in MP4_COPY_AUDIO_CODECS:
+        args += ['-c:a', 'copy']
+    else:
+        args += audio_encode
+
+    return args + ['-movflags', '+faststart']
+
+def is_mp4_ready(info: Optional[Dict[str, Any]]) -> bool:
+    """هل يمكن نقل جميع المسارات إلى MP4 بدون أي ترميز"""
+    video = MediaProbe.get_stream(info, 'video')
+    audio = MediaProbe.get_stream(info, 'audio')
+    return bool(video) \
+        and video.get('codec_name') in _copy_video_codecs() \
+        and (audio is None or audio.get('codec_name') in MP4_COPY_AUDIO_CODECS)
+
+# إنشاء نسخة واحدة من الفاحص لمشاركة الذاكرة المؤقتة
+media_probe = MediaProbe()
+metrics.function('probe_cache_entries', 'نتائج ffprobe المخزنة مؤقتاً', lambda: len(media_probe._cache))
+
+# واجهات الدوال للاستيراد المباشر
+async def probe_media(*args, **kwargs):
+    return await media_probe.probe(*args, **kwargs)
+
+async def describe_media(*args, **kwargs):
+    return await media_probe.describe(*args, **kwargs)
@@ -0,0 +1,261 @@
+import re
+import asyncio
+import threading
+from contextlib import aclosing
+from itertools import islice
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from config import config
+from utils.logger import logger
+from services.download_jobs import job_store, run_download_job
+from services.compression_planner import CompressionFailedError
+from services.progress import ProgressReporter
+from services.rate_limiter import rate_limiter, PlatformBlockedError
+from services.workspace import workspace_manager, WorkspaceFullError
+from services.ydl_pool import ydl_pool
+
+# روابط قوائم التشغيل (تُفحص قبل clean_url لأنه يحذف معامل list)
+PLAYLIST_URL_PATTERN = re.compile(r'https?://(www\.|m\.)?youtube\.com/playlist\?(.*&)?list=[\w\-]+')
+
+class PlaylistDownloader:
+    """
+    تحميل قوائم التشغيل كمهام فرعية
+    - العناصر تُستخرج تدريجياً (extract_flat) وتبدأ مهامها قبل اكتمال قراءة القائمة
+    - عدد التحميلات المتزامنة محدود لكل مستخدم مهما كان عدد قوائمه المفتوحة
+    - كل فيديو يُرسل فور اكتماله، ورسالة القائمة تعرض التقدم الإجمالي
+    """
+
+    def __init__(self, max_items: Optional[int] = None, max_parallel: Optional[int] = None):
+        self.max_items = max_items or config.PLAYLIST_MAX_ITEMS
+        self.max_parallel = max_parallel or config.PLAYLIST_MAX_PARALLEL
+        # user_id -> [الإشارة، عدد القوائم الجارية]
+        self._user_slots: Dict[int, list] = {}
+
+    @staticmethod
+    def is_playlist(url: str) -> bool:
+        """التحقق مما إذا كان الرابط قائمة تشغيل"""
+        return bool(PLAYLIST_URL_PATTERN.match(url.strip()))
+
+    def _acquire_user(self, user_id: int) -> asyncio.Semaphore:
+        entry = self._user_slots.setdefault(user_id, [asyncio.Semaphore(self.max_parallel), 0])
+        entry[1] += 1
+        return entry[0]
+
+    def _release_user(self, user_id: int) -> None:
+        entry = self._user_slots.get(user_id)
+        if entry:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._user_slots[user_id]
+
+    @staticmethod
+    def _enumerate(url: str, limit: int, push: Callable[[Dict[str, Any]], None], stop: threading.Event) -> None:
+        """
+        قراءة عناصر القائمة بدون معالجة الفيديوهات (متزامن، يُشغل في خيط منفصل)
+        الصفحات التالية لا تُطلب إلا عند الوصول إليها، وتتوقف القراءة عند إلغاء القائمة
+        """
+        with ydl_pool.checkout('default', {'extract_flat': 'in_playlist', 'noplaylist': False}) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+            push({'_type': 'meta', 'title': info.get('title'), 'count': info.get('playlist_count')})
+            for entry in islice(info.get('entries') or [], limit):
+                if stop.is_set():
+                    break
+                if entry:
+                    push(entry)
+
+    async def iter_entries(
+        self,
+        url: str,
+        limit: Optional[int] = None,
+        platform: str = 'YouTube'
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """عناصر القائمة فور قراءتها (أول عنصر يحمل _type=meta بعنوان القائمة وعددها)"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def push(item: Any) -> None:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        async def produce() -> None:
+            try:
+                # بدون إعادة محاولة حتى لا تتكرر العناصر المرسلة مسبقاً
+                await rate_limiter.run(platform, asyncio.to_thread, self._enumerate, url, limit or self.max_items, push, stop, retries=0)
+            finally:
+                push(done)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                yield item
+            await producer
+        finally:
+            stop.set()
+            if not producer.done():
+                producer.cancel()
+
+    @staticmethod
+    def _entry_url(entry: Dict[str, Any]) -> Optional[str]:
+        url = entry.get('url') or ''
+        if url.startswith('http'):
+            return url
+        if entry.get('id'):
+            return f"https://www.youtube.com/watch?v={entry['id']}"
+        return None
+
+    async def download(
+        self,
+        url: str,
+        message,
+        user_id: int,
+        quality: str = 'best',
+        max_size_mb: Optional[float] = None,
+        platform: str = 'YouTube',
+        entry_url: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None,
+        skip: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        on_complete: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        stop_after_skipped: int = 0
+    ) -> Dict[str, int]:
+        """
+        تحميل قائمة تشغيل وإرسال فيديوهاتها بالتتابع
+        Args:
+            url: رابط القائمة
+            message: رسالة الحالة الخاصة بالقائمة (تعرض التقدم الإجمالي)
+            user_id: معرف المستخدم لتطبيق حد التحميلات المتزامنة
+            platform: المنصة لحدود الاستخراج في rate_limiter
+            entry_url: بناء رابط العنصر من بيانات القائمة (الافتراضي رابط يوتيوب)
+            skip: عناصر لا تُحمّل (مثل ما استلمه المستخدم سابقاً)
+            on_complete: يُستدعى بعد إرسال كل عنصر بنجاح
+            stop_after_skipped: إيقاف القراءة بعد هذا العدد من العناصر المتخطاة المتتالية (0 = قراءة الكل)
+        Returns:
+            {'found', 'completed', 'failed', 'skipped'}
+        """
+        max_size_mb = max_size_mb or config.EFFECTIVE_MAX_FILE_SIZE_MB
+        entry_url = entry_url or self._entry_url
+        stats = {'found': 0, 'completed': 0, 'failed': 0, 'skipped': 0}
+        playlist = {'title': None, 'count': None, 'listing': True}
+        progress = ProgressReporter(message, "📃 جاري تحميل قائمة التشغيل...")
+
+        def report() -> None:
+            total = max(stats['found'], (playlist['count'] or 0) - stats['skipped'])
+            finished = stats['completed'] + stats['failed']
+            details = f"✅ {stats['completed']} | ❌ {stats['failed']} | 📥 {finished}/{total}"
+            if stats['skipped']:
+                details += f" | ⏭ {stats['skipped']}"
+            if playlist['listing']:
+                details += " (جاري قراءة القائمة)"
+            progress.title = f"📃 {playlist['title'] or 'قائمة التشغيل'}"
+            progress.report(finished / total * 100 if total else 0.0, details)
+
+        async def run_entry(index: int, entry: Dict[str, Any]) -> None:
+            ok = await self._download_entry(index, entry_url(entry), entry, message, user_id, quality, max_size_mb)
+            stats['completed' if ok else 'failed'] += 1
+            if ok and on_complete:
+                await on_complete(entry)
+            report()
+
+        slots = self._acquire_user(user_id)
+        tasks: Set[asyncio.Task] = set()
+        skipped_run = 0
+        try:
+            async with aclosing(self.iter_entries(url, platform=platform)) as entries:
+                async for entry in entries:
+                    if entry.get('_type') == 'meta':
+                        playlist['title'] = entry['title']
+                        playlist['count'] = min(entry['count'], self.max_items) if entry['count'] else None
+                        report()
+                        continue
+
+                    if skip and skip(entry):
+                        stats['skipped'] += 1
+                        skipped_run += 1
+                        # العناصر مرتبة من الأحدث، فتتابع عناصر مستلمة يعني أن الباقي أقدم
+                        if stop_after_skipped and skipped_run >= stop_after_skipped:
+                            break
+                        continue
+                    skipped_run = 0
+
+                    # انتظار مكان شاغر قبل قراءة العنصر التالي
+                    stats['found'] += 1
+                    await slots.acquire()
+                    task = asyncio.create_task(run_entry(stats['found'], entry))
+                    task.add_done_callback(lambda _: slots.release())
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+            playlist['listing'] = False
+            playlist['count'] = stats['found']
+            report()
+            if tasks:
+                await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            await progress.close()
+            self._release_user(user_id)
+
+        logger.info(
+            "اكتملت قائمة التشغيل %s: %s من %s "
+            "(فشل %s)",
+            url,
+            stats['completed'],
+            stats['found'],
+            stats['failed']
+        )
+        return stats
+
+    async def _download_entry(
+        self,
+        index: int,
+        url: Optional[str],
+        entry: Dict[str, Any],
+        message,
+        user_id: int,
+        quality: str,
+        max_size_mb: float
+    ) -> bool:
+        """تحميل عنصر واحد كمهمة مسجلة برسالة حالة خاصة به (فيُستأنف بعد إعادة التشغيل)"""
+        title = entry.get('title') or entry.get('id') or url
+        if not url:
+            return False
+
+        status = await message.reply_text(f"⏳ ({index}) {title}")
+        try:
+            async with workspace_manager.job(reserve_mb=max_size_mb * 2) as workspace:
+                job = await job_store.create(
+                    user_id=user_id,
+                    chat_id=status.chat_id,
+                    message_id=status.message_id,
+                    url=url,
+                    quality=quality,
+                    max_size_mb=max_size_mb,
+                    compress=True
+                )
+                result = await run_download_job(job, status, workspace, title=f"⏳ ({index}) {title}")
+            if result:
+                await status.delete()
+                return True
+            await status.edit_text(f"❌ ({index}) تعذر تحميل: {title}")
+        except CompressionFailedError as e:
+            await status.edit_text(f"❌ ({index}) تعذر ضغط الفيديو إلى {e.target_size_mb:g}MB: {title}")
+        except WorkspaceFullError:
+            await status.edit_text(f"⏳ ({index}) الخادم مشغول، تم تخطي: {title}")
+        except PlatformBlockedError as e:
+            await status.edit_text(f"⏳ ({index}) المنصة تقيد الطلبات، تم تخطي: {title}")
+            logger.warning("تخطي عنصر من القائمة بسبب التقييد: %s", e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("فشل تحميل عنصر القائمة %s: %s", url, e)
+            await status.edit_text(f"❌ ({index}) حدث خطأ أثناء تحميل: {title}")
+        return False
+
+# إنشاء نسخة واحدة مشتركة
+playlist_downloader = PlaylistDownloader()
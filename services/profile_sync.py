@@ -0,0 +1,219 @@
+import re
+import asyncio
+import hashlib
+from array import array
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set
+
+from sqlalchemy import select
+
+from config import config
+from database.session import run_in_session
+from database.models import SeenItems
+from utils.logger import logger
+from utils.tracing import tracer
+from services.playlist import playlist_downloader
+
+# روابط الحسابات والقصص التي تُحمّل كدفعة (kind -> النمط)
+PROFILE_URL_PATTERNS = {
+    'tiktok_user': re.compile(r'https?://(www\.|m\.)?tiktok\.com/@(?P<user>[\w\.-]+)/?(\?.*)?$'),
+    'instagram_stories': re.compile(r'https?://(www\.)?instagram\.com/stories/(?P<user>[\w\.]+)/(?P<item>\d+)/?(\?.*)?$'),
+    'instagram_user': re.compile(
+        r'https?://(www\.)?instagram\.com/(?!(p|reel|reels|tv|stories|explore|accounts)/)(?P<user>[\w\.]+)/?(\?.*)?$'
+    )
+}
+
+PLATFORMS = {
+    'tiktok_user': 'TikTok',
+    'instagram_stories': 'Instagram',
+    'instagram_user': 'Instagram'
+}
+
+def item_hash(item_id: str) -> int:
+    """بصمة 64 بت لمعرف العنصر (8 بايت بدل المعرف الكامل)"""
+    return int.from_bytes(hashlib.blake2b(item_id.encode(), digest_size=8).digest(), 'big')
+
+class SeenSet:
+    """
+    مجموعة مدمجة لمعرفات العناصر المستلمة من مصدر واحد
+    تُخزن بصمات 8 بايت بترتيب الإضافة، ويُحذف الأقدم عند تجاوز الحد
+    """
+
+    def __init__(self, data: bytes = b'', max_items: Optional[int] = None):
+        self.max_items = max_items or config.SEEN_ITEMS_MAX
+        self._order = array('Q')
+        self._order.frombytes(data)
+        self._members: Set[int] = set(self._order)
+        self.dirty = False
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_hash(item_id) in self._members
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def add(self, item_id: str) -> None:
+        value = item_hash(item_id)
+        if value in self._members:
+            return
+        self._order.append(value)
+        self._members.add(value)
+        if len(self._order) > self.max_items:
+            for old in self._order[:-self.max_items]:
+                self._members.discard(old)
+            del self._order[:-self.max_items]
+        self.dirty = True
+
+    def to_bytes(self) -> bytes:
+        return self._order.tobytes()
+
+class SeenItemStore:
+    """تخزين مجموعات العناصر المستلمة لكل مستخدم ومصدر في قاعدة البيانات"""
+
+    def __init__(self):
+        self._table_ready = False
+
+    async def _run(self, func: Callable) -> Any:
+        with tracer.span('db.query', table=SeenItems.__tablename__):
+            return await run_in_session(func)
+
+    async def ensure_table(self) -> None:
+        """إنشاء الجدول إذا لم يكن موجوداً"""
+        if not self._table_ready:
+            await self._run(lambda session: SeenItems.__table__.create(session.connection(), checkfirst=True))
+            self._table_ready = True
+
+    async def load(self, user_id: int, source: str) -> SeenSet:
+        """مجموعة العناصر المستلمة (فارغة لأول طلب)"""
+        await self.ensure_table()
+        data = await self._run(lambda session: session.execute(
+            select(SeenItems.item_hashes).where(SeenItems.user_id == user_id, SeenItems.source == source)
+        ).scalar())
+        return SeenSet(data or b'')
+
+    async def save(self, user_id: int, source: str, seen: SeenSet) -> None:
+        """حفظ المجموعة إذا تغيرت"""
+        if not seen.dirty:
+            return
+        data = seen.to_bytes()
+
+        def upsert(session) -> None:
+            row = session.execute(
+                select(SeenItems).where(SeenItems.user_id == user_id, SeenItems.source == source)
+            ).scalar()
+            if row is None:
+                session.add(SeenItems(user_id=user_id, source=source, item_hashes=data))
+            else:
+                row.item_hashes = data
+                row.updated_at = datetime.utcnow()
+
+        await self._run(upsert)
+        seen.dirty = False
+
+class ProfileSync:
+    """
+    تحميل جديد حساب أو قصة فقط
+    - عناصر الحساب تُقرأ من الأحدث، وما استلمه المستخدم سابقاً يُتخطى
+    - القراءة تتوقف بعد عدة عناصر مستلمة متتالية، فالطلب المتكرر يكلف الفرق فقط
+    - العنصر يُعلَّم كمستلم بعد إرساله بنجاح، فالفاشل يُعاد في الطلب التالي
+    """
+
+    @staticmethod
+    def match(url: str) -> Optional[Dict[str, str]]:
+        """
+        نوع الرابط إذا كان حساباً أو قصة
+        Returns:
+            {'kind', 'user', 'platform', 'source'} أو None
+        """
+        url = url.strip()
+        for kind, pattern in PROFILE_URL_PATTERNS.items():
+            match = pattern.match(url)
+            if match:
+                user = match.group('user').lower()
+                return {
+                    'kind': kind,
+                    'user': user,
+                    'platform': PLATFORMS[kind],
+                    'source': f"{kind}:{user}"
+                }
+        return None
+
+    @staticmethod
+    def _entry_url(kind: str, user: str) -> Callable[[Dict[str, Any]], Optional[str]]:
+        """بناء رابط العنصر الفردي حسب نوع المصدر"""
+        def build(entry: Dict[str, Any]) -> Optional[str]:
+            url = entry.get('webpage_url') or entry.get('url') or ''
+            if kind == 'instagram_user' and url.startswith('http'):
+                return url
+            if not entry.get('id'):
+                return url if url.startswith('http') else None
+            if kind == 'tiktok_user':
+                return f"https://www.tiktok.com/@{user}/video/{entry['id']}"
+            if kind == 'instagram_stories':
+                return f"https://www.instagram.com/stories/{user}/{entry['id']}/"
+            return url if url.startswith('http') else None
+        return build
+
+    @staticmethod
+    def _entry_id(entry: Dict[str, Any]) -> str:
+        return str(entry.get('id') or entry.get('url') or '')
+
+    async def sync(
+        self,
+        url: str,
+        message,
+        user_id: int,
+        quality: str = 'best',
+        max_size_mb: Optional[float] = None
+    ) -> Optional[Dict[str, int]]:
+        """
+        تحميل العناصر الجديدة من الحساب أو القصة
+        Returns:
+            إحصائيات القائمة ({'found', 'completed', 'failed', 'skipped'}) أو None إذا لم يكن الرابط مدعوماً
+        """
+        target = self.match(url)
+        if not target:
+            return None
+
+        seen = await seen_store.load(user_id, target['source'])
+        first_sync = len(seen) == 0
+
+        save_lock = asyncio.Lock()
+
+        async def mark(entry: Dict[str, Any]) -> None:
+            # الحفظ بعد كل عنصر حتى لا يُعاد إرساله إذا توقفت المزامنة في منتصفها
+            async with save_lock:
+                seen.add(self._entry_id(entry))
+                try:
+                    await seen_store.save(user_id, target['source'], seen)
+                except Exception as e:
+                    logger.error("تعذر حفظ العناصر المستلمة لـ %s: %s", target['source'], e)
+
+        stats = await playlist_downloader.download(
+            url,
+            message,
+            user_id,
+            quality=quality,
+            max_size_mb=max_size_mb,
+            platform=target['platform'],
+            entry_url=self._entry_url(target['kind'], target['user']),
+            skip=lambda entry: self._entry_id(entry) in seen,
+            on_complete=mark,
+            # أول طلب يقرأ حتى الحد، والطلبات التالية تتوقف عند بداية ما سبق إرساله
+            # (القصص مرتبة من الأقدم وتُقرأ في طلب واحد فلا يُختصر قراءتها)
+            stop_after_skipped=0 if first_sync or target['kind'] == 'instagram_stories'
+            else config.PROFILE_SYNC_STOP_AFTER_SEEN
+        )
+        logger.info(
+            "مزامنة %s للمستخدم %s: %s جديد، "
+            "%s مستلم سابقاً",
+            target['source'],
+            user_id,
+            stats['completed'],
+            stats['skipped']
+        )
+        return stats
+
+# إنشاء نسخ واحدة مشتركة
+seen_store = SeenItemStore()
+profile_sync = ProfileSync()
@@ -0,0 +1,239 @@
+import asyncio
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import config
+from utils.helpers import (
+    format_duration,
+    format_file_size,
+    generate_progress_bar,
+    safe_int_convert
+)
+from utils.logger import logger
+from utils.tracing import traced
+from utils.metrics import timed, STAGE_SECONDS, FFMPEG_IN_FLIGHT
+
+class ProgressReporter:
+    """
+    عرض التقدم الحي في رسالة الحالة مع دمج التعديلات
+    يستقبل أحداث yt-dlp و ffmpeg (-progress pipe:1) ويعدّل الرسالة
+    مرة واحدة على الأكثر كل min_interval ثانية مع تجاهل النصوص المكررة
+    """
+
+    # آخر وقت تعديل لكل رسالة (chat_id, message_id) مشترك بين جميع المراسلين
+    _last_edit_at: Dict[Tuple[int, int], float] = {}
+
+    def __init__(self, message, title: str, min_interval: Optional[float] = None):
+        self.message = message
+        self.title = title
+        self.min_interval = config.PROGRESS_EDIT_INTERVAL if min_interval is None else min_interval
+        self._loop = asyncio.get_running_loop()
+        self._key = (message.chat_id, message.message_id)
+        self._last_text: Optional[str] = None
+        self._pending_text: Optional[str] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._ffmpeg_state: Dict[str, str] = {}
+        self._closed = False
+
+    def report(self, percentage: float, details: str = "") -> None:
+        """
+        تسجيل نسبة تقدم جديدة (آمن للاستدعاء من أي خيط)
+        Args:
+            percentage: نسبة التقدم من 0 إلى 100
+            details: سطر إضافي يعرض تحت شريط التقدم
+        """
+        percentage = max(0.0, min(100.0, percentage))
+        text = f"{self.title}\n{generate_progress_bar(percentage)}"
+        if details:
+            text += f"\n{details}"
+
+        try:
+            self._loop.call_soon_threadsafe(self._submit, text)
+        except RuntimeError:
+            # الحلقة أغلقت قبل انتهاء المهمة
+            pass
+
+    def ytdlp_hook(self, d: Dict[str, Any]) -> None:
+        """دالة progress_hooks الخاصة بـ yt-dlp"""
+        status = d.get('status')
+        if status == 'finished':
+            self.report(100.0)
+            return
+        if status != 'downloading':
+            return
+
+        downloaded = d.get('downloaded_bytes') or 0
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if total:
+            percentage = downloaded / total * 100
+        elif d.get('fragment_count'):
+            percentage = (d.get('fragment_index') or 0) / d['fragment_count'] * 100
+        else:
+            return
+
+        details: List[str] = [
+            f"📦 {format_file_size(downloaded)}" + (f" / {format_file_size(total)}" if total else "")
+        ]
+        if d.get('speed'):
+            details.append(f"🚀 {format_file_size(d['speed'])}/s")
+        if d.get('eta') is not None:
+            details.append(f"⏱ {format_duration(d['eta'])}")
+
+        self.report(percentage, " | ".join(details))
+
+    def ffmpeg_hook(self, line: str, duration: float) -> None:
+        """
+        معالجة سطر من مخرجات ffmpeg -progress
+        Args:
+            line: سطر بصيغة key=value
+            duration: مدة الفيديو المصدر بالثواني
+        """
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return
+
+        self._ffmpeg_state[key] = value
+        if key != 'progress':
+            return
+
+        out_time = safe_int_convert(
+            self._ffmpeg_state.get('out_time_us') or self._ffmpeg_state.get('out_time_ms')
+        ) / 1_000_000
+        if value == 'end':
+            percentage = 100.0
+        elif duration > 0:
+            percentage = out_time / duration * 100
+        else:
+            return
+
+        details = f"⏱ {format_duration(out_time)} / {format_duration(duration)}"
+        speed = self._ffmpeg_state.get('speed', '').strip()
+        if speed and speed != 'N/A':
+            details += f" | ⚡ {speed}"
+
+        self.report(percentage, details)
+
+    async def close(self) -> None:
+        """إيقاف المراسل وإلغاء أي تعديل معلق"""
+        self._closed = True
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        # أوقات التعديل الأقدم من الفاصل الأدنى لم تعد تقيد أحداً (تبقى فقط الرسائل النشطة حديثاً)
+        cutoff = time.monotonic() - self.min_interval
+        for key in [key for key, edited_at in self._last_edit_at.items() if edited_at < cutoff]:
+            del self._last_edit_at[key]
+
+    def _submit(self, text: str) -> None:
+        """جدولة تعديل الرسالة مع احترام الفاصل الزمني الأدنى"""
+        if self._closed or text == self._last_text:
+            return
+
+        self._pending_text = text
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = self._loop.create_task(self._flush(self._next_delay()))
+
+    def _next_delay(self) -> float:
+        last_edit = self._last_edit_at.get(self._key, 0.0)
+        return max(0.0, last_edit + self.min_interval - time.monotonic())
+
+    async def _flush(self, delay: float) -> None:
+        """
+        تنفيذ آخر نص معلق بعد انتهاء فترة الانتظار
+        النصوص التي تصل أثناء انتظار تعديل الرسالة تُنفذ في الدورة التالية (مثل 100% الأخيرة)
+        """
+        while True:
+            if delay:
+                await asyncio.sleep(delay)
+
+            text, self._pending_text = self._pending_text, None
+            if self._closed or text is None:
+                return
+
+            if text != self._last_text:
+                self._last_edit_at[self._key] = time.monotonic()
+                self._last_text = text
+                try:
+                    await self.message.edit_text(text)
+                except Exception as e:
+                    logger.debug("تعذر تحديث رسالة التقدم: %s", e)
+
+            if self._pending_text is None:
+                return
+            delay = self._next_delay()
+
+@traced('ffmpeg')
+@timed(STAGE_SECONDS, 'transcode')
+async def run_ffmpeg_with_progress(
+    command: List[str],
+    progress: Optional[ProgressReporter] = None,
+    duration: float = 0.0,
+    stdin: Optional[AsyncIterator[bytes]] = None
+) -> Tuple[int, bytes]:
+    """
+    تشغيل أمر ffmpeg بشكل غير متزامن مع تمرير التقدم إلى المراسل
+    Args:
+        command: أمر ffmpeg الكامل
+        progress: مراسل التقدم (اختياري)
+        duration: مدة الفيديو المصدر لحساب النسبة
+        stdin: مصدر بيانات يُكتب في stdin (مع -i pipe:0) بدل قراءة ملف
+    Returns:
+        (رمز الخروج, مخرجات stderr)
+    """
+    if progress:
+        command = [command[0], '-progress', 'pipe:1', '-nostats', *command[1:]]
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.create_task(process.stderr.read())
+    feed_task = asyncio.create_task(_feed_stdin(process, stdin)) if stdin is not None else None
+
+    FFMPEG_IN_FLIGHT.inc()
+    try:
+        async for raw_line in process.stdout:
+            if progress:
+                progress.ffmpeg_hook(raw_line.decode(errors='ignore'), duration)
+        stderr = await stderr_task
+        returncode = await process.wait()
+        if feed_task:
+            await feed_task
+        return returncode, stderr
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        if feed_task:
+            feed_task.cancel()
+            await asyncio.gather(feed_task, return_exceptions=True)
+        raise
+    finally:
+        FFMPEG_IN_FLIGHT.dec()
+
+async def _feed_stdin(process: asyncio.subprocess.Process, source: AsyncIterator[bytes]) -> None:
+    """
+    كتابة البيانات في stdin الخاص بـ ffmpeg مع احترام ضغط الأنبوب (drain)
+    أخطاء المصدر تُنهي ffmpeg حتى لا يكتمل ملف ناقص
+    المصدر يُغلق (aclose) عند الخروج بأي سبب حتى لا يبقى اتصال HTTP مفتوحاً
+    """
+    try:
+        async with aclosing(source) as chunks:
+            async for data in chunks:
+                process.stdin.write(data)
+                await process.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg أغلق المدخل (خطأ أو اكتفى بالبيانات) ورمز خروجه يحدد النتيجة
+        return
+    except Exception as e:
+        logger.error("انقطع مصدر البث إلى ffmpeg: %s", e)
+        process.stdin.close()
+        process.kill()
+        raise
+    try:
+        process.stdin.close()
+        await process.stdin.wait_closed()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
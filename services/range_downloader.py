@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import aiofiles
+import httpx
+
+from config import config
+from utils.helpers import format_file_size
+from utils.logger import logger
+from utils.tracing import traced
+from utils.metrics import timed, STAGE_SECONDS
+
+class RangeHTTPError(RuntimeError):
+    """رد HTTP غير ناجح من رابط الوسائط المباشر"""
+
+    def __init__(self, status_code: int, reason: str = ''):
+        super().__init__(f"HTTP Error {status_code}: {reason}")
+        self.status_code = status_code
+
+class BandwidthLimiter:
+    """حد إجمالي لسرعة التحميل (بايت/ثانية) مشترك بين جميع الاتصالات"""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._allowance = float(rate)
+        self._updated = time.monotonic()
+
+    async def consume(self, size: int) -> None:
+        """انتظار حتى يسمح الحد بتمرير size بايت"""
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._allowance = min(float(self.rate), self._allowance + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._allowance >= size or self._allowance >= self.rate:
+                self._allowance -= size
+                return
+            await asyncio.sleep((min(size, self.rate) - self._allowance) / self.rate)
+
+class RangeDownloader:
+    """
+    تحميل الروابط المباشرة عبر عدة اتصالات بطلبات Range
+    - الملف يُقسم إلى أجزاء ثابتة الحجم تسحبها الاتصالات من طابور مشترك وتكتبها في موضعها
+    - الأجزاء المكتملة تُحفظ في ملف حالة بجانب .part، فيُستكمل التحميل بعد الانقطاع
+    - الخوادم التي لا تدعم Range تُحمّل باتصال واحد
+    """
+
+    def __init__(
+        self,
+        connections: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        bandwidth: Optional[BandwidthLimiter] = None
+    ):
+        self.connections = connections or config.RANGE_DOWNLOAD_CONNECTIONS
+        self.chunk_size = chunk_size or config.RANGE_DOWNLOAD_CHUNK_SIZE
+        self.bandwidth = bandwidth or bandwidth_limiter
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """الحصول على العميل المشترك وإنشاؤه عند أول استخدام"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.connections * 4)
+            )
+        return self._client
+
+    @traced('http.range_download')
+    @timed(STAGE_SECONDS, 'download')
+    async def download(
+        self,
+        url: str,
+        output_path: str,
+        headers: Optional[Dict[str, str]] = None,
+        progress_hook: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> str:
+        """
+        تحميل الرابط إلى output_path
+        Args:
+            url: رابط ملف الوسائط المباشر
+            output_path: المسار النهائي (يُكتب أولاً في output_path.part)
+            headers: ترويسات HTTP المطلوبة من المنصة (http_headers في yt-dlp)
+            progress_hook: دالة تستقبل أحداث التقدم بصيغة yt-dlp
+        Returns:
+            مسار الملف المكتمل
+        Raises:
+            RangeHTTPError: عند رد HTTP غير ناجح (بصيغة "HTTP Error <code>")
+        """
+        headers = dict(headers or {})
+        part_path = Path(f"{output_path}.part")
+        state_path = Path(f"{output_path}.part.state")
+
+        size, validator = await self._inspect(url, headers)
+        if not size or self.connections <= 1:
+            await self._download_single(url, headers, part_path, progress_hook)
+        else:
+            state = self._load_state(state_path, size, validator)
+            await self._download_ranges(url, headers, part_path, state_path, state, progress_hook)
+
+        os.replace(part_path, output_path)
+        state_path.unlink(missing_ok=True)
+        if progress_hook:
+            progress_hook({'status': 'finished', 'filename': output_path})
+        return output_path
+
+    async def _inspect(self, url: str, headers: Dict[str, str]) -> Tuple[Optional[int], str]:
+        """
+        معرفة حجم الملف ودعم Range بطلب البايت الأول فقط
+        Returns:
+            (الحجم أو None إذا لم تُدعم النطاقات، معرّف نسخة الملف ETag/Last-Modified)
+        """
+        async with self._get_client().stream('GET', url, headers={**headers, 'Range': 'bytes=0-0'}) as response:
+            self._raise_for_status(response)
+            validator = response.headers.get('etag') or response.headers.get('last-modified') or ''
+            content_range = response.headers.get('content-range', '')
+            if response.status_code != 206 or '/' not in content_range:
+                return None, validator
+            total = content_range.rsplit('/', 1)[1]
+            return (int(total) if total.isdigit() else None), validator
+
+    def _load_state(self, state_path: Path, size: int, validator: str) -> Dict[str, Any]:
+        """تحميل حالة الاستكمال إذا كانت لنفس نسخة الملف وإلا البدء من جديد"""
+        try:
+            state = json.loads(state_path.read_text(encoding='utf-8'))
+            if state['size'] == size and state['validator'] == validator and state['chunk_size'] == self.chunk_size:
+                logger.info("استكمال التحميل: %s أجزاء مكتملة مسبقاً", len(state['done']))
+                return state
+        except (OSError, ValueError, KeyError):
+            pass
+        return {'size': size, 'validator': validator, 'chunk_size': self.chunk_size, 'done': []}
+
+    @staticmethod
+    def _save_state(state_path: Path, state: Dict[str, Any]) -> None:
+        """حفظ الحالة بشكل ذري حتى لا يتلف الملف عند توقف العملية أثناء الكتابة"""
+        tmp_path = state_path.with_name(state_path.name + '.tmp')
+        tmp_path.write_text(json.dumps(state), encoding='utf-8')
+        os.replace(tmp_path, state_path)
+
+    async def _download_ranges(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        part_path: Path,
+        state_path: Path,
+        state: Dict[str, Any],
+        progress_hook: Optional[Callable[[Dict[str, Any]], None]]
+    ) -> None:
+        """تحميل الأجزاء المتبقية بالتوازي"""
+        size = state['size']
+        chunk_count = (size + self.chunk_size - 1) // self.chunk_size
+        done = set(state['done'])
+
+        if not part_path.exists() or part_path.stat().st_size != size:
+            # حجز الملف بحجمه النهائي لتكتب كل الاتصالات في مواضعها
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+            done.clear()
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for index in range(chunk_count):
+            if index not in done:
+                queue.put_nowait(index)
+
+        downloaded = sum(min(self.chunk_size, size - i * self.chunk_size) for i in done)
+        started_at = time.monotonic()
+        resumed_bytes = downloaded
+
+        def report(received: int) -> None:
+            nonlocal downloaded
+            downloaded += received
+            if progress_hook:
+                elapsed = max(time.monotonic() - started_at, 1e-6)
+                speed = (downloaded - resumed_bytes) / elapsed
+                progress_hook({
+                    'status': 'downloading',
+                    'tmpfilename': str(part_path),
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': size,
+                    'speed': speed,
+                    'eta': (size - downloaded) / speed if speed else None
+                })
+
+        async def worker() -> None:
+            async with aiofiles.open(part_path, 'r+b') as f:
+                while not queue.empty():
+                    index = queue.get_nowait()
+                    start = index * self.chunk_size
+                    end = min(start + self.chunk_size, size) - 1
+                    await self._fetch_range(url, headers, f, start, end, report)
+                    done.add(index)
+                    state['done'] = sorted(done)
+                    self._save_state(state_path, state)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.connections, queue.qsize()))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+
+        logger.info(
+            "اكتمل التحميل المتوازي: %s عبر %s اتصالات "
+            "في %.1f ثانية",
+            format_file_size(size),
+            self.connections,
+            time.monotonic() - started_at
+        )
+
+    async def _fetch_range(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        f,
+        start: int,
+        end: int,
+        report: Callable[[int], None]
+    ) -> None:
+        """تحميل نطاق واحد وكتابته في موضعه من الملف"""
+        request_headers = {**headers, 'Range': f'bytes={start}-{end}'}
+        async with self._get_client().stream('GET', url, headers=request_headers) as response:
+            self._raise_for_status(response)
+            if response.status_code != 206:
+                raise RuntimeError(f"الخادم تجاهل طلب النطاق {start}-{end}")
+            await f.seek(start)
+            async for data in response.aiter_bytes(config.UPLOAD_CHUNK_SIZE):
+                await self.bandwidth.consume(len(data))
+                await f.write(data)
+                report(len(data))
+
+    async def _download_single(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        part_path: Path,
+        progress_hook: Optional[Callable[[Dict[str, Any]], None]]
+    ) -> None:
+        """التحميل باتصال واحد عندما لا يدعم الخادم النطاقات"""
+        downloaded = 0
+        started_at = time.monotonic()
+        async with self._get_client().stream('GET', url, headers=headers) as response:
+            self._raise_for_status(response)
+            total = int(response.headers.get('content-length') or 0) or None
+            async with aiofiles.open(part_path, 'wb') as f:
+                async for data in response.aiter_bytes(config.UPLOAD_CHUNK_SIZE):
+                    await self.bandwidth.consume(len(data))
+                    await f.write(data)
+                    downloaded += len(data)
+                    if progress_hook:
+                        speed = downloaded / max(time.monotonic() - started_at, 1e-6)
+                        progress_hook({
+                            'status': 'downloading',
+                            'tmpfilename': str(part_path),
+                            'downloaded_bytes': downloaded,
+                            'total_bytes': total,
+                            'speed': speed,
+                            'eta': (total - downloaded) / speed if total and speed else None
+                        })
+
+    async def stream(self, url: str, headers: Optional[Dict[str, str]] = None) -> AsyncIterator[bytes]:
+        """
+        بث محتوى الرابط على دفعات باتصال واحد مع احترام حد السرعة الإجمالي
+        (لتمريره مباشرة إلى ffmpeg بدون ملف وسيط)
+        """
+        async with self._get_client().stream('GET', url, headers=dict(headers or {})) as response:
+            self._raise_for_status(response)
+            async for data in response.aiter_bytes(config.UPLOAD_CHUNK_SIZE):
+                await self.bandwidth.consume(len(data))
+                yield data
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response) -> None:
+        """تحويل ردود الخطأ إلى رسالة بصيغة yt-dlp ليتعرف عليها محدد المنصات"""
+        if response.status_code >= 400:
+            raise RangeHTTPError(response.status_code, response.reason_phrase)
+
+    async def close(self) -> None:
+        """إغلاق العميل المشترك عند إيقاف التطبيق"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+
+def pick_direct_format(info: Dict[str, Any], format_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    الصيغة المختارة إذا كانت ملفاً واحداً عبر HTTP مباشر يستحق التحميل المتوازي
+    (الصيغ المجزأة HLS/DASH تُحمّل بـ concurrent_fragment_downloads في yt-dlp)
+    """
+    if not config.RANGE_DOWNLOAD_ENABLED or not format_id or '+' in format_id:
+        return None
+    formats: List[Dict[str, Any]] = info.get('formats') or []
+    fmt = next((f for f in formats if str(f.get('format_id')) == format_id), None)
+    if not fmt or fmt.get('protocol') not in ('http', 'https') or not fmt.get('url'):
+        return None
+    size = fmt.get('filesize') or fmt.get('filesize_approx') or 0
+    if size < config.RANGE_DOWNLOAD_MIN_SIZE_MB * 1024 * 1024:
+        return None
+    return fmt
+
+# حد السرعة الإجمالي ونسخة التحميل المشتركة
+bandwidth_limiter = BandwidthLimiter(config.DOWNLOAD_BANDWIDTH_LIMIT)
+range_downloader = RangeDownloader()
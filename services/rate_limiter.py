@@ -0,0 +1,262 @@
+import re
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from config import config
+from utils.logger import logger
+from utils.metrics import metrics
+
+# رسائل أخطاء yt-dlp التي تدل على تقييد المنصة للطلبات
+RATE_LIMIT_PATTERN = re.compile(
+    r'HTTP Error (429|403)|Too Many Requests|rate[- ]?limit|Please wait a few minutes',
+    re.IGNORECASE
+)
+
+class PlatformBlockedError(RuntimeError):
+    """المنصة موقوفة مؤقتاً بعد تكرار أخطاء الحظر (قاطع الدائرة مفتوح)"""
+
+    def __init__(self, platform: str, retry_after: float):
+        super().__init__(f"المنصة {platform} موقوفة مؤقتاً، إعادة المحاولة بعد {retry_after:.0f} ثانية")
+        self.platform = platform
+        self.retry_after = retry_after
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """هل الخطأ ناتج عن تقييد المنصة (429/403) وليس عن رابط غير صالح"""
+    return bool(RATE_LIMIT_PATTERN.search(str(error)))
+
+class TokenBucket:
+    """دلو رموز لتحديد عدد الطلبات في الثانية مع السماح بدفعة قصيرة"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """انتظار توفر رمز واحد وإرجاع مدة الانتظار"""
+        waited = 0.0
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            delay = (1 - self.tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+class CircuitBreaker:
+    """
+    قاطع دائرة لكل منصة
+    closed: الطلبات تمر، open: رفض فوري حتى انتهاء فترة التهدئة، half_open: طلب تجريبي واحد
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    def allow(self) -> bool:
+        """هل يُسمح بتمرير طلب جديد"""
+        if self.state == 'open':
+            if self.retry_after() > 0:
+                return False
+            self.state = 'half_open'
+        if self.state == 'half_open':
+            if self._trial_running:
+                return False
+            self._trial_running = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = 'closed'
+        self.failures = 0
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        """تسجيل خطأ حظر وفتح الدائرة عند تجاوز الحد أو فشل الطلب التجريبي"""
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.threshold:
+            self.state = 'open'
+            self._opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release(self) -> None:
+        """إنهاء الطلب التجريبي دون نتيجة تحسم حالة الدائرة (خطأ آخر أو إلغاء)"""
+        self._trial_running = False
+
+class PlatformLimiter:
+    """حدود منصة واحدة: التزامن، معدل الطلبات، التراجع التكيفي وقاطع الدائرة"""
+
+    def __init__(self, platform: str, limits: Dict[str, float]):
+        self.platform = platform
+        self.concurrency = int(limits.get('concurrency', 1))
+        self.base_rate = float(limits.get('rate', 1.0))
+        self.bucket = TokenBucket(self.base_rate, float(limits.get('burst', 1)))
+        self.breaker = CircuitBreaker(config.CIRCUIT_BREAKER_THRESHOLD, config.CIRCUIT_BREAKER_COOLDOWN)
+        self.backoff = 0.0
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.metrics: Dict[str, float] = {
+            'requests': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'throttled': 0,
+            'rejected': 0,
+            'retries': 0,
+            'wait_seconds': 0.0,
+            'busy_seconds': 0.0
+        }
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """إنشاء الإشارة داخل حلقة الأحداث العاملة"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def on_throttled(self) -> None:
+        """
+        تراجع تكيفي بعد 429/403: مضاعفة فترة الإيقاف وتنصيف معدل الطلبات
+        """
+        self.metrics['throttled'] += 1
+        self.backoff = min(config.RATE_LIMIT_BACKOFF_MAX, max(config.RATE_LIMIT_BACKOFF_BASE, self.backoff * 2))
+        self.paused_until = time.monotonic() + self.backoff
+        self.bucket.rate = max(self.base_rate / 16, self.bucket.rate / 2)
+        self.breaker.record_failure()
+        logger.warning(
+            "⚠️ تقييد من %s: إيقاف %.0f ثانية، "
+            "المعدل %.2f طلب/ثانية، الدائرة %s",
+            self.platform,
+            self.backoff,
+            self.bucket.rate,
+            self.breaker.state
+        )
+
+    def on_success(self) -> None:
+        """استعادة المعدل تدريجياً بعد النجاح"""
+        self.metrics['succeeded'] += 1
+        self.backoff = self.backoff / 2 if self.backoff >= config.RATE_LIMIT_BACKOFF_BASE else 0.0
+        self.bucket.rate = min(self.base_rate, self.bucket.rate + self.base_rate * 0.1)
+        self.breaker.record_success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            'in_flight': self.in_flight,
+            'rate': round(self.bucket.rate, 3),
+            'backoff_seconds': self.backoff,
+            'circuit': self.breaker.state
+        }
+
+class RateLimiter:
+    """
+    تنظيم طلبات الاستخراج والتحميل لكل منصة على حدة
+    إنستجرام وتيك توك يقيدان الطلبات بشدة، فتمر جميع عمليات yt-dlp من هنا
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None):
+        self.limits = limits or config.PLATFORM_LIMITS
+        self._limiters: Dict[str, PlatformLimiter] = {}
+
+    def get(self, platform: str) -> PlatformLimiter:
+        """محدد المنصة (يُنشأ عند أول طلب)"""
+        if platform not in self._limiters:
+            limits = self.limits.get(platform) or self.limits.get('default', {})
+            self._limiters[platform] = PlatformLimiter(platform, limits)
+        return self._limiters[platform]
+
+    async def run(
+        self,
+        platform: str,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        retries: Optional[int] = None,
+        **kwargs
+    ) -> Any:
+        """
+        تنفيذ عملية ضمن حدود المنصة مع إعادة المحاولة بعد أخطاء التقييد
+        Args:
+            platform: اسم المنصة من get_platform
+            func: دالة غير متزامنة تنفذ الطلب
+            retries: عدد مرات إعادة المحاولة (الافتراضي من الإعدادات)
+        Raises:
+            PlatformBlockedError: إذا كانت المنصة موقوفة مؤقتاً
+        """
+        limiter = self.get(platform)
+        retries = config.RATE_LIMIT_MAX_RETRIES if retries is None else retries
+
+        for attempt in range(retries + 1):
+            if not limiter.breaker.allow():
+                limiter.metrics['rejected'] += 1
+                raise PlatformBlockedError(platform, limiter.breaker.retry_after())
+
+            # الطلب التجريبي في half_open يُحرر مهما انتهى (نجاح، خطأ، أو إلغاء المهمة)
+            trial = limiter.breaker.state == 'half_open'
+            try:
+                limiter.metrics['requests'] += 1
+                if attempt:
+                    limiter.metrics['retries'] += 1
+
+                queued_at = time.monotonic()
+                async with limiter.semaphore:
+                    pause = limiter.paused_until - time.monotonic()
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+                    await limiter.bucket.acquire()
+                    started_at = time.monotonic()
+                    limiter.metrics['wait_seconds'] += started_at - queued_at
+
+                    limiter.in_flight += 1
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        if not is_rate_limit_error(e):
+                            limiter.metrics['failed'] += 1
+                            raise
+                        limiter.on_throttled()
+                        if attempt == retries:
+                            limiter.metrics['failed'] += 1
+                            raise
+                        continue
+                    finally:
+                        limiter.in_flight -= 1
+                        limiter.metrics['busy_seconds'] += time.monotonic() - started_at
+
+                limiter.on_success()
+                return result
+            finally:
+                if trial:
+                    limiter.breaker.release()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """مقاييس كل منصة"""
+        return {platform: limiter.stats() for platform, limiter in self._limiters.items()}
+
+# إنشاء نسخة واحدة من المحدد لمشاركة الحدود بين جميع المعالجات
+rate_limiter = RateLimiter()
+metrics.function(
+    'platform_requests_in_flight',
+    'طلبات yt-dlp الجارية لكل منصة',
+    lambda: {platform: limiter.in_flight for platform, limiter in rate_limiter._limiters.items()},
+    ['platform']
+)
+metrics.function(
+    'platform_circuit_open',
+    'قاطع الدائرة مفتوح للمنصة (1) أو مغلق (0)',
+    lambda: {platform: int(limiter.breaker.state == 'open') for platform, limiter in rate_limiter._limiters.items()},
+    ['platform']
+)
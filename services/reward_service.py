@@ -42,7 +42,7 @@ class RewardService:
             conn.commit()
         
         new_balance = await self.get_user_points(user_id)
-        logger.info(f"تمت إضافة {points} نقطة للمستخدم {user_id}. الرصيد الجديد: {new_balance}")
+        logger.info("تمت إضافة %s نقطة للمستخدم %s. الرصيد الجديد: %s", points, user_id, new_balance)
         return new_balance
 
     async def deduct_points(self, user_id: int, points: int) -> bool:
@@ -50,7 +50,7 @@ class RewardService:
         current_balance = await self.get_user_points(user_id)
         
         if current_balance < points:
-            logger.warning(f"محاولة خصم {points} نقطة من المستخدم {user_id} مع رصيد {current_balance} فقط")
+            logger.warning("محاولة خصم %s نقطة من المستخدم %s مع رصيد %s فقط", points, user_id, current_balance)
             return False
         
         with get_db() as conn:
@@ -60,7 +60,7 @@ class RewardService:
             )
             conn.commit()
         
-        logger.info(f"تم خصم {points} نقطة من المستخدم {user_id}")
+        logger.info("تم خصم %s نقطة من المستخدم %s", points, user_id)
         return True
 
     async def get_active_rewards(self, user_id: int) -> List[Dict[str, Any]]:
@@ -101,7 +101,7 @@ class RewardService:
             )
             conn.commit()
         
-        logger.info(f"المستخدم {user_id} قام بشراء مكافأة {reward['name']}")
+        logger.info("المستخدم %s قام بشراء مكافأة %s", user_id, reward['name'])
         
         return {
             'reward_name': reward['name'],
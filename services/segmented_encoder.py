@@ -0,0 +1,155 @@
+import os
+import asyncio
+import shutil
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from config import config
+from utils.logger import logger
+from services.progress import ProgressReporter, run_ffmpeg_with_progress
+
+class SegmentedEncoder:
+    """
+    ترميز الفيديو الطويل على شكل مقاطع متوازية
+    يقسم مسار الفيديو عند الإطارات المفتاحية (نسخ بدون ترميز)، ويرمّز المقاطع بعمليات ffmpeg
+    متوازية، ثم يجمعها بـ concat demuxer ويرمّز الصوت مرة واحدة عند الدمج
+    """
+
+    def __init__(self, workers: Optional[int] = None, segment_seconds: Optional[int] = None):
+        self.workers = workers or config.SEGMENT_WORKERS or os.cpu_count() or 1
+        self.segment_seconds = segment_seconds or config.SEGMENT_DURATION
+
+    def should_segment(self, duration: float) -> bool:
+        """هل يستحق الفيديو الترميز المقطعي"""
+        return config.SEGMENTED_ENCODING_ENABLED \
+            and self.workers > 1 \
+            and duration >= config.SEGMENTED_ENCODING_MIN_DURATION
+
+    async def encode(
+        self,
+        input_path: str,
+        output_path: str,
+        video_args: List[str],
+        audio_args: List[str],
+        progress: Optional[ProgressReporter],
+        duration: float,
+        threads: int = 0
+    ) -> bool:
+        """
+        ترميز مقطعي متوازٍ بنفس واجهة دوال الترميز في CompressionPlanner
+        Args:
+            threads: الخيوط الممنوحة من المجدول (0 = جميع الأنوية)
+        Returns:
+            True عند النجاح
+        """
+        work_dir = Path(output_path).parent / f".{Path(output_path).stem}_segments"
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+        try:
+            segments = await self._split(input_path, work_dir)
+            if not segments:
+                return False
+
+            encoded = await self._encode_segments(segments, video_args, progress, threads)
+            if not encoded:
+                return False
+
+            return await self._concat(input_path, encoded, work_dir, output_path, audio_args)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def _split(self, input_path: str, work_dir: Path) -> List[Path]:
+        """تقسيم مسار الفيديو عند الإطارات المفتاحية بدون إعادة ترميز"""
+        cmd = [
+            'ffmpeg', '-i', input_path,
+            '-map', '0:v:0', '-an', '-c', 'copy',
+            '-f', 'segment',
+            '-segment_time', str(self.segment_seconds),
+            '-reset_timestamps', '1',
+            '-y', str(work_dir / 'source_%04d.mkv')
+        ]
+        returncode, stderr = await run_ffmpeg_with_progress(cmd)
+        if returncode != 0:
+            logger.error("فشل تقسيم الفيديو: %s", stderr.decode(errors='ignore'))
+            return []
+        return sorted(work_dir.glob('source_*.mkv'))
+
+    async def _encode_segments(
+        self,
+        segments: List[Path],
+        video_args: List[str],
+        progress: Optional[ProgressReporter],
+        threads: int = 0
+    ) -> List[Path]:
+        """
+        ترميز المقاطع بالتوازي مع توزيع الخيوط الممنوحة عليها
+        عمليات ffmpeg تُنهى عند إلغاء المهمة أو عند فشل أول مقطع (run_ffmpeg_with_progress)
+        """
+        threads = threads or os.cpu_count() or 1
+        parallel = max(1, min(self.workers, threads))
+        threads_per_segment = max(1, threads // parallel)
+        limiter = asyncio.Semaphore(parallel)
+
+        async def encode_segment(segment: Path, output: Path) -> Tuple[int, bytes]:
+            async with limiter:
+                return await run_ffmpeg_with_progress([
+                    'ffmpeg', '-i', str(segment),
+                    *video_args, '-threads', str(threads_per_segment),
+                    '-y', str(output)
+                ])
+
+        outputs = [segment.with_name(segment.name.replace('source_', 'encoded_')).with_suffix('.mp4')
+                   for segment in segments]
+        tasks = [asyncio.create_task(encode_segment(segment, output)) for segment, output in zip(segments, outputs)]
+
+        completed = 0
+        try:
+            for future in asyncio.as_completed(tasks):
+                returncode, stderr = await future
+                completed += 1
+                if returncode != 0:
+                    logger.error("فشل ترميز مقطع: %s", stderr.decode(errors='ignore')[-2000:])
+                    return []
+                if progress:
+                    progress.report(completed / len(tasks) * 100, f"🧩 {completed}/{len(tasks)}")
+        finally:
+            # الخروج بفشل أو إلغاء: إيقاف المقاطع المتبقية وانتظار إنهاء عملياتها
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        return outputs
+
+    async def _concat(
+        self,
+        input_path: str,
+        encoded: List[Path],
+        work_dir: Path,
+        output_path: str,
+        audio_args: List[str]
+    ) -> bool:
+        """دمج المقاطع المرمزة مع مسار الصوت من الملف الأصلي"""
+        list_file = work_dir / 'segments.txt'
+        list_file.write_text(
+            ''.join(f"file '{path.resolve()}'\n" for path in encoded),
+            encoding='utf-8'
+        )
+
+        cmd = [
+            'ffmpeg',
+            '-f', 'concat', '-safe', '0', '-i', str(list_file),
+            '-i', input_path,
+            '-map', '0:v:0', '-map', '1:a:0?',
+            '-c:v', 'copy', *audio_args,
+            '-movflags', '+faststart',
+            '-y', output_path
+        ]
+        returncode, stderr = await run_ffmpeg_with_progress(cmd)
+        if returncode != 0:
+            logger.error("فشل دمج المقاطع: %s", stderr.decode(errors='ignore'))
+            return False
+        return True
+
+# إنشاء نسخة واحدة من المرمّز المقطعي
+segmented_encoder = SegmentedEncoder()
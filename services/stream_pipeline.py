@@ -0,0 +1,126 @@
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.helpers import format_file_size
+from utils.logger import logger
+from services.compression_planner import compression_planner
+from services.progress import ProgressReporter, run_ffmpeg_with_progress
+from services.range_downloader import range_downloader
+from services.transcode_scheduler import transcode_scheduler
+
+# حاويات يقرأها ffmpeg من أنبوب بالترتيب بدون الرجوع للخلف
+# (MP4/MOV قد يكون فهرس moov في نهاية الملف فتحتاج إلى ملف يمكن التنقل فيه)
+PIPE_FRIENDLY_EXTS = {'webm', 'mkv', 'flv', 'ts'}
+
+# MP4 مجزأ يُكتب بالتتابع مباشرة في المسار النهائي بدون إعادة كتابة الفهرس
+FRAGMENTED_MP4_FLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+
+class StreamPipeline:
+    """
+    ضغط الفيديو أثناء تحميله: البيانات تُبث من رابط الصيغة إلى stdin الخاص بـ ffmpeg
+    الذي يكتب MP4 مجزأ في المسار النهائي مباشرة، فلا يُكتب الملف الأصلي على القرص
+    """
+
+    @staticmethod
+    def pick_format(info: Dict[str, Any], max_height: int = 1080) -> Optional[Dict[str, Any]]:
+        """
+        أفضل صيغة مدمجة (فيديو + صوت) عبر HTTP مباشر في حاوية قابلة للقراءة من أنبوب
+        Returns:
+            الصيغة أو None إذا كان المسار العادي (تحميل ثم ضغط) مطلوباً
+        """
+        candidates: List[Dict[str, Any]] = [
+            f for f in info.get('formats') or []
+            if f.get('vcodec') not in (None, 'none')
+            and f.get('acodec') not in (None, 'none')
+            and f.get('protocol') in ('http', 'https')
+            and f.get('ext') in PIPE_FRIENDLY_EXTS
+            and f.get('url')
+            and (f.get('height') or 0) <= max_height
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+
+    @staticmethod
+    def probe_from_format(info: Dict[str, Any], fmt: Dict[str, Any]) -> Dict[str, Any]:
+        """بناء نتيجة بصيغة ffprobe من بيانات yt-dlp لاستخدامها في مخطط الضغط قبل التحميل"""
+        streams = [{
+            'codec_type': 'video',
+            'codec_name': fmt.get('vcodec'),
+            'width': fmt.get('width') or 0,
+            'height': fmt.get('height') or 0,
+            'avg_frame_rate': f"{fmt.get('fps') or 30}/1"
+        }]
+        if fmt.get('acodec') not in (None, 'none'):
+            streams.append({
+                'codec_type': 'audio',
+                'codec_name': fmt.get('acodec'),
+                'bit_rate': str(int(fmt['abr'] * 1000)) if fmt.get('abr') else None
+            })
+        return {'format': {'duration': str(info.get('duration') or 0)}, 'streams': streams}
+
+    async def compress(
+        self,
+        info: Dict[str, Any],
+        output_path: str,
+        target_size_mb: float,
+        progress: Optional[ProgressReporter] = None,
+        user_id: Optional[int] = None
+    ) -> Optional[str]:
+        """
+        ضغط الفيديو من الرابط مباشرة في مرور واحد
+        Args:
+            info: نتيجة extract_info(download=False)
+            output_path: المسار النهائي للملف المضغوط
+            target_size_mb: الحجم المستهدف بالميجابايت
+        Returns:
+            مسار الملف أو None إذا لم يكن البث ممكناً أو تجاوز الناتج الحجم المستهدف
+            (عندها يُستخدم المسار العادي الذي يدعم المعايرة وإعادة المحاولة)
+        """
+        fmt = self.pick_format(info)
+        if not fmt:
+            return None
+
+        plan = compression_planner.plan(self.probe_from_format(info, fmt), target_size_mb)
+        if not plan:
+            return None
+
+        cost = transcode_scheduler.estimate_cost(plan['duration'], plan['width'], plan['height'], plan['preset'])
+        async with transcode_scheduler.slot(user_id, cost) as threads:
+            cmd = [
+                'ffmpeg', '-i', 'pipe:0',
+                *compression_planner.build_video_args(plan), '-threads', str(threads),
+                *compression_planner.build_audio_args(plan),
+                '-movflags', FRAGMENTED_MP4_FLAGS,
+                '-f', 'mp4', '-y', output_path
+            ]
+            started = time.monotonic()
+            returncode, stderr = await run_ffmpeg_with_progress(
+                cmd,
+                progress,
+                plan['duration'],
+                stdin=range_downloader.stream(fmt['url'], fmt.get('http_headers'))
+            )
+
+        if returncode != 0 or not os.path.exists(output_path):
+            logger.warning("فشل الضغط أثناء البث: %s", stderr.decode(errors='ignore')[-500:])
+            return None
+
+        actual_bytes = os.path.getsize(output_path)
+        compression_planner.record(info.get('webpage_url') or fmt['url'], plan, actual_bytes, 1, time.monotonic() - started)
+        if actual_bytes > plan['target_bytes']:
+            os.remove(output_path)
+            logger.warning(
+                "ناتج البث %s تجاوز الهدف %sMB، "
+                "الرجوع إلى الضغط من ملف",
+                format_file_size(actual_bytes),
+                target_size_mb
+            )
+            return None
+
+        logger.info("تم الضغط أثناء البث إلى %s بدون ملف وسيط", format_file_size(actual_bytes))
+        return output_path
+
+# إنشاء نسخة واحدة من خط البث
+stream_pipeline = StreamPipeline()
@@ -0,0 +1,194 @@
+import os
+import math
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import select, or_, and_
+
+from config import config
+from database.session import run_in_session
+from database.models import User, UserPoints, ClaimedReward
+from utils.logger import logger
+from utils.metrics import metrics
+
+# التكلفة النسبية لكل preset في libx264 (medium = 1)
+PRESET_COST = {
+    'ultrafast': 0.2,
+    'superfast': 0.3,
+    'veryfast': 0.45,
+    'faster': 0.6,
+    'fast': 0.8,
+    'medium': 1.0,
+    'slow': 1.8,
+    'slower': 3.0,
+    'veryslow': 6.0
+}
+
+# معرف مكافأة "إزالة انتظار التحويل"
+SKIP_QUEUE_REWARD_ID = 50
+
+class _TranscodeJob:
+    """طلب ترميز ينتظر دوره في الطابور"""
+
+    __slots__ = ('user_id', 'cost', 'threads', 'priority', 'seq', 'future')
+
+    def __init__(self, user_id: int, cost: float, threads: int, priority: bool, seq: int):
+        self.user_id = user_id
+        self.cost = cost
+        self.threads = threads
+        self.priority = priority
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class TranscodeScheduler:
+    """
+    جدولة عمليات ffmpeg حسب التكلفة وعدد أنوية المعالج
+    - تُقبل المهمة فقط إذا توفر لها عدد الخيوط المطلوب من ميزانية الأنوية
+    - الطابور عادل بين المستخدمين: يُخدم أولاً من استهلك أقل تكلفة
+    - أصحاب مكافأة "إزالة انتظار التحويل" يتقدمون على الجميع
+    """
+
+    def __init__(self, total_threads: Optional[int] = None):
+        self.total_threads = total_threads or config.TRANSCODE_MAX_THREADS or os.cpu_count() or 1
+        self._available = self.total_threads
+        self._waiting: List[_TranscodeJob] = []
+        self._running: Dict[int, int] = {}
+        self._served_cost: Dict[int, float] = {}
+        self._seq = itertools.count()
+
+    @staticmethod
+    def estimate_cost(duration: float, width: int, height: int, preset: str = 'medium') -> float:
+        """التكلفة بوحدة (ثانية فيديو 1080p بـ preset medium)"""
+        pixels = (width * height) / (1920 * 1080) if width and height else 1.0
+        return max(duration, 1.0) * pixels * PRESET_COST.get(preset, 1.0)
+
+    def estimate_cost_from_probe(self, info: Optional[Dict[str, Any]], preset: str = 'medium') -> float:
+        """تقدير التكلفة مباشرة من نتيجة فحص ffprobe"""
+        from services.media_probe import MediaProbe
+        width, height = MediaProbe.get_resolution(info)
+        return self.estimate_cost(MediaProbe.get_duration(info), width, height, preset)
+
+    def threads_for(self, cost: float) -> int:
+        """عدد خيوط الترميز المناسب للمهمة (المهام الخفيفة لا تحجز المعالج كله)"""
+        return max(1, min(self.total_threads, math.ceil(cost / config.TRANSCODE_COST_PER_THREAD)))
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: Optional[int],
+        cost: float,
+        priority: Optional[bool] = None
+    ) -> AsyncIterator[int]:
+        """
+        حجز مكان لمهمة ترميز
+        Args:
+            user_id: معرف المستخدم (None لمهام النظام)
+            cost: التكلفة المقدرة من estimate_cost
+            priority: تجاوز الطابور (يُحدد تلقائياً من مكافآت المستخدم إذا لم يُمرر)
+        Yields:
+            عدد الخيوط المسموح للمهمة استخدامها (-threads)
+        """
+        if priority is None:
+            priority = await self._has_skip_queue_reward(user_id)
+
+        job = _TranscodeJob(user_id or 0, cost, self.threads_for(cost), priority, next(self._seq))
+        self._waiting.append(job)
+        self._dispatch()
+
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            if job in self._waiting:
+                self._waiting.remove(job)
+            elif job.future.done() and not job.future.cancelled():
+                self._release(job)
+            raise
+
+        try:
+            yield job.threads
+        finally:
+            self._release(job)
+
+    def _dispatch(self) -> None:
+        """قبول المهام المنتظرة طالما تتوفر خيوط كافية"""
+        while self._waiting:
+            job = min(
+                self._waiting,
+                key=lambda j: (not j.priority, self._served_cost.get(j.user_id, 0.0), j.seq)
+            )
+            if job.threads > self._available:
+                # لا نتخطى المهمة التالية حتى لا تُحرم المهام الكبيرة من الدور
+                break
+
+            self._waiting.remove(job)
+            self._available -= job.threads
+            self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+            self._served_cost[job.user_id] = self._served_cost.get(job.user_id, 0.0) + job.cost
+            job.future.set_result(None)
+
+    def _release(self, job: _TranscodeJob) -> None:
+        """إعادة خيوط المهمة إلى الميزانية"""
+        self._available += job.threads
+        self._running[job.user_id] -= 1
+        if not self._running[job.user_id]:
+            del self._running[job.user_id]
+            # نسيان تاريخ المستخدم عندما لا تبقى له مهام
+            if not any(j.user_id == job.user_id for j in self._waiting):
+                self._served_cost.pop(job.user_id, None)
+        self._dispatch()
+
+    async def _has_skip_queue_reward(self, user_id: Optional[int]) -> bool:
+        """التحقق من امتلاك المستخدم (معرف تيليجرام) لمكافأة تجاوز انتظار سارية"""
+        if not user_id:
+            return False
+
+        def has_reward(session) -> bool:
+            now = datetime.utcnow()
+            duration = timedelta(days=config.REWARDS[SKIP_QUEUE_REWARD_ID]['duration'])
+            return session.execute(
+                select(ClaimedReward.id)
+                .join(UserPoints, UserPoints.id == ClaimedReward.points_id)
+                .join(User, User.id == UserPoints.user_id)
+                .where(
+                    User.telegram_id == user_id,
+                    ClaimedReward.reward_id == SKIP_QUEUE_REWARD_ID,
+                    or_(
+                        ClaimedReward.expiration_date > now,
+                        and_(ClaimedReward.expiration_date.is_(None), ClaimedReward.claim_date > now - duration)
+                    )
+                )
+                .limit(1)
+            ).first() is not None
+
+        try:
+            return await run_in_session(has_reward)
+        except Exception as e:
+            logger.warning("تعذر التحقق من مكافآت المستخدم %s: %s", user_id, e)
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """حالة الجدولة الحالية"""
+        return {
+            'total_threads': self.total_threads,
+            'available_threads': self._available,
+            'waiting_jobs': len(self._waiting),
+            'running_jobs': sum(self._running.values()),
+            'active_users': len(self._running)
+        }
+
+# إنشاء نسخة واحدة من المجدول لمشاركتها بين جميع عمليات الترميز
+transcode_scheduler = TranscodeScheduler()
+metrics.function(
+    'transcode_queue_jobs',
+    'مهام الترميز المنتظرة والجارية',
+    lambda: {'waiting': len(transcode_scheduler._waiting), 'running': sum(transcode_scheduler._running.values())},
+    ['state']
+)
+metrics.function(
+    'transcode_threads_available',
+    'خيوط الترميز المتاحة من ميزانية الأنوية',
+    lambda: transcode_scheduler._available
+)
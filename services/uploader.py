@@ -0,0 +1,269 @@
+import os
+import time
+import uuid
+import mimetypes
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiofiles
+import httpx
+
+from config import config
+from utils.helpers import format_file_size
+from utils.logger import logger
+from utils.tracing import traced
+from utils.metrics import timed, current_platform, STAGE_SECONDS, TRANSFER_BYTES
+
+class TelegramUploader:
+    """
+    رفع الملفات إلى Bot API بالبث من القرص على دفعات
+    يستخدم عميل HTTP مشتركاً (connection pool) ويغلق الملفات فور انتهاء الإرسال
+    مع خادم Bot API محلي (--local) يُرسل مسار الملف فقط بصيغة file:// ليقرأه الخادم مباشرة
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        local_mode: Optional[bool] = None
+    ):
+        self.base_url = base_url or config.TELEGRAM_BOT_API_URL
+        self.chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+        self.local_mode = config.TELEGRAM_LOCAL_MODE if local_mode is None else local_mode
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """الحصول على العميل المشترك وإنشاؤه عند أول استخدام"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(config.UPLOAD_TIMEOUT, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=config.UPLOAD_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.UPLOAD_MAX_CONNECTIONS
+                )
+            )
+        return self._client
+
+    async def send_video(
+        self,
+        chat_id: int,
+        file_path: str,
+        caption: Optional[str] = None,
+        supports_streaming: bool = True
+    ) -> Dict[str, Any]:
+        """
+        إرسال فيديو عبر sendVideo مع بث الملف من القرص
+        Args:
+            chat_id: معرف المحادثة
+            file_path: مسار ملف الفيديو
+            caption: النص المرافق
+            supports_streaming: السماح بالتشغيل أثناء التحميل
+        Returns:
+            رسالة تيليجرام المرسلة مع إحصائيات الرفع
+        """
+        fields = {'chat_id': str(chat_id), 'supports_streaming': str(supports_streaming).lower()}
+        if caption:
+            fields['caption'] = caption
+        return await self._send_file('sendVideo', 'video', file_path, fields)
+
+    async def send_document(
+        self,
+        chat_id: int,
+        file_path: str,
+        caption: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """إرسال ملف كمستند عبر sendDocument"""
+        fields = {'chat_id': str(chat_id)}
+        if caption:
+            fields['caption'] = caption
+        return await self._send_file('sendDocument', 'document', file_path, fields)
+
+    @traced('telegram.upload')
+    @timed(STAGE_SECONDS, 'upload')
+    async def _send_file(
+        self,
+        method: str,
+        file_field: str,
+        file_path: str,
+        fields: Dict[str, str]
+    ) -> Dict[str, Any]:
+        """تنفيذ طلب multipart مع بث محتوى الملف"""
+        path = Path(file_path)
+        file_size = path.stat().st_size
+        limit_mb = config.LOCAL_API_MAX_FILE_SIZE_MB if self.local_mode else config.MAX_FILE_SIZE_MB
+        if file_size > limit_mb * 1024 * 1024:
+            raise ValueError(f"حجم الملف {format_file_size(file_size)} يتجاوز حد الخادم ({limit_mb}MB)")
+
+        if self.local_mode:
+            return await self._send_local_file(method, file_field, path, file_size, fields)
+
+        boundary = uuid.uuid4().hex
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+        preamble = self._encode_fields(boundary, fields) + (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{self._quote(file_field)}"; '
+            f'filename="{self._quote(path.name)}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        epilogue = f'\r\n--{boundary}--\r\n'.encode()
+
+        started = time.monotonic()
+        # فتح الملف هنا وليس داخل المولد لضمان إغلاقه حتى لو توقف الطلب في منتصفه
+        async with aiofiles.open(path, 'rb') as file:
+            response = await self._get_client().post(
+                f"{self.base_url}/{method}",
+                content=self._stream_body(file, preamble, epilogue),
+                headers={
+                    'Content-Type': f'multipart/form-data; boundary={boundary}',
+                    'Content-Length': str(len(preamble) + file_size + len(epilogue))
+                }
+            )
+        return self._build_result(method, path, file_size, started, response)
+
+    async def _send_local_file(
+        self,
+        method: str,
+        file_field: str,
+        path: Path,
+        file_size: int,
+        fields: Dict[str, str]
+    ) -> Dict[str, Any]:
+        """إرسال مسار الملف المحلي بدون نسخ محتواه في جسم الطلب"""
+        started = time.monotonic()
+        response = await self._get_client().post(
+            f"{self.base_url}/{method}",
+            data={**fields, file_field: path.resolve().as_uri()}
+        )
+        return self._build_result(method, path, file_size, started, response)
+
+    def _build_result(
+        self,
+        method: str,
+        path: Path,
+        file_size: int,
+        started: float,
+        response: httpx.Response
+    ) -> Dict[str, Any]:
+        """التحقق من رد الخادم وحساب إحصائيات الرفع"""
+        elapsed = max(time.monotonic() - started, 1e-6)
+
+        # الوكيل أو الخادم قد يرد بصفحة HTML/نص عند 5xx بدلاً من JSON
+        try:
+            data = response.json()
+        except ValueError:
+            raise RuntimeError(
+                f"فشل {method}: رد غير صالح من الخادم (HTTP {response.status_code}): {response.text[:200]}"
+            )
+        if not isinstance(data, dict):
+            raise RuntimeError(f"فشل {method}: رد غير متوقع من الخادم (HTTP {response.status_code})")
+        if not data.get('ok'):
+            raise RuntimeError(f"فشل {method}: {data.get('description', response.status_code)}")
+
+        throughput = file_size / elapsed
+        TRANSFER_BYTES.inc(file_size, 'upload', current_platform())
+        logger.info(
+            "تم رفع %s (%s) "
+            "خلال %.1fs بسرعة %s/s",
+            path.name,
+            format_file_size(file_size),
+            elapsed,
+            format_file_size(throughput)
+        )
+        return {
+            'message': data['result'],
+            'bytes': file_size,
+            'seconds': elapsed,
+            'throughput': throughput
+        }
+
+    async def _stream_body(self, file, preamble: bytes, epilogue: bytes) -> AsyncIterator[bytes]:
+        """مولد جسم الطلب: الحقول ثم الملف على دفعات ثم الخاتمة"""
+        yield preamble
+        while True:
+            chunk = await file.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        yield epilogue
+
+    @staticmethod
+    def _encode_fields(boundary: str, fields: Dict[str, str]) -> bytes:
+        """ترميز الحقول النصية بصيغة multipart"""
+        parts = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{TelegramUploader._quote(name)}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        ]
+        return ''.join(parts).encode()
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        """
+        تهريب الاسم داخل ترويسة Content-Disposition (RFC 7578 القسم 4.2)
+        علامة الاقتباس وفواصل الأسطر تُرمّز بالنسبة المئوية حتى لا تكسر الترويسة
+        """
+        return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+    async def close(self) -> None:
+        """إغلاق العميل المشترك عند إيقاف التطبيق"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# إنشاء نسخة واحدة من الرافع لاستخدامها في جميع أنحاء التطبيق
+uploader = TelegramUploader()
+
+# واجهات الدوال للاستيراد المباشر
+async def upload_video(*args, **kwargs):
+    return await uploader.send_video(*args, **kwargs)
+
+# قياس استهلاك الذاكرة مع خادم Bot API وهمي:
+if __name__ == "__main__":
+    import asyncio
+    import resource
+    import tempfile
+
+    received_bytes = []
+
+    async def fake_bot_api(reader, writer):
+        """خادم وهمي يقرأ الجسم ويتجاهله ثم يرد بنجاح"""
+        headers = await reader.readuntil(b'\r\n\r\n')
+        length = int(next(
+            line.split(b':')[1] for line in headers.split(b'\r\n')
+            if line.lower().startswith(b'content-length')
+        ))
+        received_bytes.append(length)
+        while length > 0:
+            length -= len(await reader.read(min(length, 1024 * 1024)))
+        body = b'{"ok": true, "result": {"message_id": 1}}'
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                     b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+        await writer.drain()
+        writer.close()
+
+    async def measure_upload():
+        server = await asyncio.start_server(fake_bot_api, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as video:
+            for _ in range(50):
+                video.write(os.urandom(1024 * 1024))
+            video.flush()
+
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            test_uploader = TelegramUploader(base_url=f"http://127.0.0.1:{port}/botTEST", local_mode=False)
+            result = await test_uploader.send_video(1, video.name, caption="test")
+            await test_uploader.close()
+            rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+            # وضع الخادم المحلي: يُرسل المسار فقط
+            local_uploader = TelegramUploader(base_url=f"http://127.0.0.1:{port}/botTEST", local_mode=True)
+            await local_uploader.send_video(1, video.name, caption="test")
+            await local_uploader.close()
+
+        server.close()
+        print(f"الحجم: {format_file_size(result['bytes'])} | السرعة: {format_file_size(result['throughput'])}/s")
+        print(f"زيادة الذاكرة القصوى (RSS): {format_file_size((rss_after - rss_before) * 1024)}")
+        print(f"جسم الطلب: عادي {format_file_size(received_bytes[0])} | محلي {format_file_size(received_bytes[1])}")
+
+    asyncio.run(measure_upload())
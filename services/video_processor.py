@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 import subprocess
 from pathlib import Path
@@ -7,7 +8,11 @@ from tempfile import NamedTemporaryFile
 from config import config
 from utils.helpers import format_file_size, clean_filename
 from utils.logger import logger
-from utils.validators import validate_video_file
+from services.progress import ProgressReporter, run_ffmpeg_with_progress
+from services.media_probe import media_probe, probe_media, build_mp4_codec_args
+from services.compression_planner import compression_planner
+from services.segmented_encoder import segmented_encoder
+from services.transcode_scheduler import transcode_scheduler
 
 class VideoProcessor:
     """فئة متقدمة لمعالجة الفيديو بجميع عملياته الأساسية"""
@@ -22,7 +27,8 @@ class VideoProcessor:
         self,
         input_path: str,
         output_format: str = 'mp4',
-        resolution: Optional[Tuple[int, int]] = None
+        resolution: Optional[Tuple[int, int]] = None,
+        user_id: Optional[int] = None
     ) -> Optional[str]:
         """
         تحويل تنسيق الفيديو مع إمكانية تغيير الدقة
@@ -30,92 +36,112 @@ class VideoProcessor:
             input_path: مسار الملف المدخل
             output_format: صيغة المخرجات المطلوبة (default: mp4)
             resolution: تغيير الدقة (عرض, ارتفاع)
+            user_id: صاحب الطلب لجدولة الترميز
         Returns:
             مسار الملف الناتج أو None في حالة الفشل
         """
         try:
-            if not validate_video_file(input_path):
+            if not await media_probe.is_valid_video(input_path):
                 raise ValueError("ملف الفيديو غير صالح")
 
             output_path = self.temp_dir / f"{Path(input_path).stem}.{output_format}"
+            video_encode = ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23']
+            audio_encode = ['-c:a', 'aac']
             
-            cmd = [
-                'ffmpeg',
-                '-i', input_path,
-                '-c:v', 'libx264',
-                '-preset', 'medium',
-                '-crf', '23',
-                '-c:a', 'aac',
-                '-strict', 'experimental'
-            ]
+            cmd = ['ffmpeg', '-i', input_path]
+
+            if output_format == 'mp4':
+                # نسخ المسارات المتوافقة مباشرة وترميز غير المتوافق فقط
+                info = await probe_media(input_path)
+                cmd += build_mp4_codec_args(
+                    info,
+                    video_encode,
+                    audio_encode,
+                    force_video_encode=resolution is not None
+                )
+            else:
+                cmd += video_encode + audio_encode
 
             if resolution:
                 cmd += ['-vf', f'scale={resolution[0]}:{resolution[1]}']
 
             cmd.append(str(output_path))
 
-            result = await self._run_command(cmd)
+            result = await self._run_scheduled(cmd, input_path, user_id)
             if result:
-                logger.info(f"تم التحويل بنجاح إلى {output_format}")
+                logger.info("تم التحويل بنجاح إلى %s", output_format)
                 return str(output_path)
             return None
 
         except Exception as e:
-            logger.error(f"خطأ في التحويل: {str(e)}")
+            logger.error("خطأ في التحويل: %s", e)
             return None
 
     async def compress_video(
         self,
         input_path: str,
         target_size_mb: float,
-        crf_quality: int = 28
+        crf_quality: int = 28,
+        progress: Optional[ProgressReporter] = None,
+        user_id: Optional[int] = None
     ) -> Optional[str]:
         """
         ضغط الفيديو مع الحفاظ على الجودة
         Args:
             input_path: مسار الملف المدخل
             target_size_mb: الحجم المستهدف بالميجابايت
-            crf_quality: جودة الضغط (23-28 جيد، 29-35 متوسط)
+            crf_quality: جودة الضغط (23-28 جيد، 29-35 متوسط) مع سقف معدل البت من المخطط
+            progress: مراسل التقدم لعرض نسبة الضغط (اختياري)
+            user_id: صاحب الطلب لجدولة الترميز بعدالة بين المستخدمين
         Returns:
             مسار الملف المضغوط أو None
         """
         try:
-            duration = float(subprocess.check_output([
-                'ffprobe', '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                input_path
-            ]).decode().strip())
-
-            target_bits = (target_size_mb * 8 * 1024 * 1024) / duration
-            bitrate = f"{target_bits / 1024:.2f}k"
-
-            output_path = self.temp_dir / f"compressed_{Path(input_path).name}"
-
-            cmd = [
-                'ffmpeg',
-                '-i', input_path,
-                '-c:v', 'libx264',
-                '-b:v', bitrate,
-                '-maxrate', bitrate,
-                '-bufsize', f'{bitrate}*2',
-                '-crf', str(crf_quality),
-                '-c:a', 'copy',
-                '-y', str(output_path)
-            ]
-
-            result = await self._run_command(cmd)
-            return str(output_path) if result else None
+            output_path = self.temp_dir / f"compressed_{Path(input_path).stem}.mp4"
+            return await compression_planner.compress(
+                input_path,
+                str(output_path),
+                target_size_mb,
+                progress=progress,
+                crf=crf_quality,
+                encode=self._encode,
+                user_id=user_id
+            )
 
         except Exception as e:
-            logger.error(f"خطأ في الضغط: {str(e)}")
+            logger.error("خطأ في الضغط: %s", e)
             return None
 
+    async def _encode(
+        self,
+        input_path: str,
+        output_path: str,
+        video_args: list,
+        audio_args: list,
+        progress: Optional[ProgressReporter],
+        duration: float,
+        threads: int = 0
+    ) -> bool:
+        """ترميز الملف: مقاطع متوازية للفيديو الطويل أو عملية ffmpeg واحدة مع إعادة المحاولة"""
+        if segmented_encoder.should_segment(duration):
+            return await segmented_encoder.encode(
+                input_path, output_path, video_args, audio_args, progress, duration, threads=threads
+            )
+
+        cmd = [
+            'ffmpeg', '-i', input_path,
+            *video_args, '-threads', str(threads), *audio_args,
+            '-movflags', '+faststart',
+            '-y', output_path
+        ]
+        return await self._run_command(cmd, progress=progress, duration=duration)
+
     async def add_watermark(
         self,
         input_path: str,
         watermark_text: str,
-        position: str = 'bottom-right'
+        position: str = 'bottom-right',
+        user_id: Optional[int] = None
     ) -> Optional[str]:
         """
         إضافة علامة مائية نصية للفيديو
@@ -148,17 +174,18 @@ class VideoProcessor:
                 '-y', str(output_path)
             ]
 
-            result = await self._run_command(cmd)
+            result = await self._run_scheduled(cmd, input_path, user_id)
             return str(output_path) if result else None
 
         except Exception as e:
-            logger.error(f"خطأ في إضافة العلامة المائية: {str(e)}")
+            logger.error("خطأ في إضافة العلامة المائية: %s", e)
             return None
 
     async def extract_audio(
         self,
         input_path: str,
-        output_format: str = 'mp3'
+        output_format: str = 'mp3',
+        user_id: Optional[int] = None
     ) -> Optional[str]:
         """
         استخراج الصوت من الفيديو
@@ -183,31 +210,47 @@ class VideoProcessor:
                 '-y', str(output_path)
             ]
 
-            result = await self._run_command(cmd)
+            result = await self._run_scheduled(cmd, input_path, user_id, preset='ultrafast')
             return str(output_path) if result else None
 
         except Exception as e:
-            logger.error(f"خطأ في استخراج الصوت: {str(e)}")
+            logger.error("خطأ في استخراج الصوت: %s", e)
             return None
 
-    async def _run_command(self, command: list, timeout: int = 600) -> bool:
-        """تنفيذ أوامر FFmpeg مع إدارة الأخطاء"""
+    async def _run_scheduled(
+        self,
+        command: list,
+        input_path: str,
+        user_id: Optional[int] = None,
+        preset: str = 'medium'
+    ) -> bool:
+        """تنفيذ أمر FFmpeg بعد حجز مكان له في مجدول الترميز"""
+        info = await probe_media(input_path)
+        cost = transcode_scheduler.estimate_cost_from_probe(info, preset)
+        async with transcode_scheduler.slot(user_id, cost) as threads:
+            return await self._run_command(command[:-1] + ['-threads', str(threads), command[-1]])
+
+    async def _run_command(
+        self,
+        command: list,
+        timeout: int = 600,
+        progress: Optional[ProgressReporter] = None,
+        duration: float = 0.0
+    ) -> bool:
+        """تنفيذ أوامر FFmpeg مع إدارة الأخطاء وتمرير التقدم"""
         for attempt in range(self.max_retries):
             try:
-                result = subprocess.run(
-                    command,
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
+                returncode, stderr = await asyncio.wait_for(
+                    run_ffmpeg_with_progress(command, progress, duration),
                     timeout=timeout
                 )
-                if result.returncode == 0:
+                if returncode == 0:
                     return True
-                logger.error(f"FFmpeg error: {result.stderr.decode()}")
-            except subprocess.TimeoutExpired:
+                logger.error("FFmpeg error: %s", stderr.decode(errors='ignore'))
+            except asyncio.TimeoutError:
                 logger.error("انتهى الوقت المخصص للمعالجة")
             except Exception as e:
-                logger.error(f"Attempt {attempt+1} failed: {str(e)}")
+                logger.error("Attempt %s failed: %s", attempt + 1, e)
         
         return False
 
@@ -217,9 +260,9 @@ class VideoProcessor:
             path = Path(file_path)
             if path.exists():
                 path.unlink()
-                logger.info(f"تم حذف الملف المؤقت: {file_path}")
+                logger.info("تم حذف الملف المؤقت: %s", file_path)
         except Exception as e:
-            logger.error(f"خطأ في تنظيف الملفات: {str(e)}")
+            logger.error("خطأ في تنظيف الملفات: %s", e)
 
 # مثال للاستخدام:
 if __name__ == "__main__":
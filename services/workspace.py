@@ -0,0 +1,306 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Optional
+
+from config import config
+from utils.helpers import format_file_size
+from utils.logger import logger
+from utils.metrics import metrics
+
+class WorkspaceFullError(RuntimeError):
+    """لا توجد مساحة كافية لبدء المهمة خلال مهلة الانتظار"""
+
+class JobWorkspace:
+    """مجلد مؤقت خاص بمهمة واحدة (تحميل، ضغط، رفع)"""
+
+    def __init__(self, job_id: str, path: Path, reserved_bytes: int):
+        self.job_id = job_id
+        self.path = path
+        self.reserved_bytes = reserved_bytes
+        # آخر حجم مقيس لملفات المهمة (يُحدّث في خيط منفصل عبر WorkspaceManager.refresh_usage)
+        self.measured_bytes = 0
+        # مجلد مهمة قابلة للاستئناف: لا يُحذف إذا أُلغيت المهمة بسبب إيقاف الخادم
+        self.persistent = False
+
+    def file(self, name: str) -> str:
+        """مسار ملف داخل مجلد المهمة"""
+        return str(self.path / name)
+
+    def usage(self) -> int:
+        """الحجم الفعلي لملفات المهمة بالبايت (مرور على القرص، لا يُستدعى من حلقة الأحداث)"""
+        return _directory_size(self.path)
+
+    def bytes_in_use(self) -> int:
+        """الحجم المحسوب على الحصة: المحجوز مسبقاً أو آخر حجم مقيس أيهما أكبر"""
+        return max(self.reserved_bytes, self.measured_bytes)
+
+def _directory_size(path: Path) -> int:
+    """مجموع أحجام الملفات داخل المجلد (يتجاهل الملفات المحذوفة أثناء المرور)"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def _pid_alive(pid: int) -> bool:
+    """هل العملية ما زالت تعمل (لتمييز مجلدات العمليات المتوقفة بشكل مفاجئ)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class WorkspaceManager:
+    """
+    إدارة الملفات المؤقتة للمهام
+    - مجلد مستقل لكل مهمة يُحذف بالكامل عند انتهائها أو إلغائها أو فشلها
+    - حصة إجمالية للمساحة المستخدمة وحد أدنى للمساحة الحرة على القرص
+    - المهام الجديدة تنتظر تحرير المساحة أو تُرفض بـ WorkspaceFullError
+    - مجلدات المهام تحمل معرف العملية، فتُكنس مجلدات العمليات المتوقفة عند بدء التشغيل ودورياً
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        quota_mb: Optional[int] = None,
+        min_free_mb: Optional[int] = None
+    ):
+        self.root = Path(root or config.WORKSPACE_DIR)
+        self.quota_bytes = (quota_mb or config.WORKSPACE_QUOTA_MB) * 1024 * 1024
+        self.min_free_bytes = (config.WORKSPACE_MIN_FREE_MB if min_free_mb is None else min_free_mb) * 1024 * 1024
+        self._active: Dict[str, JobWorkspace] = {}
+        self._released: Optional[asyncio.Condition] = None
+        self._gc_task: Optional[asyncio.Task] = None
+
+    def _condition(self) -> asyncio.Condition:
+        """إنشاء شرط الانتظار داخل حلقة الأحداث العاملة"""
+        if self._released is None:
+            self._released = asyncio.Condition()
+        return self._released
+
+    def bytes_in_use(self) -> int:
+        """المساحة المحسوبة على الحصة لجميع المهام النشطة"""
+        return sum(ws.bytes_in_use() for ws in self._active.values())
+
+    async def refresh_usage(self) -> None:
+        """قياس مجلدات المهام النشطة في خيط منفصل (مجلدات .part الكبيرة لا توقف حلقة الأحداث)"""
+        workspaces = list(self._active.values())
+        if not workspaces:
+            return
+        sizes = await asyncio.to_thread(lambda: [ws.usage() for ws in workspaces])
+        for workspace, size in zip(workspaces, sizes):
+            workspace.measured_bytes = size
+
+    def _free_disk_bytes(self) -> int:
+        self.root.mkdir(parents=True, exist_ok=True)
+        return shutil.disk_usage(self.root).free
+
+    def _has_room(self, reserve_bytes: int) -> bool:
+        """هل تتسع الحصة والقرص لمهمة جديدة بالحجم المحجوز"""
+        if self.bytes_in_use() + reserve_bytes > self.quota_bytes:
+            return False
+        return self._free_disk_bytes() - reserve_bytes >= self.min_free_bytes
+
+    async def acquire(
+        self,
+        reserve_mb: Optional[float] = None,
+        wait: Optional[float] = None
+    ) -> JobWorkspace:
+        """
+        حجز مجلد جديد لمهمة
+        Args:
+            reserve_mb: الحجم المتوقع للمهمة (الافتراضي من الإعدادات)
+            wait: أقصى مدة انتظار بالثواني لتحرر المساحة (0 = رفض فوري)
+        Raises:
+            WorkspaceFullError: إذا لم تتوفر المساحة خلال المهلة
+        """
+        reserve_bytes = int((config.WORKSPACE_JOB_RESERVE_MB if reserve_mb is None else reserve_mb) * 1024 * 1024)
+        wait = config.WORKSPACE_WAIT_TIMEOUT if wait is None else wait
+        released = self._condition()
+        # القياس مرة واحدة قبل الفحص؛ شرط الانتظار يقرأ الأحجام المقيسة فقط
+        await self.refresh_usage()
+
+        async with released:
+            if not self._has_room(reserve_bytes):
+                logger.warning(
+                    "مساحة العمل ممتلئة (%s من "
+                    "%s)، انتظار تحرر المساحة",
+                    format_file_size(self.bytes_in_use()),
+                    format_file_size(self.quota_bytes)
+                )
+                if not wait:
+                    raise WorkspaceFullError("لا توجد مساحة كافية على الخادم حالياً")
+                try:
+                    await asyncio.wait_for(
+                        released.wait_for(lambda: self._has_room(reserve_bytes)),
+                        timeout=wait
+                    )
+                except asyncio.TimeoutError:
+                    raise WorkspaceFullError("لا توجد مساحة كافية على الخادم حالياً")
+
+            job_id = f"{os.getpid()}_{uuid.uuid4().hex[:12]}"
+            workspace = JobWorkspace(job_id, self.root / job_id, reserve_bytes)
+            # التسجيل قبل إنشاء المجلد حتى لا يحذفه الكنس الدوري العامل في خيط آخر
+            self._active[job_id] = workspace
+            workspace.path.mkdir(parents=True)
+            return workspace
+
+    def adopt(self, path: str) -> Optional[JobWorkspace]:
+        """
+        تبني مجلد مهمة من تشغيل سابق لاستكمال ملفاتها الجزئية
+        يُعاد تسميته بمعرف العملية الحالية حتى لا يحذفه الكنس
+        Returns:
+            مساحة العمل أو None إذا لم يعد المجلد موجوداً
+        """
+        source = Path(path)
+        if not source.is_dir() or source.parent.resolve() != self.root.resolve():
+            return None
+
+        job_id = f"{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        workspace = JobWorkspace(job_id, self.root / job_id, int(config.WORKSPACE_JOB_RESERVE_MB * 1024 * 1024))
+        self._active[job_id] = workspace
+        try:
+            source.rename(workspace.path)
+        except OSError as e:
+            self._active.pop(job_id, None)
+            logger.warning("تعذر تبني مجلد المهمة %s: %s", path, e)
+            return None
+        workspace.persistent = True
+        return workspace
+
+    async def release(self, workspace: JobWorkspace) -> None:
+        """حذف مجلد المهمة وتنبيه المهام المنتظرة"""
+        self._active.pop(workspace.job_id, None)
+        await asyncio.to_thread(shutil.rmtree, workspace.path, True)
+        released = self._condition()
+        async with released:
+            released.notify_all()
+
+    @asynccontextmanager
+    async def job(
+        self,
+        reserve_mb: Optional[float] = None,
+        wait: Optional[float] = None,
+        workspace: Optional[JobWorkspace] = None
+    ) -> AsyncIterator[JobWorkspace]:
+        """
+        مجلد مؤقت لمهمة يُحذف عند الخروج مهما كانت النتيجة (نجاح، خطأ، إلغاء)
+        باستثناء المجلدات persistent عند الإلغاء، لتُستأنف بعد إعادة التشغيل
+        مثال:
+            async with workspace_manager.job() as workspace:
+                path = await download_video(url, output_dir=workspace.path)
+        Args:
+            workspace: مساحة عمل متبناة من adopt بدلاً من حجز مجلد جديد
+        """
+        workspace = workspace or await self.acquire(reserve_mb, wait)
+        keep = False
+        try:
+            yield workspace
+        except asyncio.CancelledError:
+            keep = workspace.persistent
+            raise
+        finally:
+            if keep:
+                self._active.pop(workspace.job_id, None)
+            else:
+                # الحذف محمي من الإلغاء حتى لا يبقى المجلد إذا أُلغيت المهمة أثناء التنظيف
+                await asyncio.shield(self.release(workspace))
+
+    def sweep_orphans(self, extra_dirs: Iterable[str] = ('temp', 'temp_videos')) -> int:
+        """
+        حذف الملفات المؤقتة التي لا تملكها أي مهمة نشطة
+        - مجلدات المهام التي توقفت عمليتها، أو التي تعود لهذه العملية ولم تعد نشطة
+        - الملفات القديمة في المجلدات المؤقتة العامة (أقدم من WORKSPACE_ORPHAN_AGE)
+        Returns:
+            عدد العناصر المحذوفة
+        """
+        removed = 0
+        freed = 0
+        pid = os.getpid()
+
+        if self.root.exists():
+            for entry in self.root.iterdir():
+                if not entry.is_dir() or entry.name in self._active:
+                    continue
+                owner, _, _ = entry.name.partition('_')
+                owner_pid = int(owner) if owner.isdigit() else 0
+                if owner_pid and owner_pid != pid and _pid_alive(owner_pid):
+                    continue
+                freed += _directory_size(entry)
+                shutil.rmtree(entry, ignore_errors=True)
+                removed += 1
+
+        cutoff = time.time() - config.WORKSPACE_ORPHAN_AGE
+        root = self.root.resolve()
+        for directory in map(Path, extra_dirs):
+            if not directory.is_dir():
+                continue
+            for entry in directory.iterdir():
+                try:
+                    if entry.resolve() == root or entry.stat().st_mtime > cutoff:
+                        continue
+                    size = _directory_size(entry) if entry.is_dir() else entry.stat().st_size
+                    if entry.is_dir():
+                        shutil.rmtree(entry, ignore_errors=True)
+                    else:
+                        entry.unlink()
+                except OSError:
+                    continue
+                freed += size
+                removed += 1
+
+        if removed:
+            logger.info("🧹 تم حذف %s ملفات مؤقتة متروكة (%s)", removed, format_file_size(freed))
+        return removed
+
+    async def _gc_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                swept = await asyncio.to_thread(self.sweep_orphans)
+                await self.refresh_usage()
+                if swept:
+                    released = self._condition()
+                    async with released:
+                        released.notify_all()
+            except Exception as e:
+                logger.error("فشل تنظيف الملفات المؤقتة: %s", e)
+
+    async def start(self) -> None:
+        """الكنس عند بدء التشغيل وتشغيل الكنس الدوري"""
+        await asyncio.to_thread(self.sweep_orphans)
+        if config.WORKSPACE_GC_INTERVAL > 0 and self._gc_task is None:
+            self._gc_task = asyncio.create_task(self._gc_loop(config.WORKSPACE_GC_INTERVAL))
+
+    async def stop(self) -> None:
+        """إيقاف الكنس الدوري"""
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            try:
+                await self._gc_task
+            except asyncio.CancelledError:
+                pass
+            self._gc_task = None
+
+    def stats(self) -> Dict[str, int]:
+        """حالة مساحة العمل الحالية"""
+        return {
+            'active_jobs': len(self._active),
+            'bytes_in_use': self.bytes_in_use(),
+            'quota_bytes': self.quota_bytes,
+            'free_disk_bytes': self._free_disk_bytes()
+        }
+
+# إنشاء نسخة واحدة من مدير مساحة العمل
+workspace_manager = WorkspaceManager()
+metrics.function('workspace_active_jobs', 'مهام التحميل التي تملك مجلد عمل', lambda: len(workspace_manager._active))
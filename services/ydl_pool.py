@@ -0,0 +1,209 @@
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import yt_dlp
+
+from config import config
+from utils.logger import logger
+from utils.metrics import metrics, CACHE_REQUESTS
+
+class _ProfilePool:
+    """نسخ YoutubeDL جاهزة لملف إعدادات واحد"""
+
+    def __init__(self, name: str, opts: Dict[str, Any], max_size: int):
+        self.name = name
+        self.opts = opts
+        self.max_size = max_size
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.stats = {'checkouts': 0, 'created': 0, 'overflow': 0}
+
+class YdlPool:
+    """
+    مجموعة نسخ YoutubeDL مُهيأة مسبقاً لكل ملف إعدادات (افتراضي، تويتر، الجودات)
+    - إنشاء YoutubeDL يعيد تحميل المستخرجات والكوكيز ومعالجات HTTP، فتُعاد النسخ بدل إنشائها لكل طلب
+    - كل نسخة يستخدمها خيط واحد فقط حتى إعادتها، وتُعاد إعداداتها لحالتها الأصلية عند الإرجاع
+    - عند انشغال جميع النسخ تُنشأ نسخة مؤقتة تُغلق بعد الاستخدام بدل انتظار الخيط
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size or config.YDL_POOL_SIZE
+        self._profiles: Dict[str, _ProfilePool] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, opts: Dict[str, Any]) -> None:
+        """تسجيل ملف إعدادات (لا تُنشأ النسخ حتى أول استخدام أو warm)"""
+        with self._lock:
+            if name in self._profiles:
+                return
+            self._profiles[name] = _ProfilePool(name, dict(opts), self.max_size)
+
+    def _get_profile(self, name: str) -> _ProfilePool:
+        try:
+            return self._profiles[name]
+        except KeyError:
+            raise ValueError(f"ملف إعدادات yt-dlp غير مسجل: {name}")
+
+    @staticmethod
+    def _create(pool: _ProfilePool) -> yt_dlp.YoutubeDL:
+        """إنشاء نسخة وحفظ حالتها الأصلية لاستعادتها بعد كل استخدام"""
+        ydl = yt_dlp.YoutubeDL(dict(pool.opts))
+        ydl._pool_snapshot = {
+            'params': dict(ydl.params),
+            'format_selector': ydl.format_selector,
+            'progress_hooks': list(ydl._progress_hooks),
+            'postprocessor_hooks': list(ydl._postprocessor_hooks)
+        }
+        return ydl
+
+    @staticmethod
+    def _apply(ydl: yt_dlp.YoutubeDL, overrides: Dict[str, Any]) -> None:
+        """تطبيق إعدادات الطلب على نسخة مستعارة"""
+        for key, value in overrides.items():
+            if key == 'progress_hooks':
+                for hook in value or []:
+                    ydl.add_progress_hook(hook)
+            elif key == 'postprocessor_hooks':
+                for hook in value or []:
+                    ydl.add_postprocessor_hook(hook)
+            else:
+                ydl.params[key] = value
+
+        if 'outtmpl' in overrides:
+            # YoutubeDL يحوّل outtmpl إلى قاموس قوالب عند الإنشاء فقط
+            ydl._parse_outtmpl()
+        if 'format' in overrides:
+            # محدد الصيغة يُبنى من params['format'] عند الإنشاء ولا يُقرأ منه مجدداً
+            fmt = overrides['format']
+            ydl.format_selector = fmt if fmt in (None, '-') or callable(fmt) else ydl.build_format_selector(fmt)
+
+    @staticmethod
+    def _reset(ydl: yt_dlp.YoutubeDL) -> None:
+        """استعادة الحالة الأصلية قبل إرجاع النسخة للمجموعة"""
+        snapshot = ydl._pool_snapshot
+        ydl.params.clear()
+        ydl.params.update(snapshot['params'])
+        ydl.format_selector = snapshot['format_selector']
+        ydl._progress_hooks[:] = snapshot['progress_hooks']
+        ydl._postprocessor_hooks[:] = snapshot['postprocessor_hooks']
+        ydl._download_retcode = 0
+        ydl._num_downloads = 0
+
+    @contextmanager
+    def checkout(self, profile: str = 'default', overrides: Optional[Dict[str, Any]] = None) -> Iterator[yt_dlp.YoutubeDL]:
+        """
+        استعارة نسخة لاستخدامها في الخيط الحالي (متزامن، يُستدعى داخل asyncio.to_thread)
+        Args:
+            profile: اسم ملف الإعدادات المسجل
+            overrides: إعدادات خاصة بالطلب (format، outtmpl، progress_hooks...) تُلغى عند الإرجاع
+        """
+        pool = self._get_profile(profile)
+        ydl = None
+        pooled = True
+        try:
+            ydl = pool.idle.get_nowait()
+            CACHE_REQUESTS.inc(1, 'ydl_pool', 'hit')
+        except queue.Empty:
+            CACHE_REQUESTS.inc(1, 'ydl_pool', 'miss')
+            with pool.lock:
+                pooled = pool.created < pool.max_size
+                if pooled:
+                    pool.created += 1
+                    pool.stats['created'] += 1
+                else:
+                    pool.stats['overflow'] += 1
+            try:
+                ydl = self._create(pool)
+            except BaseException:
+                if pooled:
+                    with pool.lock:
+                        pool.created -= 1
+                raise
+
+        pool.stats['checkouts'] += 1
+        try:
+            if overrides:
+                self._apply(ydl, overrides)
+            yield ydl
+        finally:
+            if pooled:
+                try:
+                    self._reset(ydl)
+                    pool.idle.put(ydl)
+                except Exception as e:
+                    logger.warning("تعذر إعادة نسخة yt-dlp (%s) للمجموعة: %s", profile, e)
+                    with pool.lock:
+                        pool.created -= 1
+                    self._close(ydl)
+            else:
+                self._close(ydl)
+
+    def warm(self, count: Optional[int] = None) -> int:
+        """
+        إنشاء نسخ مسبقاً لكل ملف إعدادات (متزامن، يُستدعى عند بدء التشغيل في خيط منفصل)
+        Returns:
+            عدد النسخ المنشأة
+        """
+        count = config.YDL_POOL_WARM if count is None else count
+        created = 0
+        for pool in list(self._profiles.values()):
+            while True:
+                with pool.lock:
+                    if pool.created >= min(count, pool.max_size):
+                        break
+                    pool.created += 1
+                    pool.stats['created'] += 1
+                try:
+                    pool.idle.put(self._create(pool))
+                    created += 1
+                except Exception as e:
+                    with pool.lock:
+                        pool.created -= 1
+                    logger.warning("تعذر تهيئة نسخة yt-dlp (%s): %s", pool.name, e)
+                    break
+        if created:
+            logger.info("🔥 تم تجهيز %s نسخ yt-dlp مسبقاً", created)
+        return created
+
+    @staticmethod
+    def _close(ydl: yt_dlp.YoutubeDL) -> None:
+        """إغلاق النسخة (حفظ الكوكيز وإغلاق اتصالات HTTP)"""
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.warning("خطأ أثناء إغلاق نسخة yt-dlp: %s", e)
+
+    def close(self) -> None:
+        """إغلاق جميع النسخ الخاملة عند إيقاف التطبيق"""
+        for pool in self._profiles.values():
+            while True:
+                try:
+                    ydl = pool.idle.get_nowait()
+                except queue.Empty:
+                    break
+                with pool.lock:
+                    pool.created -= 1
+                self._close(ydl)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """حالة كل ملف إعدادات"""
+        return {
+            name: {**pool.stats, 'idle': pool.idle.qsize(), 'size': pool.created}
+            for name, pool in self._profiles.items()
+        }
+
+# إنشاء مجموعة واحدة مشتركة
+ydl_pool = YdlPool()
+metrics.function(
+    'ydl_pool_instances',
+    'نسخ YoutubeDL في المجموعة حسب الحالة',
+    lambda: {
+        (name, state): value
+        for name, stats in ydl_pool.stats().items()
+        for state, value in (('idle', stats['idle']), ('busy', stats['size'] - stats['idle']))
+    },
+    ['profile', 'state']
+)
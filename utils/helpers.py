@@ -5,6 +5,7 @@ from datetime import timedelta
 from typing import Optional, Union, List, Dict, Any
 from pathlib import Path
 from urllib.parse import urlparse
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from config import config
 from utils.logger import logger  # تم تصحيح الاستيراد
 
@@ -16,7 +17,7 @@ def format_duration(seconds: Union[int, float]) -> str:
         return f"{hours:02d}:{minutes:02d}:{seconds:02d}" if hours > 0 \
             else f"{minutes:02d}:{seconds:02d}"
     except Exception as e:
-        logger.error(f"خطأ في تنسيق المدة: {e}")
+        logger.error("خطأ في تنسيق المدة: %s", e)
         return "00:00"
 
 def format_file_size(size_bytes: Union[int, float]) -> str:
@@ -43,7 +44,7 @@ def validate_url(url: str) -> bool:
             for pattern in config.SUPPORTED_PATTERNS
         )
     except Exception as e:
-        logger.error(f"خطأ في التحقق من الرابط: {e}")
+        logger.error("خطأ في التحقق من الرابط: %s", e)
         return False
 
 def generate_progress_bar(percentage: float, length: int = 10) -> str:
@@ -1,10 +1,15 @@
 import logging
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 import sys
-from typing import Optional, Dict, Any
-from logging.handlers import RotatingFileHandler
+import json
+import queue
+import atexit
+import contextvars
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 # إعدادات أساسية للـ Logger
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -12,28 +17,96 @@ DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 MAX_LOG_SIZE = 10 * 1024 * 1024  # 10 MB
 BACKUP_COUNT = 5
 
-def setup_logger(name: Optional[str] = None) -> logging.Logger:
+# JSON في الكونسول أيضاً (لجامعات السجلات في بيئة الإنتاج)
+LOG_JSON_CONSOLE = os.getenv("LOG_JSON_CONSOLE", "").lower() in ("1", "true", "yes")
+
+# حقول السياق المرفقة بكل سجل (request_id، user_id، job_id، platform...)
+_log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar('log_context', default={})
+
+# خصائص LogRecord القياسية التي لا تُعد حقولاً إضافية
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'context'}
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
     """
-    إنشاء وتكوين كائن Logger مع إعدادات متقدمة
-    
-    Args:
-        name (str, optional): اسم الـ Logger. Defaults to None.
-    
-    Returns:
-        logging.Logger: كائن الـ Logger المكون
+    إرفاق حقول بكل السجلات داخل الكتلة (وما تنشئه من مهام asyncio)
+
+    Example:
+        with log_context(user_id=user.id, job_id=job['id']):
+            ...
+    """
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+def bind_log_context(**fields: Any) -> None:
+    """إضافة حقول لسياق المهمة الحالية حتى نهايتها (مثل المنصة بعد تحديدها)"""
+    _log_context.set({**_log_context.get(), **fields})
+
+def get_log_context() -> Dict[str, Any]:
+    """حقول السياق الحالية"""
+    return dict(_log_context.get())
+
+class ContextQueueHandler(QueueHandler):
+    """
+    إرسال السجلات إلى خيط الكتابة بدل الكتابة من حلقة الأحداث
+    يُنسخ السياق ونص الرسالة في الخيط المستدعي، والتنسيق الكامل والكتابة في خيط الكتابة
     """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.context = _log_context.get()
+        # دمج المعاملات الآن لأن الكائنات قد تتغير قبل وصول السجل لخيط الكتابة
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """سجل JSON واحد في كل سطر مع حقول السياق والحقول الإضافية (extra)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'context', None) or {})
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """التنسيق النصي المعتاد مع حقول السياق في نهاية السطر"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        context = getattr(record, 'context', None)
+        if context:
+            text += ' [' + ' '.join(f"{key}={value}" for key, value in context.items()) + ']'
+        return text
+
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_listener: Optional[QueueListener] = None
+
+def _start_listener() -> None:
+    """تشغيل خيط الكتابة مرة واحدة لجميع الـ Loggers"""
+    global _listener
+    if _listener is not None:
+        return
+
     # إنشاء مجلد اللوجات إذا لم يكن موجوداً
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
-    
-    # إنشاء كائن Logger
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    
-    # إعداد Formatter
-    formatter = logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
-    
-    # Handler للكتابة في ملف مع تدوير الملفات
+
+    # Handler للكتابة في ملف مع تدوير الملفات (سطر JSON لكل سجل)
     log_file = log_dir / f"{datetime.now().strftime('%Y-%m-%d')}.log"
     file_handler = RotatingFileHandler(
         log_file,
@@ -41,19 +114,46 @@ def setup_logger(name: Optional[str] = None) -> logging.Logger:
         backupCount=BACKUP_COUNT,
         encoding='utf-8'
     )
-    file_handler.setFormatter(formatter)
-    
+    file_handler.setFormatter(JsonFormatter())
+
     # Handler للعرض في الكونسول
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    
-    # إضافة الـ Handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+    console_handler.setFormatter(JsonFormatter() if LOG_JSON_CONSOLE else TextFormatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+
+    _listener = QueueListener(_log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging() -> None:
+    """كتابة السجلات المتبقية في الطابور وإيقاف خيط الكتابة"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logger(name: Optional[str] = None) -> logging.Logger:
+    """
+    إنشاء وتكوين كائن Logger يكتب عبر الطابور المشترك
+
+    Args:
+        name (str, optional): اسم الـ Logger. Defaults to None.
+
+    Returns:
+        logging.Logger: كائن الـ Logger المكون
+    """
+    _start_listener()
+
+    # إنشاء كائن Logger
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+
+    # إضافة Handler الطابور مرة واحدة حتى عند تكرار الاستدعاء
+    if not any(isinstance(handler, ContextQueueHandler) for handler in logger.handlers):
+        logger.addHandler(ContextQueueHandler(_log_queue))
+
     # منع إرسال اللوجات إلى الـ Handlers الأصلية
     logger.propagate = False
-    
+
     return logger
 
 # إنشاء الـ Logger الرئيسي
@@ -74,7 +174,7 @@ def log_system_info() -> None:
 def log_error(error: Exception, context: Optional[Dict[str, Any]] = None) -> None:
     """
     تسجيل الأخطاء مع معلومات السياق
-    
+
     Args:
         error (Exception): كائن الخطأ
         context (dict, optional): معلومات إضافية. Defaults to None.
@@ -101,18 +201,25 @@ __all__ = [
     'log_system_info',
     'log_error',
     'log_database_operation',
-    'setup_logger'
+    'setup_logger',
+    'log_context',
+    'bind_log_context',
+    'get_log_context',
+    'stop_logging'
 ]
 
 # مثال للاستخدام
 if __name__ == "__main__":
     logger.info("This is an info message")
     logger.warning("This is a warning message")
-    
+
+    with log_context(request_id="demo", user_id=1):
+        logger.info("Download finished in %.1fs", 1.5, extra={'duration_ms': 1500})
+
     try:
         1 / 0
     except Exception as e:
         log_error(e, {"additional": "info"})
-    
+
     log_system_info()
-    log_database_operation("INSERT", {"table": "users", "count": 5})
\ No newline at end of file
+    log_database_operation("INSERT", {"table": "users", "count": 5})
@@ -0,0 +1,348 @@
+import math
+import time
+import bisect
+import inspect
+import threading
+import functools
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from utils.logger import logger, get_log_context
+
+# حدود الأزمنة بالثواني (من معالجة تحديث سريع حتى ترميز فيديو طويل)
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """
+    أساس المقاييس المُجمّعة: كل خيط يكتب في نسخته الخاصة (shard) من القيم
+    فلا تحتاج الزيادة إلى قفل، وتُجمع النسخ عند القراءة فقط (/metrics)
+    القفل يُستخدم مرة واحدة لكل خيط عند إنشاء نسخته
+    """
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple, list]] = []
+        self._lock = threading.Lock()
+
+    def _new_cell(self) -> list:
+        return [0]
+
+    def _cell(self, labels: Tuple) -> list:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        cell = shard.get(labels)
+        if cell is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f"{self.name} يتطلب القيم {self.labelnames}")
+            cell = shard[labels] = self._new_cell()
+        return cell
+
+    def _merged(self) -> Dict[Tuple, list]:
+        """دمج نسخ الخيوط (نسخ القاموس ذرّي فلا يتعارض مع الكتابة الجارية)"""
+        with self._lock:
+            shards = list(self._shards)
+        merged: Dict[Tuple, list] = {}
+        for shard in shards:
+            for labels, cell in shard.copy().items():
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(cell)
+                else:
+                    for i, value in enumerate(cell):
+                        total[i] += value
+        return merged
+
+    def collect(self) -> Iterable[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """عداد تراكمي (عدد الطلبات، البايتات المحملة...)"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, *labels: Any) -> None:
+        self._cell(labels)[0] += amount
+
+    def value(self, *labels: Any) -> float:
+        return self._merged().get(labels, [0])[0]
+
+    def collect(self) -> Iterable[str]:
+        for labels, (value,) in sorted(self._merged().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Gauge(Counter):
+    """قيمة حالية تزيد وتنقص (مثل عمليات ffmpeg الجارية)"""
+
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, *labels: Any) -> None:
+        self._cell(labels)[0] -= amount
+
+    def track(self, *labels: Any) -> "_GaugeTracker":
+        """زيادة القيمة طوال مدة الكتلة (with أو async with)"""
+        return _GaugeTracker(self, labels)
+
+class _GaugeTracker:
+    __slots__ = ('gauge', 'labels')
+
+    def __init__(self, gauge: Gauge, labels: Tuple):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self) -> None:
+        self.gauge.inc(1, *self.labels)
+
+    def __exit__(self, *exc) -> None:
+        self.gauge.dec(1, *self.labels)
+
+    async def __aenter__(self) -> None:
+        self.__enter__()
+
+    async def __aexit__(self, *exc) -> None:
+        self.__exit__()
+
+class Histogram(_Metric):
+    """توزيع الأزمنة أو الأحجام على حدود ثابتة (buckets)"""
+
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_cell(self) -> list:
+        # عدد كل حد (غير تراكمي) ثم +Inf ثم المجموع
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, *labels: Any) -> None:
+        cell = self._cell(labels)
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self, *labels: Any) -> "_Timer":
+        """قياس مدة الكتلة (with أو async with)"""
+        return _Timer(self, labels)
+
+    def collect(self) -> Iterable[str]:
+        bounds = self.buckets + (math.inf,)
+        for labels, cell in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, cell):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(cell[-1])}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+    async def __aenter__(self) -> "_Timer":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc) -> None:
+        self.__exit__()
+
+class _FunctionMetric:
+    """مقياس تُقرأ قيمه من حالة الخدمة عند الطلب فقط (أطوال الطوابير، مجموعة الاتصالات...)"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        func: Callable[[], Any],
+        kind: str
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self.kind = kind
+
+    def collect(self) -> Iterable[str]:
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items(), key=lambda item: str(item[0])):
+            if value is None:
+                continue
+            if not isinstance(labels, tuple):
+                labels = (labels,)
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class MetricsRegistry:
+    """سجل المقاييس وتصديرها بصيغة Prometheus النصية"""
+
+    def __init__(self, prefix: str = 'videohunter_'):
+        self.prefix = prefix
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"المقياس {metric.name} مسجل مسبقاً")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self.prefix + name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def function(
+        self,
+        name: str,
+        documentation: str,
+        func: Callable[[], Any],
+        labelnames: Sequence[str] = (),
+        kind: str = 'gauge'
+    ) -> None:
+        """
+        تسجيل مقياس محسوب عند الطلب
+        Args:
+            func: تعيد قيمة واحدة أو قاموس {قيم التصنيفات: القيمة}
+            kind: gauge أو counter
+        """
+        self._register(_FunctionMetric(self.prefix + name, documentation, labelnames, func, kind))
+
+    def render(self) -> str:
+        """كل المقاييس بصيغة Prometheus text 0.0.4"""
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            try:
+                samples = list(metric.collect())
+            except Exception as e:
+                logger.warning("تعذر قراءة المقياس %s: %s", metric.name, e)
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+def current_platform() -> str:
+    """المنصة من سياق السجلات الحالي (تُربط عند بدء التحميل أو مهمة التحميل)"""
+    return get_log_context().get('platform') or 'unknown'
+
+def timed(histogram: Histogram, stage: str) -> Callable:
+    """مزخرف يسجل مدة الدالة (متزامنة أو غير متزامنة) في مدرج المرحلة حسب المنصة الحالية"""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, stage, current_platform())
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, stage, current_platform())
+        return wrapper
+    return decorator
+
+# السجل المشترك
+metrics = MetricsRegistry()
+
+# مقاييس مسار البوت (حالة الطوابير والمجموعات تُسجل في الخدمات المالكة لها)
+WEBHOOK_SECONDS = metrics.histogram(
+    'webhook_duration_seconds',
+    'زمن معالجة تحديث تيليجرام الواحد',
+    ['outcome']
+)
+STAGE_SECONDS = metrics.histogram(
+    'stage_duration_seconds',
+    'زمن مراحل المعالجة (extract, download, transcode, upload) حسب المنصة',
+    ['stage', 'platform']
+)
+TRANSFER_BYTES = metrics.counter(
+    'transfer_bytes_total',
+    'البايتات المحملة من المنصات والمرفوعة إلى تيليجرام',
+    ['direction', 'platform']
+)
+FFMPEG_IN_FLIGHT = metrics.gauge(
+    'ffmpeg_processes_in_flight',
+    'عمليات ffmpeg الجارية'
+)
+CACHE_REQUESTS = metrics.counter(
+    'cache_requests_total',
+    'طلبات الذاكرات المؤقتة حسب النتيجة (hit أو miss)',
+    ['cache', 'result']
+)
+
+__all__ = [
+    'metrics',
+    'MetricsRegistry',
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'timed',
+    'current_platform',
+    'WEBHOOK_SECONDS',
+    'STAGE_SECONDS',
+    'TRANSFER_BYTES',
+    'FFMPEG_IN_FLIGHT',
+    'CACHE_REQUESTS'
+]
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import queue
+import atexit
+import inspect
+import secrets
+import threading
+import functools
+import contextvars
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import config
+from utils.logger import logger
+
+# الـ span الحالي (ينتقل تلقائياً إلى مهام asyncio و asyncio.to_thread)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """
+    عملية واحدة ضمن تتبع الطلب
+    الـ span الذي يُنشأ بـ summarize=True يجمع أزمنة كل ما تحته حسب الاسم
+    (مثل ملخص مهمة التحميل: الاستخراج، التحميل، الترميز، الرفع)
+    """
+
+    __slots__ = (
+        'name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start_ns', 'end_ns',
+        'error', 'collector', '_outer', '_totals', '_lock', '_token'
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any], summarize: bool):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        # أقرب span يجمع الأزمنة، والـ span الجامع نفسه يُحسب ضمن الجامع الأعلى منه
+        self._outer = parent.collector if parent else None
+        self.collector = self if summarize else self._outer
+        self._totals: Optional[Dict[str, List[float]]] = {} if summarize else None
+        self._lock = threading.Lock() if summarize else None
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes: Any) -> None:
+        """إضافة خصائص للـ span (مثل حجم الملف بعد معرفته)"""
+        self.attributes.update(attributes)
+
+    def _add_child(self, span: "Span") -> None:
+        with self._lock:
+            entry = self._totals.setdefault(span.name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += span.duration_ms
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        ملخص الأزمنة لكل نوع عملية تحت هذا الـ span
+        Returns:
+            {'trace_id', 'total_ms', 'spans': {name: {'count', 'ms'}}}
+        """
+        end_ns = self.end_ns or time.time_ns()
+        with self._lock:
+            spans = {name: {'count': count, 'ms': round(ms, 1)} for name, (count, ms) in self._totals.items()}
+        return {
+            'trace_id': self.trace_id,
+            'total_ms': round((end_ns - self.start_ns) / 1e6, 1),
+            'spans': spans
+        }
+
+    # ---- مدير السياق (متزامن وغير متزامن) ----
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.time_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # أُغلق في سياق غير الذي فُتح فيه (مثل مولد غير متزامن)
+            pass
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.error = f"{exc_type.__name__}: {exc}"
+        target = self._outer if self.collector is self else self.collector
+        if target is not None:
+            target._add_child(self)
+        tracer.export(self)
+
+    async def __aenter__(self) -> "Span":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.__exit__(exc_type, exc, tb)
+
+class _NoopSpan:
+    """بديل بدون تكلفة عند تعطيل التتبع"""
+    trace_id = None
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def summary(self) -> Dict[str, Any]:
+        return {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+_NOOP = _NoopSpan()
+
+class JsonFileExporter:
+    """كتابة الـ spans كسطر JSON لكل span"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps({
+                    'trace_id': span.trace_id,
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'start_ns': span.start_ns,
+                    'duration_ms': round(span.duration_ms, 3),
+                    'attributes': span.attributes,
+                    'error': span.error
+                }, ensure_ascii=False, default=str) + '\n')
+
+class OtlpHttpExporter:
+    """إرسال الـ spans إلى مجمّع OTLP عبر HTTP/JSON (مثل OpenTelemetry Collector أو Jaeger)"""
+
+    def __init__(self, endpoint: str, service_name: str = 'video-hunter', timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    @staticmethod
+    def _value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {'boolValue': value}
+        if isinstance(value, int):
+            return {'intValue': str(value)}
+        if isinstance(value, float):
+            return {'doubleValue': value}
+        return {'stringValue': str(value)}
+
+    def _encode(self, span: Span) -> Dict[str, Any]:
+        encoded = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 1,
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(span.end_ns),
+            'attributes': [
+                {'key': key, 'value': self._value(value)}
+                for key, value in span.attributes.items() if value is not None
+            ],
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}
+        }
+        if span.parent_id:
+            encoded['parentSpanId'] = span.parent_id
+        return encoded
+
+    def export(self, spans: List[Span]) -> None:
+        body = json.dumps({
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+                'scopeSpans': [{'scope': {'name': self.service_name}, 'spans': [self._encode(s) for s in spans]}]
+            }]
+        }).encode()
+        request = urllib.request.Request(
+            self.endpoint,
+            data=body,
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+class Tracer:
+    """
+    إنشاء الـ spans وتصديرها على دفعات من خيط منفصل
+    حتى لا تنتظر حلقة الأحداث الكتابة على القرص أو الشبكة
+    (بدون مصدّر تبقى الـ spans لملخصات المهام فقط)
+    """
+
+    def __init__(self, exporter=None, enabled: bool = True, batch_size: int = 256, flush_interval: float = 2.0):
+        self.exporter = exporter
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def span(self, name: str, summarize: bool = False, **attributes: Any):
+        """
+        span جديد تحت الـ span الحالي (أو بداية تتبع جديد)
+        يُستخدم مع with أو async with، ويعيد بديلاً فارغاً عند تعطيل التتبع
+        """
+        if not self.enabled:
+            return _NOOP
+        return Span(name, _current_span.get(), attributes, summarize)
+
+    def current(self) -> Optional[Span]:
+        """الـ span الجاري في السياق الحالي"""
+        return _current_span.get()
+
+    def export(self, span: Span) -> None:
+        if self.exporter is None:
+            return
+        if self._thread is None:
+            self._start()
+        self._queue.put(span)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name='trace-exporter', daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _worker(self) -> None:
+        batch: List[Span] = []
+        running = True
+        while running:
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    logger.warning("تعذر تصدير %s spans: %s", len(batch), e)
+                batch = []
+
+    def shutdown(self) -> None:
+        """تصدير الـ spans المتبقية وإيقاف خيط التصدير"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=10)
+
+def traced(name: Optional[str] = None, **attributes: Any) -> Callable:
+    """مزخرف يلف الدالة (متزامنة أو غير متزامنة) في span باسمها"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _create_exporter():
+    """المصدّر حسب الإعدادات (none / file / otlp)"""
+    if config.TRACING_EXPORTER == 'none':
+        return None
+    if config.TRACING_EXPORTER == 'otlp':
+        return OtlpHttpExporter(config.TRACING_OTLP_ENDPOINT, config.TRACING_SERVICE_NAME)
+    return JsonFileExporter(os.path.join('logs', config.TRACING_FILE))
+
+# المتتبع المشترك
+tracer = Tracer(_create_exporter(), enabled=config.TRACING_ENABLED)
@@ -22,7 +22,7 @@ class Validator:
                 for pattern in config.SUPPORTED_PATTERNS
             )
         except Exception as e:
-            logger.error(f"URL validation error: {e}")
+            logger.error("URL validation error: %s", e)
             return False
 
     @staticmethod
@@ -34,7 +34,7 @@ class Validator:
     @staticmethod
     def validate_file_size(size: Union[int, float]) -> bool:
         """التحقق من صحة حجم الملف"""
-        return 1 <= size <= config.MAX_FILE_SIZE_MB
+        return 1 <= size <= config.EFFECTIVE_MAX_FILE_SIZE_MB
 
     @staticmethod
     def validate_user_input(text: str, max_length: int = 200) -> bool:
@@ -105,4 +105,4 @@ if __name__ == "__main__":
     
     # اختبار التحقق من حجم الملف
     print(v.validate_file_size(25))  # True (إذا كان MAX_FILE_SIZE=50)
-    print(v.validate_file_size(100))  # False
\ No newline at end of file
+    print(v.validate_file_size(100))  # False (True مع خادم Bot API محلي)
\ No newline at end of file
@@ -1,11 +1,15 @@
+import time
+import uuid
 import logging
 from typing import Optional, Dict, Any
+from urllib.parse import urlparse
 from fastapi import Request, HTTPException
 from telegram import Update
 from telegram.ext import Application
 from config import config
-from utils.logger import logger
-from utils.helpers import validate_url
+from utils.logger import logger, log_context
+from utils.tracing import tracer
+from utils.metrics import WEBHOOK_SECONDS
 
 class TelegramWebhookManager:
     """مدير متكامل لمعالجة وتكوين واجهة ويب هوك التليجرام"""
@@ -16,8 +20,9 @@ class TelegramWebhookManager:
         self.webhook_url = config.WEBHOOK_URL
         self.secret_token = config.API_SECRET_KEY
         
-        # التحقق من صحة إعدادات الويب هوك
-        if not validate_url(self.webhook_url):
+        # التحقق من صحة إعدادات الويب هوك (تيليجرام يقبل https فقط، والتطوير المحلي لا يسجل الويب هوك)
+        parsed = urlparse(self.webhook_url)
+        if config.ENV == "prod" and (parsed.scheme != 'https' or not parsed.netloc):
             logger.critical("عنوان الويب هوك غير صالح!")
             raise ValueError("Invalid webhook URL configuration")
 
@@ -37,7 +42,7 @@ class TelegramWebhookManager:
             )
             
             if result:
-                logger.info(f"تم تفعيل الويب هوك بنجاح على: {self.webhook_url}")
+                logger.info("تم تفعيل الويب هوك بنجاح على: %s", self.webhook_url)
                 await self._verify_webhook()
                 return True
                 
@@ -45,7 +50,7 @@ class TelegramWebhookManager:
             return False
             
         except Exception as e:
-            logger.error(f"فشل إعداد الويب هوك: {str(e)}")
+            logger.error("فشل إعداد الويب هوك: %s", e)
             raise HTTPException(500, "Internal server error during webhook setup")
 
     async def process_webhook(self, request: Request) -> Dict[str, Any]:
@@ -54,14 +59,28 @@ class TelegramWebhookManager:
         if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != self.secret_token:
             raise HTTPException(403, "Forbidden: Invalid secret token")
         
+        received = time.perf_counter()
         try:
             data = await request.json()
             update = Update.de_json(data, self.bot)
-            await self.application.process_update(update)
+            user = update.effective_user
+            # بداية تتبع الطلب، وكل سجلات معالجة التحديث تحمل معرف التتبع والمستخدم
+            with tracer.span('telegram.update', update_id=update.update_id) as span:
+                request_id = span.trace_id or uuid.uuid4().hex
+                with log_context(request_id=request_id, update_id=update.update_id, user_id=user.id if user else None):
+                    started = time.monotonic()
+                    await self.application.process_update(update)
+                    logger.debug(
+                        "تمت معالجة التحديث %s",
+                        update.update_id,
+                        extra={'duration_ms': round((time.monotonic() - started) * 1000)}
+                    )
+            WEBHOOK_SECONDS.observe(time.perf_counter() - received, 'success')
             return {"status": "success", "processed_update_id": update.update_id}
             
         except Exception as e:
-            logger.error(f"Webhook processing error: {str(e)}")
+            WEBHOOK_SECONDS.observe(time.perf_counter() - received, 'error')
+            logger.error("Webhook processing error: %s", e)
             raise HTTPException(400, "Invalid update data") from e
 
     async def delete_webhook(self) -> bool:
@@ -73,7 +92,7 @@ class TelegramWebhookManager:
                 return True
             return False
         except Exception as e:
-            logger.error(f"فشل في حذف الويب هوك: {str(e)}")
+            logger.error("فشل في حذف الويب هوك: %s", e)
             return False
 
     async def _verify_webhook(self) -> None:
@@ -83,7 +102,7 @@ class TelegramWebhookManager:
             logger.error("معلومات الويب هوك غير متطابقة!")
             raise ConnectionError("Webhook verification failed")
             
-        logger.debug(f"معلومات الويب هوك: {webhook_info.to_dict()}")
+        logger.debug("معلومات الويب هوك: %s", webhook_info.to_dict())
 
     async def health_check(self) -> Dict[str, Any]:
         """فحص صحة إعدادات الويب هوك"""
@@ -97,7 +116,7 @@ class TelegramWebhookManager:
                 "certificate_expiration": webhook_info.ip_address
             }
         except Exception as e:
-            logger.error(f"Health check failed: {str(e)}")
+            logger.error("Health check failed: %s", e)
             return {"status": "error", "details": str(e)}
 
 # -----------------------------------------------------------
@@ -123,7 +142,7 @@ if __name__ == "__main__":
     from telegram.ext import Application
     
     async def test_webhook():
-        test_app = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+        test_app = Application.builder().token(config.TELEGRAM_TOKEN).build()
         manager = TelegramWebhookManager(test_app)
         
         try: